@@ -0,0 +1,14 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Python implementations of the clickstream analytics, used to validate the flink results and to run
+# aggregations where a flink application is not worth it, and the tools working on the data bucket:
+#   streaming_aggregator - windowed rollups of the flink notebook over newline delimited events
+#   compaction - rewrites the small firehose objects of a partition into a few large files
+#   batch_analytics - daily unique clients, sessions and top pages of the firehose output with mergeable sketches
+#   sketches - HyperLogLog and Count-Min sketches used by batch_analytics
+#   replay - replays archived events of the bucket into the stream at a share of the shard limits
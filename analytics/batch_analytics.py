@@ -0,0 +1,216 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Daily report of the firehose output without athena: unique clients and sessions per day, unique clients
+# per page_location and the top pages by page views. The objects are streamed record by record (gzip,
+# newline delimited or concatenated JSON of raw/, or the parquet, zstd-json and gzip-json files of compacted/,
+# see analytics/compaction.py) by a pool of worker processes and
+# every worker keeps fixed size sketches (analytics/sketches.py), so the memory depends on the sketch
+# settings and the number of pages, not on the number of events.
+#
+#   python -m analytics.batch_analytics s3://bucket --prefix raw/dt=2023-12-07/ --workers 8 --save 2023-12-07.json
+#   python -m analytics.batch_analytics ./bucket-copy --prefix compacted/
+#   python -m analytics.batch_analytics --merge 2023-12-06.json 2023-12-07.json --top 20
+#
+# --save keeps the sketches, --merge combines saved sketches into the report of all their events, e.g. the
+# unique clients of a week from the daily sketches.
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from analytics.compaction import iter_records, storage_for
+from analytics.sketches import CountMinSketch, HyperLogLog
+from analytics.streaming_aggregator import DEFAULT_TIME_FIELD, OVERFLOW_KEY, field_value
+
+# distinct count error of 1.6 % with 4 KB per day and per page
+DEFAULT_PRECISION = 12
+DEFAULT_MAX_PAGES = 10000
+DEFAULT_WIDTH = 2048
+DEFAULT_DEPTH = 4
+DEFAULT_TOP = 10
+# a worker gets about this many objects at a time, so the busy ones don't hold up the pool
+TASKS_PER_WORKER = 4
+
+
+def event_day(event, time_field=DEFAULT_TIME_FIELD):
+    try:
+        time_ms = int(field_value(event, time_field))
+    except (TypeError, ValueError):
+        return "unknown"
+    return datetime.fromtimestamp(time_ms / 1000, timezone.utc).strftime("%Y-%m-%d")
+
+
+class BatchReport:
+
+    def __init__(self, precision=DEFAULT_PRECISION, width=DEFAULT_WIDTH, depth=DEFAULT_DEPTH,
+                 max_pages=DEFAULT_MAX_PAGES, time_field=DEFAULT_TIME_FIELD):
+        self.precision = precision
+        self.max_pages = max_pages
+        self.time_field = time_field
+        self.events = 0
+        self.invalid = 0
+        self.daily_clients = {}
+        self.daily_sessions = {}
+        self.page_clients = {}
+        self.page_views = CountMinSketch(width, depth)
+
+    def _sketch(self, sketches, key):
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog(self.precision)
+        return sketch
+
+    def add(self, event):
+        self.events += 1
+        if not isinstance(event, dict) or not event.get("client_id"):
+            self.invalid += 1
+            return
+        client_id = event["client_id"]
+        day = event_day(event, self.time_field)
+        self._sketch(self.daily_clients, day).add(client_id)
+        if event.get("ga_session_id"):
+            self._sketch(self.daily_sessions, day).add(f"{client_id}|{event['ga_session_id']}")
+
+        page = event.get("page_location")
+        if page:
+            if page not in self.page_clients and len(self.page_clients) >= self.max_pages:
+                # the memory stays bounded on sites with an unbounded number of urls
+                page = OVERFLOW_KEY
+            self._sketch(self.page_clients, page).add(client_id)
+            if event.get("event_name") == "page_view":
+                self.page_views.add(page)
+
+    def merge(self, other):
+        self.events += other.events
+        self.invalid += other.invalid
+        for sketches, other_sketches in ((self.daily_clients, other.daily_clients),
+                                         (self.daily_sessions, other.daily_sessions)):
+            for key, sketch in other_sketches.items():
+                self._sketch(sketches, key).merge(sketch)
+        for page, sketch in other.page_clients.items():
+            if page not in self.page_clients and len(self.page_clients) >= self.max_pages:
+                page = OVERFLOW_KEY
+            self._sketch(self.page_clients, page).merge(sketch)
+        self.page_views.merge(other.page_views)
+        return self
+
+    def result(self, top=DEFAULT_TOP):
+        page_clients = sorted(((page, sketch.count()) for page, sketch in self.page_clients.items()),
+                              key=lambda item: (-item[1], item[0]))
+        return {
+            "events": self.events,
+            "invalid": self.invalid,
+            "daily_unique_clients": {day: sketch.count() for day, sketch in sorted(self.daily_clients.items())},
+            "daily_sessions": {day: sketch.count() for day, sketch in sorted(self.daily_sessions.items())},
+            "page_unique_clients": dict(page_clients[:top]),
+            "top_pages": [{"page_location": page, "page_views": count}
+                          for page, count in self.page_views.most_common(top)],
+        }
+
+    def to_dict(self):
+        return {
+            "precision": self.precision,
+            "max_pages": self.max_pages,
+            "time_field": self.time_field,
+            "events": self.events,
+            "invalid": self.invalid,
+            "daily_clients": {day: sketch.to_dict() for day, sketch in self.daily_clients.items()},
+            "daily_sessions": {day: sketch.to_dict() for day, sketch in self.daily_sessions.items()},
+            "page_clients": {page: sketch.to_dict() for page, sketch in self.page_clients.items()},
+            "page_views": self.page_views.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        report = cls(data["precision"], max_pages=data["max_pages"], time_field=data["time_field"])
+        report.events = data["events"]
+        report.invalid = data["invalid"]
+        report.daily_clients = {day: HyperLogLog.from_dict(sketch) for day, sketch in data["daily_clients"].items()}
+        report.daily_sessions = {day: HyperLogLog.from_dict(sketch) for day, sketch in data["daily_sessions"].items()}
+        report.page_clients = {page: HyperLogLog.from_dict(sketch) for page, sketch in data["page_clients"].items()}
+        report.page_views = CountMinSketch.from_dict(data["page_views"])
+        return report
+
+
+def sketch_objects(storage, keys, **options):
+    """
+    Returns the report of the events of the objects keys
+    """
+    report = BatchReport(**options)
+    for key in keys:
+        with storage.open(key) as fileobj:
+            for event in iter_records(fileobj):
+                report.add(event)
+    return report
+
+
+def split_objects(objects, tasks):
+    """
+    Splits the (key, size) objects into tasks lists of about the same total size, the largest first
+    """
+    groups = [[] for _ in range(max(1, min(tasks, len(objects))))]
+    sizes = [0] * len(groups)
+    for key, size in sorted(objects, key=lambda item: -item[1]):
+        smallest = sizes.index(min(sizes))
+        groups[smallest].append(key)
+        sizes[smallest] += size
+    return [group for group in groups if group]
+
+
+def run(storage, prefix="", workers=1, **options):
+    """
+    Sketches the objects under prefix with workers processes and returns the merged report
+    """
+    objects = [(key, size) for key, size, _ in storage.list(prefix)
+               if not os.path.basename(key).startswith("_")]
+    report = BatchReport(**options)
+    if workers <= 1:
+        return report.merge(sketch_objects(storage, [key for key, _ in objects], **options))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(sketch_objects, storage, keys, **options)
+                   for keys in split_objects(objects, workers * TASKS_PER_WORKER)]
+        for future in futures:
+            report.merge(future.result())
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Approximate daily clickstream report of the firehose output")
+    parser.add_argument("location", nargs="?", help="s3://bucket, or a directory standing in for the bucket")
+    parser.add_argument("--prefix", default="raw/", help="prefix of the objects, e.g. raw/dt=2023-12-07/")
+    parser.add_argument("--merge", nargs="+", default=[], help="saved sketches to merge into the report")
+    parser.add_argument("--save", help="file the sketches are saved to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION)
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES)
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP)
+    args = parser.parse_args(argv)
+    if not args.location and not args.merge:
+        parser.error("a location or sketches to --merge are needed")
+
+    report = None
+    for path in args.merge:
+        with open(path) as saved:
+            saved_report = BatchReport.from_dict(json.load(saved))
+        report = saved_report if report is None else report.merge(saved_report)
+    if args.location:
+        sketched = run(storage_for(args.location), args.prefix, args.workers,
+                       precision=args.precision, max_pages=args.max_pages)
+        report = sketched if report is None else report.merge(sketched)
+
+    if args.save:
+        with open(args.save, "w") as saved:
+            json.dump(report.to_dict(), saved)
+    json.dump(report.result(args.top), sys.stdout, indent=1)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Small file compaction of the firehose output. Firehose writes one object per buffer flush, so a busy hour
+# of raw/dt=YYYY-MM-DD/hr=HH/ holds hundreds of small gzip objects of concatenated or newline delimited JSON.
+# The job streams the objects of a partition and rewrites them into a few large files under compacted/:
+#   parquet   - string columns of the top level fields, nested fields as JSON strings (needs pyarrow)
+#   zstd-json - newline delimited JSON compressed with zstd (needs zstandard)
+#   gzip-json - newline delimited JSON compressed with gzip, no extra dependency
+#
+#   python -m analytics.compaction s3://bucket --format parquet --workers 4
+#   python -m analytics.compaction ./bucket-copy --format gzip-json --partition raw/dt=2023-12-07/hr=07/
+#
+# A directory stands in for the bucket when the location isn't an s3:// url. Partitions are compacted in
+# parallel by a process pool. Every compacted partition gets a _COMPACTED.json manifest with the source
+# objects it was made of, a partition is skipped while its sources don't change, so the job can be rerun
+# or resumed after a failure. Late objects make the partition be compacted again into the same file names.
+# Once the sources are deleted (--delete-source) the compacted files are their only copy: late objects are
+# then compacted into new part numbers appended to the manifest, and deleted as well.
+import argparse
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+FORMATS = ("parquet", "zstd-json", "gzip-json")
+EXTENSIONS = {"parquet": "parquet", "zstd-json": "json.zst", "gzip-json": "json.gz"}
+MANIFEST_NAME = "_COMPACTED.json"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PARQUET_MAGIC = b"PAR1"
+
+DEFAULT_SOURCE_PREFIX = "raw/"
+DEFAULT_DESTINATION_PREFIX = "compacted/"
+# sizes of the uncompressed JSON records, the compressed files are several times smaller
+DEFAULT_TARGET_FILE_MB = 512
+DEFAULT_ROW_GROUP_MB = 128
+# firehose may still be writing to partitions with objects younger than this
+DEFAULT_SETTLE_MINUTES = 15
+READ_CHUNK_SIZE = 1024 * 1024
+MB = 1024 * 1024
+
+
+class LocalStorage:
+    """
+    Directory standing in for the bucket, keys are the paths relative to root with / separators
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def list(self, prefix):
+        """
+        Returns (key, size, last modified epoch seconds) of the objects under prefix ordered by key
+        """
+        objects = []
+        for directory, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix) and not file_name.startswith(".tmp-"):
+                    stat = os.stat(path)
+                    objects.append((key, stat.st_size, stat.st_mtime))
+        return sorted(objects)
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def open(self, key):
+        return open(self._path(key), "rb")
+
+    def read_text(self, key):
+        with open(self._path(key)) as text_file:
+            return text_file.read()
+
+    def upload(self, path, key):
+        # copied next to the destination and renamed, so a key either doesn't exist or is complete
+        destination = self._path(key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        temporary = os.path.join(os.path.dirname(destination), f".tmp-{os.path.basename(destination)}")
+        shutil.copyfile(path, temporary)
+        os.replace(temporary, destination)
+
+    def write_text(self, key, text):
+        with tempfile.NamedTemporaryFile("w", delete=False) as text_file:
+            text_file.write(text)
+        try:
+            self.upload(text_file.name, key)
+        finally:
+            os.remove(text_file.name)
+
+    def delete(self, keys):
+        for key in keys:
+            if self.exists(key):
+                os.remove(self._path(key))
+
+
+class S3Storage:
+    """
+    Objects of an S3 bucket, boto3 is imported when the first request is made
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3")
+        return self._client
+
+    def __getstate__(self):
+        # the storage is sent to the pool processes, each creates its own client
+        return {"bucket": self.bucket, "_client": None}
+
+    def list(self, prefix):
+        objects = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                objects.append((item["Key"], item["Size"], item["LastModified"].timestamp()))
+        return sorted(objects)
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def read_text(self, key):
+        return self.open(key).read().decode("utf-8")
+
+    def upload(self, path, key):
+        self.client.upload_file(path, self.bucket, key)
+
+    def write_text(self, key, text):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=text.encode("utf-8"))
+
+    def delete(self, keys):
+        keys = list(keys)
+        # delete_objects takes up to 1000 keys
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True})
+
+
+def storage_for(location):
+    if location.startswith("s3://"):
+        return S3Storage(location[len("s3://"):].strip("/"))
+    return LocalStorage(location)
+
+
+class _RawReader(io.RawIOBase):
+    # read only file for the bodies of get_object, which can't peek
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _decompressed(stream):
+    # firehose doesn't add a .gz suffix to the keys, the compression is detected from the first bytes
+    magic = stream.peek(4)[:4]
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    if magic == ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raise SystemExit("zstd-json files need the zstandard package: pip install zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    return stream
+
+
+def _parquet_value(value):
+    # ParquetFileWriter stores nested values as JSON strings
+    if isinstance(value, str) and value[:1] in ("{", "["):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _parquet_records(stream):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("parquet files need the pyarrow package: pip install pyarrow")
+    # the footer is read first, the bodies of get_object can't seek to it
+    with tempfile.TemporaryFile() as seekable:
+        shutil.copyfileobj(stream, seekable, READ_CHUNK_SIZE)
+        for batch in pyarrow.parquet.ParquetFile(seekable).iter_batches():
+            for row in batch.to_pylist():
+                yield {name: _parquet_value(value) for name, value in row.items() if value is not None}
+
+
+def iter_records(fileobj):
+    """
+    Yields the JSON objects of a firehose object, newline delimited or concatenated without delimiter, or the
+    records of a compacted file. The columns of parquet files are strings, the fields a record didn't have
+    are left out.
+    """
+    stream = fileobj if hasattr(fileobj, "peek") else io.BufferedReader(_RawReader(fileobj))
+    if stream.peek(4)[:4] == PARQUET_MAGIC:
+        yield from _parquet_records(stream)
+        return
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(_decompressed(stream), encoding="utf-8")
+    buffer = ""
+    eof = False
+    while True:
+        position = 0
+        while True:
+            # skip the delimiters between the objects
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # the object continues in the next chunk
+                break
+            yield record
+            position = end
+        buffer = buffer[position:]
+        if eof:
+            return
+        chunk = reader.read(READ_CHUNK_SIZE)
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+
+def _json_line(record):
+    return (json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class JsonFileWriter:
+    """
+    Newline delimited JSON file compressed with gzip or zstd
+    """
+
+    def __init__(self, path, file_format, compression_level=None):
+        self.path = path
+        self._file = open(path, "wb")
+        if file_format == "zstd-json":
+            try:
+                import zstandard
+            except ImportError:
+                raise SystemExit("zstd-json needs the zstandard package: pip install zstandard")
+            self._stream = zstandard.ZstdCompressor(level=compression_level or 3).stream_writer(self._file)
+        else:
+            self._stream = gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=compression_level or 6)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self._stream.write(row)
+
+    def close(self):
+        self._stream.close()
+        if not self._file.closed:
+            self._file.close()
+
+
+class ParquetFileWriter:
+    """
+    Parquet file with one row group per write_rows call. The GA events are free form, so the top level fields
+    become nullable string columns and nested values JSON strings, the schema is the one of the first row group.
+    """
+
+    def __init__(self, path, compression="zstd"):
+        try:
+            import pyarrow  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise SystemExit("parquet needs the pyarrow package: pip install pyarrow")
+        self.path = path
+        self.compression = compression
+        self.schema = None
+        self._writer = None
+
+    @staticmethod
+    def _column_value(value):
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+    def accepts(self, fields):
+        return self.schema is None or set(fields) <= set(self.schema.names)
+
+    def write_rows(self, rows):
+        import pyarrow
+        import pyarrow.parquet
+
+        records = [json.loads(row) for row in rows]
+        if self.schema is None:
+            names = sorted({name for record in records for name in record})
+            self.schema = pyarrow.schema([(name, pyarrow.string()) for name in names])
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, compression=self.compression)
+        columns = {name: [self._column_value(record.get(name)) for record in records] for name in self.schema.names}
+        self._writer.write_table(pyarrow.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class PartitionWriter:
+    """
+    Writes the records of a partition into part-NNNNN files of about target_file_bytes, in row groups
+    of about row_group_bytes of uncompressed JSON
+    """
+
+    def __init__(self, directory, file_format, target_file_bytes, row_group_bytes, first_part=0):
+        self.directory = directory
+        self.file_format = file_format
+        self.first_part = first_part
+        self.target_file_bytes = target_file_bytes
+        self.row_group_bytes = min(row_group_bytes, target_file_bytes)
+        self.files = []
+        self.records = 0
+        self._writer = None
+        self._file_bytes = 0
+        self._rows = []
+        self._row_fields = set()
+        self._rows_bytes = 0
+
+    def _open(self):
+        path = os.path.join(self.directory, f"part-{self.first_part + len(self.files):05d}.{EXTENSIONS[self.file_format]}")
+        self.files.append(path)
+        self._file_bytes = 0
+        if self.file_format == "parquet":
+            return ParquetFileWriter(path)
+        return JsonFileWriter(path, self.file_format)
+
+    def _flush_rows(self):
+        if not self._rows:
+            return
+        if self._writer is not None and (self._file_bytes >= self.target_file_bytes or
+                (self.file_format == "parquet" and not self._writer.accepts(self._row_fields))):
+            # the file is full, or a new field showed up that the parquet schema doesn't have
+            self._writer.close()
+            self._writer = None
+        if self._writer is None:
+            self._writer = self._open()
+        self._writer.write_rows(self._rows)
+        self._file_bytes += self._rows_bytes
+        self._rows, self._row_fields, self._rows_bytes = [], set(), 0
+
+    def write(self, record):
+        row = _json_line(record)
+        self._rows.append(row)
+        self._rows_bytes += len(row)
+        if self.file_format == "parquet" and isinstance(record, dict):
+            self._row_fields.update(record)
+        self.records += 1
+        if self._rows_bytes >= self.row_group_bytes:
+            self._flush_rows()
+
+    def close(self):
+        self._flush_rows()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self.files
+
+
+def partition_of(key, granularity="hour"):
+    """
+    Returns the partition prefix of a key, its directory, without the hr= part for daily partitions
+    """
+    parts = key.split("/")[:-1]
+    if granularity == "day":
+        parts = [part for part in parts if not part.startswith("hr=")]
+    return "/".join(parts) + "/"
+
+
+def find_partitions(storage, source_prefix=DEFAULT_SOURCE_PREFIX, granularity="hour",
+                    settle_seconds=DEFAULT_SETTLE_MINUTES * 60, now=None):
+    """
+    Returns the partitions under source_prefix whose newest object is older than settle_seconds
+    """
+    now = time.time() if now is None else now
+    newest = {}
+    for key, _, modified in storage.list(source_prefix):
+        partition = partition_of(key, granularity)
+        newest[partition] = max(newest.get(partition, 0), modified)
+    return sorted(partition for partition, modified in newest.items() if now - modified >= settle_seconds)
+
+
+def destination_of(partition, source_prefix, destination_prefix):
+    return destination_prefix + partition[len(source_prefix):] if partition.startswith(source_prefix) \
+        else destination_prefix + partition
+
+
+def compact_partition(storage, partition, source_prefix=DEFAULT_SOURCE_PREFIX,
+                      destination_prefix=DEFAULT_DESTINATION_PREFIX, file_format="parquet",
+                      target_file_mb=DEFAULT_TARGET_FILE_MB, row_group_mb=DEFAULT_ROW_GROUP_MB,
+                      delete_source=False, force=False):
+    """
+    Compacts the objects of partition and returns a summary. The manifest is written after the files, so a
+    partition without a manifest that matches its sources is compacted again on the next run.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format '{file_format}', use one of {', '.join(FORMATS)}")
+    destination = destination_of(partition, source_prefix, destination_prefix)
+    manifest_key = destination + MANIFEST_NAME
+    # for daily partitions the objects of all its hours
+    sources = [(key, size) for key, size, _ in storage.list(partition)]
+    source_keys = [key for key, _ in sources]
+
+    previous = json.loads(storage.read_text(manifest_key)) if storage.exists(manifest_key) else None
+    # manifests written before sources_deleted was recorded: none of their sources is left
+    append = bool(previous) and previous.get("sources_deleted", not set(previous["sources"]) & set(source_keys))
+    if append:
+        # the earlier sources only exist in the compacted files, they can't be compacted again
+        if previous["format"] != file_format:
+            raise ValueError(f"{destination} holds {previous['format']} files of deleted sources, "
+                             f"compact it with --format {previous['format']}")
+        # sources of a run that stopped while deleting them are already in the compacted files
+        compacted = set(previous["sources"])
+        storage.delete(key for key in source_keys if key in compacted)
+        sources = [(key, size) for key, size in sources if key not in compacted]
+        source_keys = [key for key, _ in sources]
+        if not source_keys:
+            return {"partition": partition, "status": "skipped", "sources": len(previous["sources"]),
+                    "records": previous["records"], "files": previous["files"]}
+    elif previous and not force and previous["sources"] == source_keys and previous["format"] == file_format:
+        return {"partition": partition, "status": "skipped", "sources": len(source_keys),
+                "records": previous["records"], "files": previous["files"]}
+    if not source_keys:
+        return {"partition": partition, "status": "empty", "sources": 0, "records": 0, "files": []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        writer = PartitionWriter(directory, file_format, target_file_mb * MB, row_group_mb * MB,
+                                 first_part=len(previous["files"]) if append else 0)
+        for key in source_keys:
+            with storage.open(key) as fileobj:
+                for record in iter_records(fileobj):
+                    writer.write(record)
+        files = []
+        for path in writer.close():
+            key = destination + os.path.basename(path)
+            storage.upload(path, key)
+            files.append(key)
+
+    manifest = {"partition": partition, "format": file_format, "sources": source_keys,
+                "source_bytes": sum(size for _, size in sources), "records": writer.records, "files": files,
+                "sources_deleted": delete_source or append, "compacted_at": int(time.time())}
+    if append:
+        manifest.update(sources=previous["sources"] + source_keys, files=previous["files"] + files,
+                        source_bytes=previous["source_bytes"] + manifest["source_bytes"],
+                        records=previous["records"] + writer.records)
+    storage.write_text(manifest_key, json.dumps(manifest, indent=1))
+    # files of a previous compaction that the new one didn't overwrite
+    if previous and not append:
+        storage.delete(key for key in previous["files"] if key not in files)
+    if manifest["sources_deleted"]:
+        storage.delete(source_keys)
+    return {"partition": partition, "status": "compacted", "sources": len(manifest["sources"]),
+            "records": manifest["records"], "files": manifest["files"]}
+
+
+def _failed(partition, error):
+    return {"partition": partition, "status": "failed", "error": f"{type(error).__name__}: {error}"}
+
+
+def compact(storage, partitions, workers=1, **options):
+    """
+    Compacts partitions in a pool of workers processes and yields their summaries in order. A failed
+    partition doesn't stop the others, it is compacted again by the next run.
+    """
+    if workers <= 1:
+        for partition in partitions:
+            try:
+                yield compact_partition(storage, partition, **options)
+            except Exception as error:
+                yield _failed(partition, error)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(compact_partition, storage, partition, **options) for partition in partitions]
+        for partition, future in zip(partitions, futures):
+            try:
+                yield future.result()
+            except Exception as error:
+                yield _failed(partition, error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compacts the small firehose objects of the bucket into large files")
+    parser.add_argument("location", help="s3://bucket, or a directory standing in for the bucket")
+    parser.add_argument("--format", default="parquet", choices=FORMATS)
+    parser.add_argument("--granularity", default="hour", choices=("hour", "day"))
+    parser.add_argument("--source-prefix", default=DEFAULT_SOURCE_PREFIX)
+    parser.add_argument("--destination-prefix", default=DEFAULT_DESTINATION_PREFIX)
+    parser.add_argument("--partition", action="append", help="partition prefix to compact, all settled partitions if not set")
+    parser.add_argument("--settle-minutes", type=float, default=DEFAULT_SETTLE_MINUTES)
+    parser.add_argument("--target-file-mb", type=int, default=DEFAULT_TARGET_FILE_MB)
+    parser.add_argument("--row-group-mb", type=int, default=DEFAULT_ROW_GROUP_MB)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--delete-source", action="store_true", help="delete the source objects once compacted")
+    parser.add_argument("--force", action="store_true", help="compact partitions that are already compacted")
+    args = parser.parse_args(argv)
+
+    storage = storage_for(args.location)
+    partitions = args.partition or find_partitions(storage, args.source_prefix, args.granularity,
+                                                   settle_seconds=args.settle_minutes * 60)
+    failed = False
+    for summary in compact(storage, partitions, workers=args.workers,
+                           source_prefix=args.source_prefix, destination_prefix=args.destination_prefix,
+                           file_format=args.format, target_file_mb=args.target_file_mb,
+                           row_group_mb=args.row_group_mb, delete_source=args.delete_source, force=args.force):
+        print(json.dumps(summary), flush=True)
+        failed = failed or summary["status"] == "failed"
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Replays the events archived in the data bucket into the kinesis stream, e.g. after a consumer like the
+# flink application or a glue crawler missed them:
+#
+#   python -m analytics.replay s3://bucket --prefix raw/dt=2023-12-07/hr=07/ --stream gtagStream \
+#       --strategy session_id --shard-fraction 0.5 --checkpoint replay-2023-12-07-07.json
+#
+# The objects (gzip, newline delimited or concatenated JSON, see analytics/compaction.py) are streamed in key
+# order through generators: events -> records with the partition key of the configured strategy
+# (deployment/partition_key.py) -> PutRecords batches of at most 500 records and 5 MiB. Every shard gets
+# shard_fraction of its write limit (1000 records/s, 1 MiB/s) from a token bucket, so the live traffic keeps
+# the rest, and only the records a PutRecords call rejected are sent again, after taking their tokens from the
+# buckets as well. The position of the last delivered
+# batch is written to the checkpoint file, a rerun with the same file continues after it. Records of a batch
+# that was delivered just before the process stopped can be sent twice, consumers see them at least once.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from analytics.compaction import iter_records, storage_for
+from deployment.capacity_planner import SHARD_BYTES_PER_SECOND, SHARD_RECORDS_PER_SECOND
+from deployment.partition_key import DEFAULT_STRATEGY, STRATEGIES, partition_key
+from deployment.shard_simulator import shard_for_key
+
+# PutRecords limits
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+DEFAULT_SHARD_FRACTION = 0.5
+DEFAULT_MAX_RETRIES = 8
+# retries wait BASE * 2 ** attempt seconds with full jitter, at most MAX
+RETRY_BASE_SECONDS = 0.1
+RETRY_MAX_SECONDS = 5.0
+
+
+class ReplayError(Exception):
+    pass
+
+
+def read_events(storage, prefix, checkpoint=None):
+    """
+    Yields (key, index, event) of the objects under prefix in key order, after the checkpoint position
+    """
+    after_key = checkpoint["key"] if checkpoint else None
+    after_index = checkpoint["index"] if checkpoint else -1
+    for key, _, _ in storage.list(prefix):
+        if os.path.basename(key).startswith("_") or (after_key and key < after_key):
+            continue
+        with storage.open(key) as fileobj:
+            for index, event in enumerate(iter_records(fileobj)):
+                if key == after_key and index <= after_index:
+                    continue
+                yield key, index, event
+
+
+def to_records(events, strategy=DEFAULT_STRATEGY, salt=""):
+    """
+    Yields ((key, index), record) with the PutRecords record of every event
+    """
+    for key, index, event in events:
+        data = json.dumps(event, separators=(",", ":")).encode("utf-8")
+        yield (key, index), {"PartitionKey": partition_key(event, strategy, salt), "Data": data}
+
+
+def record_size(record):
+    # the partition key counts against the request and shard limits like the data
+    return len(record["Data"]) + len(record["PartitionKey"].encode("utf-8"))
+
+
+def batches(records, max_records=MAX_RECORDS_PER_REQUEST, max_bytes=MAX_BYTES_PER_REQUEST, limiter=None):
+    """
+    Yields lists of (position, record) that fit in one PutRecords call. With a limiter every record waits
+    for the tokens of its shard before it is added.
+    """
+    batch, size = [], 0
+    for position, record in records:
+        record_bytes = record_size(record)
+        if batch and (len(batch) == max_records or size + record_bytes > max_bytes):
+            yield batch
+            batch, size = [], 0
+        if limiter:
+            limiter.acquire(record["PartitionKey"], record_bytes)
+        batch.append((position, record))
+        size += record_bytes
+    if batch:
+        yield batch
+
+
+class ShardRateLimiter:
+    """
+    Token buckets of records and bytes per shard refilled at fraction of the shard write limits. Shards are
+    found from the MD5 of the partition key like on a stream with evenly split hash key ranges.
+    """
+
+    def __init__(self, shard_count, fraction=DEFAULT_SHARD_FRACTION, records_per_second=SHARD_RECORDS_PER_SECOND,
+                 bytes_per_second=SHARD_BYTES_PER_SECOND, clock=time.monotonic, sleep=time.sleep):
+        if not 0 < fraction <= 1:
+            raise ValueError("the shard fraction has to be above 0 and at most 1")
+        self.shard_count = shard_count
+        self.records_per_second = records_per_second * fraction
+        self.bytes_per_second = bytes_per_second * fraction
+        self.clock = clock
+        self.sleep = sleep
+        now = clock()
+        # [record tokens, byte tokens, updated] per shard, starting with one second of writes
+        self.buckets = [[self.records_per_second, self.bytes_per_second, now] for _ in range(shard_count)]
+        self.waited_seconds = 0.0
+
+    def acquire(self, partition_key, size):
+        bucket = self.buckets[shard_for_key(partition_key, self.shard_count)]
+        while True:
+            now = self.clock()
+            elapsed = max(0.0, now - bucket[2])
+            bucket[0] = min(self.records_per_second, bucket[0] + elapsed * self.records_per_second)
+            bucket[1] = min(self.bytes_per_second, bucket[1] + elapsed * self.bytes_per_second)
+            bucket[2] = now
+            # records above the byte rate pass once the bucket is full
+            needed_bytes = min(size, self.bytes_per_second)
+            if bucket[0] >= 1 and bucket[1] >= needed_bytes:
+                bucket[0] -= 1
+                bucket[1] -= needed_bytes
+                return
+            wait = max((1 - bucket[0]) / self.records_per_second, (needed_bytes - bucket[1]) / self.bytes_per_second)
+            self.waited_seconds += wait
+            self.sleep(wait)
+
+
+def load_checkpoint(path):
+    if path and os.path.isfile(path):
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    return None
+
+
+def save_checkpoint(path, checkpoint):
+    # written next to the file and renamed, so a stopped process leaves the previous or the new checkpoint
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temporary, path)
+
+
+class Replayer:
+    """
+    Sends batches to kinesis, a client with put_records(records) returning the PutRecords response
+    (benchmarks/kinesis_stub.py or KinesisClient below). With a limiter the records sent again wait for
+    the tokens of their shard like the records of the batches.
+    """
+
+    def __init__(self, kinesis, max_retries=DEFAULT_MAX_RETRIES, sleep=time.sleep, rng=None, limiter=None):
+        self.kinesis = kinesis
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.limiter = limiter
+        self.stats = {"records": 0, "bytes": 0, "requests": 0, "retried_records": 0}
+
+    def put_batch(self, batch):
+        records = [record for _, record in batch]
+        for attempt in range(self.max_retries + 1):
+            response = self.kinesis.put_records(records)
+            self.stats["requests"] += 1
+            # the records of a failed request come back in request order, only those are sent again
+            failed = [record for record, result in zip(records, response["Records"]) if "ErrorCode" in result]
+            delivered = len(records) - len(failed)
+            self.stats["records"] += delivered
+            self.stats["bytes"] += sum(record_size(record) for record in records) - sum(record_size(record) for record in failed)
+            if not failed:
+                return
+            if attempt == self.max_retries:
+                errors = sorted({result["ErrorCode"] for result in response["Records"] if "ErrorCode" in result})
+                raise ReplayError(f"{len(failed)} records still failed after {self.max_retries} retries: {', '.join(errors)}")
+            self.stats["retried_records"] += len(failed)
+            records = failed
+            self.sleep(self.rng.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt)))
+            if self.limiter:
+                for record in records:
+                    self.limiter.acquire(record["PartitionKey"], record_size(record))
+
+    def replay(self, batches, checkpoint_path=None, checkpoint=None):
+        """
+        Sends the batches in order and checkpoints the position of the last record of every delivered batch
+        """
+        sent = checkpoint["records"] if checkpoint else 0
+        for batch in batches:
+            self.put_batch(batch)
+            sent += len(batch)
+            if checkpoint_path:
+                (key, index), _ = batch[-1]
+                save_checkpoint(checkpoint_path, {"key": key, "index": index, "records": sent})
+        return self.stats
+
+
+class KinesisClient:
+    """
+    put_records of a kinesis stream with boto3, imported when the client is created
+    """
+
+    def __init__(self, stream_name, region=None):
+        import boto3
+        self.stream_name = stream_name
+        self.client = boto3.client("kinesis", region_name=region)
+
+    def shard_count(self):
+        summary = self.client.describe_stream_summary(StreamName=self.stream_name)["StreamDescriptionSummary"]
+        return summary["OpenShardCount"]
+
+    def put_records(self, records):
+        return self.client.put_records(StreamName=self.stream_name, Records=records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replays archived events of the data bucket into the kinesis stream")
+    parser.add_argument("location", help="s3://bucket, or a directory standing in for the bucket")
+    parser.add_argument("--prefix", required=True, help="prefix of the objects to replay, e.g. raw/dt=2023-12-07/")
+    parser.add_argument("--stream", default="gtagStream")
+    parser.add_argument("--region")
+    parser.add_argument("--strategy", default=DEFAULT_STRATEGY, choices=STRATEGIES)
+    parser.add_argument("--salt", default="")
+    parser.add_argument("--shard-fraction", type=float, default=DEFAULT_SHARD_FRACTION,
+                        help="share of the write limit of every shard the replay may use")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    parser.add_argument("--checkpoint", help="file the position is saved to, a rerun continues after it")
+    args = parser.parse_args(argv)
+
+    kinesis = KinesisClient(args.stream, args.region)
+    limiter = ShardRateLimiter(kinesis.shard_count(), args.shard_fraction)
+    checkpoint = load_checkpoint(args.checkpoint)
+    events = read_events(storage_for(args.location), args.prefix, checkpoint)
+    replayer = Replayer(kinesis, args.max_retries, limiter=limiter)
+    try:
+        stats = replayer.replay(batches(to_records(events, args.strategy, args.salt), limiter=limiter),
+                                args.checkpoint, checkpoint)
+    except ReplayError as error:
+        print(f"Replay stopped: {error}. Rerun with the same --checkpoint to continue", file=sys.stderr)
+        return 1
+    print(json.dumps({**stats, "rate_limited_seconds": round(limiter.waited_seconds, 3)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
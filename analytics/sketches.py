@@ -0,0 +1,150 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Fixed size sketches used by analytics/batch_analytics.py. Their memory doesn't grow with the events:
+#   HyperLogLog    - distinct count with a standard error of 1.04 / sqrt(2 ** precision), 2 ** precision bytes
+#   CountMinSketch - counts that are never under estimated and over estimated by at most total * e / width
+#                    with probability 1 - exp(-depth), plus the heaviest items for top k answers
+# Sketches built with the same parameters merge into the sketch of the union of their inputs, so files,
+# workers and days can be sketched separately and combined later. to_dict / from_dict keep them as JSON.
+import base64
+import hashlib
+import math
+from array import array
+
+MASK_64 = (1 << 64) - 1
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _encode(data):
+    return base64.b64encode(bytes(data)).decode("ascii")
+
+
+def _decode(text):
+    return base64.b64decode(text.encode("ascii"))
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision has to be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        hashed = hash64(value)
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        # position of the first 1 bit of the remaining bits
+        rank = 64 - self.precision - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        registers = len(self.registers)
+        if registers == 16:
+            alpha = 0.673
+        elif registers == 32:
+            alpha = 0.697
+        elif registers == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1 + 1.079 / registers)
+        estimate = alpha * registers * registers / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # linear counting is more accurate while many registers are empty
+        if estimate <= 2.5 * registers and zeros:
+            estimate = registers * math.log(registers / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def to_dict(self):
+        return {"precision": self.precision, "registers": _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["precision"])
+        sketch.registers = bytearray(_decode(data["registers"]))
+        return sketch
+
+
+class CountMinSketch:
+
+    def __init__(self, width=2048, depth=4, heavy_hitters=100):
+        self.width = width
+        self.depth = depth
+        self.heavy_hitters = heavy_hitters
+        self.total = 0
+        self.rows = [array("Q", bytes(8 * width)) for _ in range(depth)]
+        # item -> estimated count of the heaviest items seen, at most heavy_hitters of them
+        self.top = {}
+
+    def _indexes(self, item):
+        # double hashing, the rows use h1 + row * h2
+        digest = hashlib.blake2b(str(item).encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        return [((first + row * second) & MASK_64) % self.width for row in range(self.depth)]
+
+    def add(self, item, count=1):
+        self.total += count
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(item)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        self._track(item, estimate)
+
+    def _track(self, item, estimate):
+        if item in self.top or len(self.top) < self.heavy_hitters:
+            self.top[item] = estimate
+            return
+        lightest = min(self.top, key=self.top.get)
+        if estimate > self.top[lightest]:
+            del self.top[lightest]
+            self.top[item] = estimate
+
+    def estimate(self, item):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(item)))
+
+    def most_common(self, count=10):
+        return sorted(self.top.items(), key=lambda item: (-item[1], str(item[0])))[:count]
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only sketches with the same width and depth can be merged")
+        for row, other_row in zip(self.rows, other.rows):
+            for index, count in enumerate(other_row):
+                if count:
+                    row[index] += count
+        self.total += other.total
+        # the heavy hitters of the union are among the heavy hitters of the parts
+        candidates = set(self.top) | set(other.top)
+        self.top = {}
+        for item in candidates:
+            self._track(item, self.estimate(item))
+        return self
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth, "heavy_hitters": self.heavy_hitters, "total": self.total,
+                "rows": [_encode(row.tobytes()) for row in self.rows], "top": self.top}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["width"], data["depth"], data["heavy_hitters"])
+        sketch.total = data["total"]
+        for row, encoded in zip(sketch.rows, data["rows"]):
+            row[:] = array("Q", _decode(encoded))
+        sketch.top = dict(data["top"])
+        return sketch
@@ -0,0 +1,214 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Event time windowed version of the rollup in source/Gtag_ServerSide_Clickstream_Agg_Flink.ipynb
+#   SELECT count(*) AS event_count, event_name, page_location, ga_session_id ... GROUP BY page_location, ga_session_id, event_name
+# The notebook keeps a count per key forever. Here the counts are kept per tumbling or sliding window of event
+# time and a window is emitted as final and dropped once the watermark (highest event time seen minus the
+# allowed lateness) passes its end, so the state only holds the open windows. Events older than the watermark
+# are counted as late and dropped, like flink does without allowed lateness on the window.
+#
+#   python -m analytics.streaming_aggregator events.ndjson --window-seconds 60 --slide-seconds 10 --lateness-seconds 5
+#   python -m benchmarks.events --count 10000 | python -m analytics.streaming_aggregator - --window-seconds 60
+#
+# The output is newline delimited JSON. "update" rows carry the current count of the keys that changed since
+# the previous update (every --update-every events), "final" rows the count of a closed window.
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+DEFAULT_GROUP_BY = ("page_location", "ga_session_id", "event_name")
+# GA events don't carry an event timestamp, the server side container adds the request time
+DEFAULT_TIME_FIELD = "x-sst-system_properties.request_start_time_ms"
+# key the counts of a window are added to once it holds max_keys_per_window keys
+OVERFLOW_KEY = "__overflow__"
+
+
+def field_value(event, path):
+    value = event
+    for name in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(name)
+    return value
+
+
+class StreamingAggregator:
+
+    def __init__(self, window_ms, slide_ms=None, allowed_lateness_ms=0, group_by=DEFAULT_GROUP_BY,
+                 time_field=DEFAULT_TIME_FIELD, max_keys_per_window=None):
+        slide_ms = slide_ms or window_ms
+        if window_ms <= 0 or slide_ms <= 0 or window_ms % slide_ms:
+            raise ValueError("window and slide have to be positive and the window a multiple of the slide")
+        self.window_ms = window_ms
+        self.slide_ms = slide_ms
+        self.allowed_lateness_ms = allowed_lateness_ms
+        self.group_by = tuple(group_by)
+        self.time_field = time_field
+        self.max_keys_per_window = max_keys_per_window
+        self.max_event_time = None
+        # window start -> key -> count
+        self.windows = defaultdict(dict)
+        self.changed = set()
+        self.stats = {"events": 0, "late": 0, "invalid": 0, "overflow": 0}
+
+    @property
+    def watermark(self):
+        if self.max_event_time is None:
+            return None
+        return self.max_event_time - self.allowed_lateness_ms
+
+    def window_starts(self, event_time):
+        # every window [start, start + window) containing event_time, the oldest first
+        last = event_time - event_time % self.slide_ms
+        return range(last - self.window_ms + self.slide_ms, last + 1, self.slide_ms)
+
+    def process(self, event):
+        """
+        Adds event to its windows and returns the final rows of the windows the watermark closed
+        """
+        self.stats["events"] += 1
+        try:
+            event_time = int(field_value(event, self.time_field))
+        except (TypeError, ValueError):
+            self.stats["invalid"] += 1
+            return []
+
+        watermark = self.watermark
+        starts = [start for start in self.window_starts(event_time)
+                  if watermark is None or start + self.window_ms > watermark]
+        if not starts:
+            self.stats["late"] += 1
+            return []
+
+        key = tuple(field_value(event, name) for name in self.group_by)
+        for start in starts:
+            counts = self.windows[start]
+            window_key = key
+            if key not in counts and self.max_keys_per_window and len(counts) >= self.max_keys_per_window:
+                window_key = (OVERFLOW_KEY,) * len(self.group_by)
+                self.stats["overflow"] += 1
+            counts[window_key] = counts.get(window_key, 0) + 1
+            self.changed.add((start, window_key))
+
+        if self.max_event_time is None or event_time > self.max_event_time:
+            self.max_event_time = event_time
+            return self._close(self.watermark)
+        return []
+
+    def updates(self):
+        """
+        Returns the current count of the keys changed since the previous call
+        """
+        rows = [self._row("update", start, key, self.windows[start][key])
+                for start, key in sorted(self.changed, key=lambda change: (change[0], str(change[1])))
+                if start in self.windows]
+        self.changed.clear()
+        return rows
+
+    def flush(self):
+        """
+        Closes every open window, at the end of the input
+        """
+        return self._close(None)
+
+    def _close(self, watermark):
+        rows = []
+        for start in sorted(self.windows):
+            if watermark is not None and start + self.window_ms > watermark:
+                break
+            counts = self.windows.pop(start)
+            rows.extend(self._row("final", start, key, count) for key, count in sorted(counts.items(), key=str))
+        self.changed = {change for change in self.changed if change[0] in self.windows}
+        return rows
+
+    def _row(self, row_type, start, key, count):
+        row = {"type": row_type, "window_start": start, "window_end": start + self.window_ms}
+        row.update(zip(self.group_by, key))
+        row["event_count"] = count
+        return row
+
+
+def read_events(lines):
+    """
+    Yields the events of newline delimited JSON lines, lines that are not JSON objects yield None
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield event if isinstance(event, dict) else None
+
+
+def read_stream(kinesis):
+    """
+    Yields the events written to a benchmarks.kinesis_stub.InMemoryKinesis created with keep_records,
+    interleaving the shards like a consumer reading all of them
+    """
+    shards = [iter(shard.data) for shard in kinesis.shards]
+    while shards:
+        for shard in list(shards):
+            record = next(shard, None)
+            if record is None:
+                shards.remove(shard)
+                continue
+            yield from read_events([record[1].decode("utf-8")])
+
+
+def aggregate(events, aggregator, update_every=None):
+    """
+    Yields the update and final rows of events
+    """
+    for index, event in enumerate(events, 1):
+        if event is None:
+            aggregator.stats["events"] += 1
+            aggregator.stats["invalid"] += 1
+            continue
+        yield from aggregator.process(event)
+        if update_every and index % update_every == 0:
+            yield from aggregator.updates()
+    yield from aggregator.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Windowed event counts by page_location, ga_session_id and event_name")
+    parser.add_argument("events", help="newline delimited JSON events, - reads stdin")
+    parser.add_argument("--window-seconds", type=float, default=60)
+    parser.add_argument("--slide-seconds", type=float, help="sliding windows, tumbling if not set")
+    parser.add_argument("--lateness-seconds", type=float, default=0, help="how far events may arrive out of order")
+    parser.add_argument("--group-by", default=",".join(DEFAULT_GROUP_BY))
+    parser.add_argument("--time-field", default=DEFAULT_TIME_FIELD, help="dotted path of the event time in milliseconds")
+    parser.add_argument("--max-keys-per-window", type=int)
+    parser.add_argument("--update-every", type=int, help="emit the changed counts every n events")
+    args = parser.parse_args(argv)
+
+    aggregator = StreamingAggregator(
+        window_ms=int(args.window_seconds * 1000),
+        slide_ms=int(args.slide_seconds * 1000) if args.slide_seconds else None,
+        allowed_lateness_ms=int(args.lateness_seconds * 1000),
+        group_by=args.group_by.split(","),
+        time_field=args.time_field,
+        max_keys_per_window=args.max_keys_per_window,
+    )
+    lines = sys.stdin if args.events == "-" else open(args.events)
+    try:
+        for row in aggregate(read_events(lines), aggregator, args.update_every):
+            sys.stdout.write(json.dumps(row) + "\n")
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+    print(json.dumps(aggregator.stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,62 @@
 #!/usr/bin/env python3
 import os
+import sys
 
 import aws_cdk as cdk
 
 from deployment.server_side_tagger_stack import ServerSideTaggerStack
 from deployment.aws_analytics_stack import AWSAnalyticsStack
+from deployment.capacity_planner import CapacityPlan, format_report, plan_capacity
 
 from cdk_nag import AwsSolutionsChecks, NagSuppressions
 
+STACK_NAMES = ("ServerSideTaggerStack", "AWSAnalyticsStack")
+
 app = cdk.App()
+
+# comma separated names of the stacks to build (cdk synth -c stacks=ServerSideTaggerStack), all of them by default.
+# AWSAnalyticsStack is built on the vpc, load balancer and cluster of ServerSideTaggerStack, selecting it builds both
+stack_selection = app.node.try_get_context("stacks")
+selected_stacks = set(STACK_NAMES if not stack_selection else
+                      stack_selection.split(",") if isinstance(stack_selection, str) else stack_selection)
+unknown_stacks = selected_stacks - set(STACK_NAMES)
+if unknown_stacks:
+    raise ValueError(f"Unknown stacks {sorted(unknown_stacks)}, use {', '.join(STACK_NAMES)}")
+# -c nag=false skips the cdk-nag checks for inner loop synths, deployments should keep them
+run_nag = str(app.node.try_get_context("nag")).lower() != "false"
+
+# size both stacks from the peak event rate, see deployment/capacity_planner.py
+capacity_planning = app.node.try_get_context("capacity_planning")
+capacity_plan = plan_capacity(**capacity_planning) if capacity_planning else CapacityPlan()
+if capacity_planning:
+    print(format_report(capacity_plan), file=sys.stderr)
+
 server_side_tagger_stack = ServerSideTaggerStack(app, "ServerSideTaggerStack",
 
     env=cdk.Environment(
         account=os.getenv('CDK_DEFAULT_ACCOUNT'), 
         region=os.getenv('CDK_DEFAULT_REGION')
         ),
+    capacity_plan=capacity_plan,
     description="Guidance for Using Google Tag Manager for Server Side Website Analytics on AWS - Data Collection stack (SO9262)"
     )
 
-aws_analytics_stack = AWSAnalyticsStack(app, "AWSAnalyticsStack",
+stacks = [server_side_tagger_stack]
+if "AWSAnalyticsStack" in selected_stacks:
+    stacks.append(AWSAnalyticsStack(app, "AWSAnalyticsStack",
 
-    env=cdk.Environment(
-        account=os.getenv('CDK_DEFAULT_ACCOUNT'), 
-        region=os.getenv('CDK_DEFAULT_REGION')
-        ),
-    vpc=server_side_tagger_stack.vpc,
-    load_balancer=server_side_tagger_stack.load_balancer,
-    cluster=server_side_tagger_stack.ecs_cluster,
-    hosted_zone=server_side_tagger_stack.hosted_zone,
-    description="Guidance for Using Google Tag Manager for Server Side Website Analytics on AWS - Data Analytics stack (SO9262)"
-    )
+        env=cdk.Environment(
+            account=os.getenv('CDK_DEFAULT_ACCOUNT'), 
+            region=os.getenv('CDK_DEFAULT_REGION')
+            ),
+        vpc=server_side_tagger_stack.vpc,
+        load_balancer=server_side_tagger_stack.load_balancer,
+        cluster=server_side_tagger_stack.ecs_cluster,
+        hosted_zone=server_side_tagger_stack.hosted_zone,
+        primary_security_group=server_side_tagger_stack.primary_security_group,
+        capacity_plan=capacity_plan,
+        description="Guidance for Using Google Tag Manager for Server Side Website Analytics on AWS - Data Analytics stack (SO9262)"
+        ))
 
 nag_supressions = [
         {
@@ -119,22 +146,30 @@ nag_supressions = [
         {
             'id': 'AwsSolutions-KDF1',
             'reason': '"Cannot enable encryption for a delivery stream using kinesis streams as a source'
+        },
+        {
+            'id': 'AwsSolutions-CFR1',
+            'reason': 'The optional CloudFront distribution serves the tag manager of a website to visitors of any country'
+        },
+        {
+            'id': 'AwsSolutions-CFR2',
+            'reason': 'The optional CloudFront distribution does not have a WAF web acl, customers can associate their own'
+        },
+        {
+            'id': 'AwsSolutions-CFR3',
+            'reason': 'The optional CloudFront distribution does not have access logging enabled, the tagging server logs the requests'
         }
         
     ]
 
-NagSuppressions.add_stack_suppressions(
-    server_side_tagger_stack,
-    nag_supressions,
-    apply_to_nested_stacks=True
-)
-
-NagSuppressions.add_stack_suppressions(
-    aws_analytics_stack,
-    nag_supressions,
-    apply_to_nested_stacks=True
-)
+if run_nag:
+    for stack in stacks:
+        NagSuppressions.add_stack_suppressions(
+            stack,
+            nag_supressions,
+            apply_to_nested_stacks=True
+        )
 
-cdk.Aspects.of(app).add(AwsSolutionsChecks())
+    cdk.Aspects.of(app).add(AwsSolutionsChecks())
 
 app.synth()
@@ -0,0 +1,12 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Local stand-ins of the ingestion path, used to measure partition key, batching and payload changes
+# without deploying:
+#   kinesis_stub   - in-memory kinesis stream with the per-shard write limits
+#   producer_stub  - asyncio http server with the request contract of InputEventController.java
+#   load_generator - replays GA events shaped like assets/GA-sample.json against the producer stub
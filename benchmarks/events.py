@@ -0,0 +1,59 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# GA events shaped like assets/GA-sample.json. Every event is a copy of the sample with the fields the
+# analytics group by (client_id, ga_session_id, page_location, event_name) and the request time varied,
+# so partition keys and rollups behave like on real traffic.
+#
+#   python -m benchmarks.events --count 10000 > events.ndjson
+import argparse
+import copy
+import json
+import random
+import sys
+
+from deployment.event_schema import load_sample_event
+
+EVENT_NAMES = ["page_view", "user_engagement", "scroll", "click", "form_start"]
+# start of the generated traffic, the request time of the sample event
+DEFAULT_START_TIME_MS = 1701933991153
+
+
+def generate_events(count, sessions=100, pages=20, events_per_second=100, start_time_ms=DEFAULT_START_TIME_MS,
+                    seed=0, sample=None):
+    """
+    Yields count events spread over the given number of sessions and pages. The request time of the
+    events advances by 1 / events_per_second.
+    """
+    rng = random.Random(seed)
+    sample = sample or load_sample_event()
+    for index in range(count):
+        session = rng.randrange(sessions)
+        event = copy.deepcopy(sample)
+        event["client_id"] = f"{1000000 + session}.{1700000000 + session}"
+        event["ga_session_id"] = str(1701931976 + session)
+        event["page_location"] = f"https://www.xxxx.cloud/blank-{rng.randrange(pages)}"
+        event["event_name"] = rng.choice(EVENT_NAMES)
+        event["x-sst-system_properties"]["request_start_time_ms"] = str(start_time_ms + index * 1000 // events_per_second)
+        yield event
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write GA sample events as newline delimited JSON")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--events-per-second", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    for event in generate_events(args.count, args.sessions, args.pages, args.events_per_second, seed=args.seed):
+        sys.stdout.write(json.dumps(event) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# In-memory stand-in of a provisioned kinesis stream. Records are routed to the shards like kinesis does
+# (MD5 of the partition key, see deployment/shard_simulator.py) and every shard accepts at most 1 MiB and
+# 1000 records per second, the records above it are rejected with ProvisionedThroughputExceededException.
+# The limits are token buckets holding one second of writes, so short bursts pass like they do on kinesis.
+import time
+
+from deployment.capacity_planner import SHARD_BYTES_PER_SECOND, SHARD_RECORDS_PER_SECOND
+from deployment.shard_simulator import shard_for_key
+
+THROUGHPUT_EXCEEDED = "ProvisionedThroughputExceededException"
+# PutRecords limits
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+
+
+class ProvisionedThroughputExceeded(Exception):
+    pass
+
+
+class Shard:
+
+    def __init__(self, shard_id, bytes_per_second, records_per_second, now):
+        self.shard_id = shard_id
+        self.bytes_per_second = bytes_per_second
+        self.records_per_second = records_per_second
+        self.byte_tokens = bytes_per_second
+        self.record_tokens = records_per_second
+        self.updated = now
+        self.records = 0
+        self.bytes = 0
+        self.throttled = 0
+        self.sequence_number = 0
+        # (partition key, data) of the accepted records, only kept when the stream is created with keep_records
+        self.data = []
+
+    def refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.byte_tokens = min(self.bytes_per_second, self.byte_tokens + elapsed * self.bytes_per_second)
+        self.record_tokens = min(self.records_per_second, self.record_tokens + elapsed * self.records_per_second)
+        self.updated = now
+
+    def try_put(self, size, now):
+        self.refill(now)
+        if self.record_tokens < 1 or self.byte_tokens < size:
+            self.throttled += 1
+            return False
+        self.record_tokens -= 1
+        self.byte_tokens -= size
+        self.records += 1
+        self.bytes += size
+        self.sequence_number += 1
+        return True
+
+
+class InMemoryKinesis:
+
+    def __init__(self, shard_count=1, bytes_per_second=SHARD_BYTES_PER_SECOND,
+                 records_per_second=SHARD_RECORDS_PER_SECOND, keep_records=False, clock=time.monotonic):
+        self.clock = clock
+        self.keep_records = keep_records
+        now = clock()
+        self.shards = [Shard(f"shardId-{index:012d}", bytes_per_second, records_per_second, now)
+                       for index in range(shard_count)]
+
+    def _put(self, partition_key, data):
+        shard = self.shards[shard_for_key(partition_key, len(self.shards))]
+        # the partition key counts against the shard limit like the data
+        if not shard.try_put(len(data) + len(partition_key.encode("utf-8")), self.clock()):
+            return shard, None
+        if self.keep_records:
+            shard.data.append((partition_key, data))
+        return shard, f"{shard.sequence_number:056d}"
+
+    def put_record(self, partition_key, data):
+        """
+        Returns the ShardId and SequenceNumber like PutRecord or raises ProvisionedThroughputExceeded
+        """
+        shard, sequence_number = self._put(partition_key, data)
+        if sequence_number is None:
+            raise ProvisionedThroughputExceeded(f"Rate exceeded for shard {shard.shard_id}")
+        return {"ShardId": shard.shard_id, "SequenceNumber": sequence_number}
+
+    def put_records(self, records):
+        """
+        records are {"PartitionKey": str, "Data": bytes}, returns the PutRecords response with the
+        outcome of every record in request order
+        """
+        if not records or len(records) > MAX_RECORDS_PER_REQUEST:
+            raise ValueError(f"PutRecords takes 1 to {MAX_RECORDS_PER_REQUEST} records")
+        if sum(len(record["Data"]) + len(record["PartitionKey"].encode("utf-8")) for record in records) > MAX_BYTES_PER_REQUEST:
+            raise ValueError("PutRecords takes at most 5 MiB per request")
+
+        results = []
+        for record in records:
+            shard, sequence_number = self._put(record["PartitionKey"], record["Data"])
+            if sequence_number is None:
+                results.append({"ErrorCode": THROUGHPUT_EXCEEDED, "ErrorMessage": f"Rate exceeded for shard {shard.shard_id}"})
+            else:
+                results.append({"ShardId": shard.shard_id, "SequenceNumber": sequence_number})
+        return {"FailedRecordCount": sum(1 for result in results if "ErrorCode" in result), "Records": results}
+
+    def stats(self):
+        return [
+            {"shard_id": shard.shard_id, "records": shard.records, "bytes": shard.bytes, "throttled": shard.throttled}
+            for shard in self.shards
+        ]
@@ -0,0 +1,198 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Replays GA events at a fixed rate against the producer stub (or a producer running locally) and reports
+# latency percentiles, accepted events per second and the writes and throttles of every shard.
+#
+#   python -m benchmarks.load_generator --rate 1500 --duration 10 --concurrency 32 --shards 2 --strategy session_id
+#
+# The load is open loop: event i is due at start + i / rate and its latency is measured from that time, so
+# a slow server shows up in the percentiles instead of only slowing the generator down. --max-p99-ms,
+# --min-events-per-second and --max-throttled turn the report into a pass/fail check for CI.
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlparse
+
+from benchmarks.events import generate_events
+from benchmarks.kinesis_stub import InMemoryKinesis
+from benchmarks.producer_stub import FORM_CONTENT_TYPE, ProducerStub
+from deployment.event_schema import projection_settings
+from deployment.partition_key import DEFAULT_STRATEGY, STRATEGIES
+
+BODY_FORMATS = ("json", "form")
+
+
+def encode_body(event, body_format):
+    """
+    Returns (content type, body) of the request the gtm tag sends for event
+    """
+    if body_format == "form":
+        return FORM_CONTENT_TYPE, urlencode({"data": json.dumps(event)}).encode("utf-8")
+    return "application/json", json.dumps({"data": event}).encode("utf-8")
+
+
+async def _send(reader, writer, host, content_type, body):
+    writer.write(
+        f"POST / HTTP/1.1\r\nHost: {host}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1")
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split(b" ", 2)[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_load(host, port, bodies, rate, concurrency):
+    """
+    Sends the (content type, body) pairs at rate requests per second over concurrency keep-alive
+    connections. Returns the (latency seconds, status) of every request and the elapsed seconds.
+    """
+    results = []
+    next_index = iter(range(len(bodies)))
+    start = time.perf_counter()
+
+    async def worker():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for index in next_index:
+                due = start + index / rate
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                content_type, body = bodies[index]
+                try:
+                    status = await _send(reader, writer, host, content_type, body)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    status = 0
+                    writer.close()
+                    reader, writer = await asyncio.open_connection(host, port)
+                results.append((time.perf_counter() - due, status))
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def percentile(sorted_values, share):
+    # nearest rank
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(share * len(sorted_values) + 0.5) - 1))]
+
+
+def summarize(results, elapsed, shards=None):
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    statuses = Counter(status for _, status in results)
+    return {
+        "requests": len(results),
+        "duration_seconds": round(elapsed, 3),
+        "events_per_second": round(statuses[200] / elapsed, 1) if elapsed else 0.0,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "latency_ms": {name: round(percentile(latencies, share), 3)
+                       for name, share in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+        "shards": shards or [],
+    }
+
+
+async def run_benchmark(rate=500, duration=5, concurrency=16, shards=1, strategy=DEFAULT_STRATEGY, salt="",
+                        body_format="json", sessions=100, seed=0, target=None, projection=None):
+    """
+    Runs the load against target (http://host:port) or, without a target, against a producer stub
+    writing to an InMemoryKinesis with the given shard count, projecting the events with projection when set.
+    Returns the report.
+    """
+    bodies = [encode_body(event, body_format)
+              for event in generate_events(max(1, int(rate * duration)), sessions=sessions, events_per_second=rate, seed=seed)]
+
+    if target:
+        url = urlparse(target)
+        results, elapsed = await run_load(url.hostname, url.port or 80, bodies, rate, concurrency)
+        return summarize(results, elapsed)
+
+    kinesis = InMemoryKinesis(shards)
+    stub = ProducerStub(kinesis, strategy, salt, projection)
+    port = await stub.start()
+    try:
+        results, elapsed = await run_load("127.0.0.1", port, bodies, rate, concurrency)
+    finally:
+        await stub.stop()
+    return summarize(results, elapsed, kinesis.stats())
+
+
+def format_report(report):
+    latency = report["latency_ms"]
+    lines = [
+        f"requests     {report['requests']} in {report['duration_seconds']} s, {report['events_per_second']} events/s accepted",
+        f"status       {', '.join(f'{status}: {count}' for status, count in report['status_counts'].items())}",
+        f"latency ms   p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}",
+    ]
+    for shard in report["shards"]:
+        lines.append(f"{shard['shard_id']}  {shard['records']} records, {shard['bytes']} bytes, {shard['throttled']} throttled")
+    return "\n".join(lines)
+
+
+def check_thresholds(report, max_p99_ms=None, min_events_per_second=None, max_throttled=None):
+    """
+    Returns the failed checks of the report
+    """
+    failures = []
+    if max_p99_ms is not None and report["latency_ms"]["p99"] > max_p99_ms:
+        failures.append(f"p99 latency {report['latency_ms']['p99']} ms is above {max_p99_ms} ms")
+    if min_events_per_second is not None and report["events_per_second"] < min_events_per_second:
+        failures.append(f"{report['events_per_second']} events/s is below {min_events_per_second}")
+    throttled = sum(shard["throttled"] for shard in report["shards"])
+    if max_throttled is not None and throttled > max_throttled:
+        failures.append(f"{throttled} throttled records is above {max_throttled}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay GA events against the producer stub and report latency and throughput")
+    parser.add_argument("--rate", type=float, default=500, help="events per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="keep-alive connections")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--strategy", default=DEFAULT_STRATEGY, choices=STRATEGIES)
+    parser.add_argument("--salt", default="")
+    parser.add_argument("--body-format", default="json", choices=BODY_FORMATS)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", help="http://host:port of a running producer instead of the stub")
+    parser.add_argument("--event-projection", action="store_true",
+                        help="project the events in the stub like event_projection true, see deployment/event_schema.py")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-p99-ms", type=float)
+    parser.add_argument("--min-events-per-second", type=float)
+    parser.add_argument("--max-throttled", type=int)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(args.rate, args.duration, args.concurrency, args.shards, args.strategy,
+                                       args.salt, args.body_format, args.sessions, args.seed, args.target,
+                                       projection_settings(args.event_projection)))
+    print(json.dumps(report, indent=4) if args.json else format_report(report))
+
+    failures = check_thresholds(report, args.max_p99_ms, args.min_events_per_second, args.max_throttled)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
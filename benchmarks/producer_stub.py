@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# asyncio http server with the request contract of InputEventController.java:
+#   POST / with a JSON body {"data": {...event...}}
+#   POST / with an application/x-www-form-urlencoded body data=...
+#   GET /healthcheck
+# The event is written to an InMemoryKinesis with the partition key strategy of the stack. Instead of
+# buffering in a KPL the record is written right away, a throttled record is answered with 503 and
+# Retry-After like the producer does when its buffer is full. With the projection settings of
+# deployment/event_schema.py the events are projected and malformed ones answered with 400 like EventProjection.java.
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from benchmarks.kinesis_stub import ProvisionedThroughputExceeded
+from deployment.event_schema import project_event
+from deployment.partition_key import DEFAULT_STRATEGY, partition_key
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+RETRY_AFTER_SECONDS = 1
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+def _parsed(element):
+    # the url encoded data parameter holds the event as a JSON string, the key is read from its fields
+    if isinstance(element, str):
+        try:
+            return json.loads(element)
+        except ValueError:
+            return {}
+    return element
+
+
+class ProducerStub:
+
+    def __init__(self, kinesis, strategy=DEFAULT_STRATEGY, salt="", projection=None):
+        self.kinesis = kinesis
+        self.strategy = strategy
+        self.salt = salt
+        self.projection = projection
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Starts listening, port 0 picks a free port. Returns the port.
+        """
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def handle(self, method, path, headers, body):
+        """
+        Returns (status, headers, body) of a request
+        """
+        if method == "GET" and path == "/healthcheck":
+            return 200, {}, b""
+        if method != "POST" or path != "/":
+            return 404, {}, b""
+
+        if headers.get("content-type", "").startswith(FORM_CONTENT_TYPE):
+            # @RequestParam Map<String, Object> keeps the first value of every parameter
+            payload = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+        else:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return 400, {}, b""
+            if not isinstance(payload, dict):
+                return 400, {}, b""
+
+        element = payload.get("data")
+        if self.projection:
+            try:
+                # the url encoded data parameter holds the event as a JSON string
+                element = project_event(json.loads(element) if isinstance(element, str) else element, self.projection)
+            except ValueError as error:
+                body = json.dumps({"ErrorCode": "MalformedEvent", "ErrorMessage": str(error)})
+                return 400, {"Content-Type": "application/json"}, body.encode("utf-8")
+        key = partition_key(_parsed(element), self.strategy, self.salt)
+        data = json.dumps(element, separators=(",", ":")).encode("utf-8")
+        try:
+            self.kinesis.put_record(key, data)
+        except ProvisionedThroughputExceeded as error:
+            body = json.dumps({"ErrorCode": "ProvisionedThroughputExceededException", "ErrorMessage": str(error)})
+            return 503, {"Retry-After": str(RETRY_AFTER_SECONDS), "Content-Type": "application/json"}, body.encode("utf-8")
+        return 200, {}, b""
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, response_headers, response_body = self.handle(method, path, headers, body)
+                head = f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: {len(response_body)}\r\n"
+                head += "".join(f"{name}: {value}\r\n" for name, value in response_headers.items())
+                writer.write(head.encode("latin-1") + b"\r\n" + response_body)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,136 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Runs app.py the way cdk synth does and reports the wall time and the peak memory of the synthesis.
+#
+#   python -m benchmarks.synth_benchmark --repeat 3 --stacks ServerSideTaggerStack --no-nag
+#
+# The app gets the context of cdk.json and cdk.context.json (cdk.context.json.example when there is none)
+# with asset bundling off, the flink application bundle needs docker and doesn't change the templates.
+# The peak memory is the largest resident set of the app and the jsii node process it waited for.
+# --max-seconds and --max-rss-mb turn the report into a pass/fail check for CI.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synth_context(stacks=None, nag=True, context=None):
+    """
+    Context of the cdk cli for app.py updated with the stack selection, the nag switch and context
+    """
+    with open(os.path.join(ROOT, "cdk.json")) as cdk_json:
+        synth = dict(json.load(cdk_json).get("context", {}))
+    context_file = os.path.join(ROOT, "cdk.context.json")
+    if not os.path.exists(context_file):
+        context_file = os.path.join(ROOT, "cdk.context.json.example")
+    with open(context_file) as context_json:
+        synth.update(json.load(context_json))
+    synth["aws:cdk:bundling-stacks"] = []
+    if stacks:
+        synth["stacks"] = ",".join(stacks)
+    synth["nag"] = nag
+    synth.update(context or {})
+    return synth
+
+
+def synth_once(context, outdir):
+    """
+    Returns (seconds, peak rss in MB, names of the synthesized stacks) of one run of app.py
+    """
+    env = dict(os.environ,
+        CDK_CONTEXT_JSON=json.dumps(context),
+        CDK_OUTDIR=outdir,
+        JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION="1",
+    )
+    env.setdefault("CDK_DEFAULT_ACCOUNT", "111111111111")
+    env.setdefault("CDK_DEFAULT_REGION", "us-west-2")
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = process.stderr.read()
+    _, status, rusage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    process.stderr.close()
+    if process.returncode:
+        raise RuntimeError(f"app.py failed with exit code {process.returncode}\n{stderr.decode('utf-8', 'replace')}")
+
+    with open(os.path.join(outdir, "manifest.json")) as manifest:
+        artifacts = json.load(manifest)["artifacts"]
+    stacks = sorted(name for name, artifact in artifacts.items() if artifact["type"] == "aws:cloudformation:stack")
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    peak_rss = rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return seconds, peak_rss, stacks
+
+
+def run_benchmark(stacks=None, nag=True, repeat=1, context=None):
+    """
+    Synthesizes app.py repeat times, reports the median seconds and the largest peak rss
+    """
+    synth = synth_context(stacks, nag, context)
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="cdk.out.") as outdir:
+            runs.append(synth_once(synth, outdir))
+    return {
+        "seconds": round(statistics.median(seconds for seconds, _, _ in runs), 2),
+        "peak_rss_mb": round(max(peak_rss for _, peak_rss, _ in runs), 1),
+        "runs": len(runs),
+        "stacks": runs[0][2],
+        "nag": nag,
+    }
+
+
+def format_report(report):
+    return "\n".join([
+        f"stacks       {', '.join(report['stacks'])}, cdk-nag {'on' if report['nag'] else 'off'}",
+        f"synth        {report['seconds']} s (median of {report['runs']}), peak rss {report['peak_rss_mb']} MB",
+    ])
+
+
+def check_thresholds(report, max_seconds=None, max_rss_mb=None):
+    """
+    Returns the failed checks of the report
+    """
+    failures = []
+    if max_seconds is not None and report["seconds"] > max_seconds:
+        failures.append(f"synth time {report['seconds']} s is above {max_seconds} s")
+    if max_rss_mb is not None and report["peak_rss_mb"] > max_rss_mb:
+        failures.append(f"peak rss {report['peak_rss_mb']} MB is above {max_rss_mb} MB")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthesize app.py and report the synth time and peak memory")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--stacks", help="comma separated stacks to synthesize, all of them by default")
+    parser.add_argument("--no-nag", action="store_true", help="skip the cdk-nag checks like -c nag=false")
+    parser.add_argument("--context", type=json.loads, default={}, help="JSON object of context values to set")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-seconds", type=float)
+    parser.add_argument("--max-rss-mb", type=float)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.stacks.split(",") if args.stacks else None, not args.no_nag, args.repeat, args.context)
+    print(json.dumps(report, indent=4) if args.json else format_report(report))
+
+    failures = check_thresholds(report, args.max_seconds, args.max_rss_mb)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
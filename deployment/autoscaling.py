@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Autoscaling policies and capacity provider strategies shared by the primary and the producer service. CPU and memory react only once the
+# tasks are busy, so the services also track the ALB request count per target, step out on the target
+# response time and can be scaled ahead of known peaks (e.g. campaign launches) on a schedule.
+# The settings are read from the primary_autoscaling and producer_autoscaling context values:
+#   {
+#     "requests_per_target": 6000,
+#     "scale_in_cooldown_seconds": 300,
+#     "scale_out_cooldown_seconds": 60,
+#     "response_time_steps": [{"lower": 0.5, "change": 1}, {"lower": 1, "change": 3}],
+#     "schedules": [{"name": "CampaignLaunch", "schedule": "cron(0 8 * * ? *)", "min_capacity": 6, "max_capacity": 20}]
+#   }
+from typing import Optional
+
+from aws_cdk import (
+    Duration,
+    aws_applicationautoscaling as appscaling,
+    aws_ecs as ecs,
+    aws_elasticloadbalancingv2 as elbv2,
+)
+
+DEFAULT_SCALING_SETTINGS = {
+    # ALBRequestCountPerTarget is a sum per minute, None derives it from the task size
+    "requests_per_target": None,
+    # scale out fast on bursts, scale in slowly so a second wave doesn't hit a shrunk service
+    "scale_in_cooldown_seconds": 300,
+    "scale_out_cooldown_seconds": 60,
+    # seconds of p95 target response time and the tasks added above them
+    "response_time_steps": [{"lower": 0.5, "change": 1}, {"lower": 1, "change": 3}],
+    "schedules": [],
+}
+
+
+def scaling_settings(context_settings):
+    settings = dict(DEFAULT_SCALING_SETTINGS)
+    settings.update(context_settings or {})
+    return settings
+
+
+def configure_service_scaling(scalable_target: ecs.ScalableTaskCount, target_group: Optional[elbv2.ApplicationTargetGroup],
+                              cpu_target: int, memory_target: int, requests_per_target: int, settings: dict) -> None:
+    """
+    Adds the cpu, memory, request count, response time and scheduled scaling policies to scalable_target.
+    Services without a target group (reached through service connect) only scale on cpu, memory and schedules.
+    """
+    scale_in_cooldown = Duration.seconds(settings["scale_in_cooldown_seconds"])
+    scale_out_cooldown = Duration.seconds(settings["scale_out_cooldown_seconds"])
+
+    scalable_target.scale_on_cpu_utilization("CpuScaling",
+        target_utilization_percent=cpu_target,
+        scale_in_cooldown=scale_in_cooldown,
+        scale_out_cooldown=scale_out_cooldown,
+    )
+
+    scalable_target.scale_on_memory_utilization("MemoryScaling",
+        target_utilization_percent=memory_target,
+        scale_in_cooldown=scale_in_cooldown,
+        scale_out_cooldown=scale_out_cooldown,
+    )
+
+    if target_group is None:
+        _add_schedules(scalable_target, settings)
+        return
+
+    scalable_target.scale_on_request_count("RequestCountScaling",
+        requests_per_target=settings["requests_per_target"] or requests_per_target,
+        target_group=target_group,
+        scale_in_cooldown=scale_in_cooldown,
+        scale_out_cooldown=scale_out_cooldown,
+    )
+
+    # step scaling only adds tasks, scaling in is left to the target tracking policies
+    response_time_steps = settings["response_time_steps"]
+    if response_time_steps:
+        scalable_target.scale_on_metric("ResponseTimeScaling",
+            metric=target_group.metrics.target_response_time(statistic="p95", period=Duration.minutes(1)),
+            scaling_steps=[appscaling.ScalingInterval(upper=response_time_steps[0]["lower"], change=0)] + [
+                appscaling.ScalingInterval(lower=step["lower"], change=step["change"]) for step in response_time_steps
+            ],
+            adjustment_type=appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+            cooldown=scale_out_cooldown,
+            evaluation_periods=2,
+        )
+
+    _add_schedules(scalable_target, settings)
+
+
+def _add_schedules(scalable_target, settings):
+    for schedule in settings["schedules"]:
+        scalable_target.scale_on_schedule(schedule["name"],
+            schedule=appscaling.Schedule.expression(schedule["schedule"]),
+            min_capacity=schedule.get("min_capacity"),
+            max_capacity=schedule.get("max_capacity"),
+        )
+
+
+def fargate_capacity_provider_strategies(base: int, spot_weight: int):
+    """
+    Capacity provider strategy of a service, the first base tasks always run on FARGATE and the tasks above it
+    are split 1:spot_weight between FARGATE and FARGATE_SPOT. None keeps the FARGATE launch type.
+    """
+    if not spot_weight:
+        return None
+    return [
+        ecs.CapacityProviderStrategy(capacity_provider="FARGATE", base=base, weight=1),
+        ecs.CapacityProviderStrategy(capacity_provider="FARGATE_SPOT", weight=spot_weight),
+    ]
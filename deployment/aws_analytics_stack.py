@@ -17,22 +17,66 @@ from aws_cdk import (
     aws_ecs as ecs,
     aws_ec2 as ec2,
     aws_elasticloadbalancingv2 as elbv2,
+    aws_glue as glue,
+    aws_cloudwatch as cloudwatch,
 )
 from aws_solutions_constructs.aws_kinesis_streams_kinesis_firehose_s3 import KinesisStreamsToKinesisFirehoseToS3
 from constructs import Construct
 from aws_cdk.aws_route53 import PrivateHostedZone, CnameRecord
 from aws_cdk.aws_ecr_assets import Platform
+from deployment.autoscaling import configure_service_scaling, fargate_capacity_provider_strategies, scaling_settings
+from deployment.capacity_planner import CapacityPlan
+from deployment.compaction_job import CompactionJob, compaction_settings
+from deployment.firehose_delivery import firehose_settings, parquet_compression, s3_destination
+from deployment.kinesis_stream import FLINK_CONSUMER, add_consumers, stream_props, stream_settings
+from deployment.flink_application import ClickstreamFlinkApplication, flink_settings
+from deployment.monitoring import PipelineMonitoring, monitoring_settings
+from deployment.event_schema import (
+    PARTITION_KEYS,
+    api_gateway_json_schema,
+    api_gateway_projection_template,
+    event_json_schema,
+    glue_columns,
+    json_key_mappings,
+    projection_settings,
+)
+from deployment.service_connect import PRODUCER_PORT_NAME, producer_configuration, service_connect_settings
+from deployment.producer_settings import backpressure_environment, kpl_environment, logging_environment, projection_environment
+from deployment.partition_key import DEFAULT_STRATEGY, api_gateway_partition_key_template, validate_strategy
 DIRNAME = os.path.dirname(__file__)
 
 class AWSAnalyticsStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, vpc: ec2.Vpc, load_balancer: elbv2.ApplicationLoadBalancer, 
-                 cluster: ecs.ICluster, hosted_zone: PrivateHostedZone, **kwargs) -> None:
+                 cluster: ecs.ICluster, hosted_zone: PrivateHostedZone, primary_security_group: ec2.ISecurityGroup,
+                 capacity_plan: CapacityPlan = None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # sizing of the stream, the producer and the firehose buffers, see deployment/capacity_planner.py
+        capacity_plan = capacity_plan or CapacityPlan()
+
         # flag to decide if api gateway or kinesis producer api is to be created
         data_capture_api_method = self.node.try_get_context("data_capture_api_method")
         producer_dns = self.node.try_get_context("producer_service_dns")
+        # flag to deliver the events as parquet partitioned by event name, date and hour
+        parquet_delivery = self.node.try_get_context("parquet_delivery")
+        # partition key strategy used by both the api gateway and the producer, see deployment/partition_key.py
+        partition_key_strategy = validate_strategy(self.node.try_get_context("partition_key_strategy") or DEFAULT_STRATEGY)
+        partition_key_salt = self.node.try_get_context("partition_key_salt") or ""
+        # X86_64 or ARM64 (graviton) for the producer tasks
+        producer_cpu_architecture = self.node.try_get_context("producer_cpu_architecture") or "X86_64"
+        # weight of FARGATE_SPOT against FARGATE for the tasks above the minimum capacity, 0 runs everything on FARGATE
+        fargate_spot_weight = self.node.try_get_context("fargate_spot_weight") or 0
+        # settings of the optional flink application, see deployment/flink_application.py
+        flink_application = self.node.try_get_context("flink_application")
+        # settings of the optional small file compaction job, see deployment/compaction_job.py
+        compaction_job = self.node.try_get_context("compaction_job")
+        # schema validation and projection of the events in both ingestion paths, see deployment/event_schema.py
+        event_projection = projection_settings(self.node.try_get_context("event_projection"))
+        # service connect from the primary service to the producer, see deployment/service_connect.py
+        service_connect = service_connect_settings(self.node.try_get_context("producer_service_connect"))
+        if service_connect and data_capture_api_method == "api_gateway":
+            raise ValueError("producer_service_connect connects the primary service to the producer, it can't be used with api_gateway")
 
         # account and region
         acc = os.getenv('CDK_DEFAULT_ACCOUNT')
@@ -47,7 +91,11 @@ class AWSAnalyticsStack(Stack):
         # -----------------------------------------------------------------------------------------------------------
 
         #Defining Kinesis data stream 
-        stream=kds.Stream(self, 'KinesisDataStream', stream_name=stream_name)
+        # mode, shards and retention from the kinesis_stream context value or the capacity plan, see deployment/kinesis_stream.py
+        kinesis_stream = stream_settings(self.node.try_get_context("kinesis_stream"), capacity_plan)
+        stream=kds.Stream(self, 'KinesisDataStream', stream_name=stream_name, **stream_props(kinesis_stream))
+        # enhanced fan-out consumers read with their own throughput, next to firehose polling the shards
+        stream_consumers = add_consumers(self, stream, kinesis_stream["consumers"])
 
         # S3 buckets needs to have unique names
         access_log_bucket_name=f"s3-access-log-{acc}-{region}"
@@ -67,14 +115,148 @@ class AWSAnalyticsStack(Stack):
         #     key_type="AWS_OWNED_CMK"
         # )
         
+        # buffering, compression, delimiter and prefixes of the S3 destination, see deployment/firehose_delivery.py
+        firehose_delivery = firehose_settings(self.node.try_get_context("firehose_delivery"))
+        firehose_destination = s3_destination(firehose_delivery, capacity_plan, parquet=bool(parquet_delivery))
+        if parquet_delivery:
+            # -----------------------------------------------------------------------------------------------------------
+            # defines the glue table the events are converted to, the schema is derived from assets/GA-sample.json
+            # firehose partitions the parquet files as events/event_name=<event_name>/dt=<yyyy-MM-dd>/hr=<HH>/
+            # new partitions have to be loaded with MSCK REPAIR TABLE before they show up in athena
+            # -----------------------------------------------------------------------------------------------------------
+            columns = glue_columns()
+            glue_database_name = "gtag_analytics"
+            glue_table_name = "gtag_events"
+
+            glue_database = glue.CfnDatabase(self, "GTagGlueDatabase",
+                catalog_id=self.account,
+                database_input=glue.CfnDatabase.DatabaseInputProperty(name=glue_database_name)
+            )
+            glue_table = glue.CfnTable(self, "GTagGlueTable",
+                catalog_id=self.account,
+                database_name=glue_database_name,
+                table_input=glue.CfnTable.TableInputProperty(
+                    name=glue_table_name,
+                    table_type="EXTERNAL_TABLE",
+                    parameters={"classification": "parquet", "EXTERNAL": "TRUE"},
+                    partition_keys=[glue.CfnTable.ColumnProperty(name=key["name"], type=key["type"]) for key in PARTITION_KEYS],
+                    storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                        columns=[glue.CfnTable.ColumnProperty(name=column["name"], type=column["type"]) for column in columns],
+                        location=f"s3://{s3_bucket.bucket_name}/events/",
+                        input_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                        output_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                        serde_info=glue.CfnTable.SerdeInfoProperty(
+                            serialization_library="org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+                        ),
+                    ),
+                )
+            )
+            glue_table.add_dependency(glue_database)
+
+            # role used by firehose to read the table schema during the record format conversion
+            schema_role = iam.Role(self, "FirehoseSchemaRole", assumed_by=iam.ServicePrincipal("firehose.amazonaws.com"))
+            schema_role.add_to_policy(iam.PolicyStatement(
+                actions=["glue:GetTable", "glue:GetTableVersion", "glue:GetTableVersions"],
+                resources=[
+                    f"arn:{self.partition}:glue:{self.region}:{self.account}:catalog",
+                    f"arn:{self.partition}:glue:{self.region}:{self.account}:database/{glue_database_name}",
+                    f"arn:{self.partition}:glue:{self.region}:{self.account}:table/{glue_database_name}/{glue_table_name}",
+                ]
+            ))
+
+            firehose_destination.update({
+                "prefix": "events/event_name=!{partitionKeyFromQuery:event_name}/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/",
+                "dynamicPartitioningConfiguration": {
+                    "enabled": True,
+                    "retryOptions": {"durationInSeconds": 300},
+                },
+                "processingConfiguration": {
+                    "enabled": True,
+                    "processors": [{
+                        "type": "MetadataExtraction",
+                        "parameters": [
+                            # events without a name still need a valid prefix
+                            {"parameterName": "MetadataExtractionQuery", "parameterValue": '{event_name: (.event_name // "unknown")}'},
+                            {"parameterName": "JsonParsingEngine", "parameterValue": "JQ-1.6"},
+                        ],
+                    }],
+                },
+                "dataFormatConversionConfiguration": {
+                    "enabled": True,
+                    "inputFormatConfiguration": {
+                        "deserializer": {"openXJsonSerDe": {"columnToJsonKeyMappings": json_key_mappings(columns)}}
+                    },
+                    "outputFormatConfiguration": {
+                        "serializer": {"parquetSerDe": {"compression": parquet_compression(firehose_delivery)}}
+                    },
+                    "schemaConfiguration": {
+                        "catalogId": self.account,
+                        "databaseName": glue_database_name,
+                        "tableName": glue_table_name,
+                        "region": self.region,
+                        "roleArn": schema_role.role_arn,
+                        "versionId": "LATEST",
+                    },
+                },
+            })
+
+        # kinesis_firehose_props is deep merged into the construct defaults, so it uses the camel case keys of CfnDeliveryStreamProps
+        firehose_props = {"extendedS3DestinationConfiguration": firehose_destination}
+
         # Creating Kinesis data firehose stream that writes to a S3 bucket
         # Cannot enable encryption for a delivery stream using kinesis streams as a source
-        KinesisStreamsToKinesisFirehoseToS3(self, 'gtag_stream_firehose_s3', 
+        firehose_s3 = KinesisStreamsToKinesisFirehoseToS3(self, 'gtag_stream_firehose_s3', 
             existing_bucket_obj=s3_bucket,
             existing_stream_obj=stream,
+            kinesis_firehose_props=firehose_props,
             # kinesis_firehose_props=kinesisfirehose.CfnDeliveryStreamProps(
             #     delivery_stream_encryption_configuration_input=del_stream_enc_conf_in_prop)
         )
+        if parquet_delivery:
+            # the schema has to exist before firehose validates the conversion configuration
+            firehose_s3.kinesis_firehose.node.add_dependency(glue_table)
+            firehose_s3.kinesis_firehose.node.add_dependency(schema_role)
+
+        # -----------------------------------------------------------------------------------------------------------
+        # defines the dashboard and alarms of the stream, firehose and the ingestion below, see deployment/monitoring.py
+        # -----------------------------------------------------------------------------------------------------------
+
+        monitoring = PipelineMonitoring(self, "GTMAnalyticsMonitoring",
+            dashboard_name="GTMAnalytics",
+            settings=monitoring_settings(self.node.try_get_context("monitoring")),
+        )
+        monitoring.add_stream(stream)
+        if stream_consumers:
+            monitoring.add_stream_consumers(stream.stream_name, list(stream_consumers))
+        monitoring.add_delivery_stream(firehose_s3.kinesis_firehose.ref)
+
+        # -----------------------------------------------------------------------------------------------------------
+        # defines the optional flink application running the windowed rollups of the notebook on the stream
+        # the aggregates are written to the data bucket under aggregates/, partitioned by date and hour
+        # -----------------------------------------------------------------------------------------------------------
+
+        if flink_application is not None:
+            ClickstreamFlinkApplication(self, "ClickstreamFlinkApplication",
+                stream=stream,
+                bucket=s3_bucket,
+                settings=flink_settings(flink_application),
+                default_parallelism=kinesis_stream["shard_count"] or 1,
+                consumer=stream_consumers.get(FLINK_CONSUMER),
+            )
+
+        # -----------------------------------------------------------------------------------------------------------
+        # defines the optional scheduled job compacting the small firehose objects into large parquet or json files
+        # -----------------------------------------------------------------------------------------------------------
+
+        if compaction_job is not None:
+            if parquet_delivery:
+                raise ValueError("compaction_job compacts the JSON objects of firehose, it can't be used with parquet_delivery")
+            CompactionJob(self, "CompactionJob",
+                cluster=cluster,
+                bucket=s3_bucket,
+                firehose_prefix=firehose_delivery["prefix"],
+                settings=compaction_settings(compaction_job),
+            )
         
         # Depending up on the choice of ingestion method create resources
         if data_capture_api_method == "api_gateway":
@@ -126,6 +308,7 @@ class AWSAnalyticsStack(Stack):
                 ),
                 policy=api_policy
             )
+            monitoring.add_rest_api(api)
             
 
             #creating cognito user pool
@@ -143,10 +326,33 @@ class AWSAnalyticsStack(Stack):
             auth = apigateway.CognitoUserPoolsAuthorizer(self, "requestAuthorizer",
             cognito_user_pools=[user_pool])
 
+            #Adding request validator to API GTW
+            request_validator = api.add_request_validator('test-validator',
+                request_validator_name='test-validator',
+                validate_request_body=True,
+                validate_request_parameters=True
+            )
+
+            # with event_projection the events are validated against the model of the canonical event and
+            # sent without the dropped fields, the mapping template writes the projected JSON to $projected
+            event_model = None
+            event_data = "$input.json('$')"
+            projection_template = ""
+            if event_projection:
+                event_model = api.add_model("EventModel",
+                    content_type="application/json",
+                    model_name="GAEvent",
+                    schema=api_gateway_json_schema(event_json_schema(event_projection)),
+                )
+                event_data = '"$projected"'
+                projection_template = "#set($event = $input.path('$'))\n" + api_gateway_projection_template(event_projection)
+
             # add mapping template to method
-            kinesis_template = '{"StreamName" :"'+ stream_name +'"'+""",
-                    "PartitionKey" : $input.json('$.ga_session_id'),
-                    "Data" : "$util.base64Encode($input.json('$'))"}"""
+            kinesis_template = projection_template + \
+                api_gateway_partition_key_template(partition_key_strategy, partition_key_salt) + \
+                '{"StreamName" :"'+ stream_name +'"'+""",
+                    "PartitionKey" : "$util.escapeJavaScript("$partitionKey")",
+                    "Data" : "$util.base64Encode(""" + event_data + """)"}"""
             
             # adding method to the API GTW with responses and translation templates
             method=api.root.add_method("POST", apigateway.AwsIntegration(
@@ -160,18 +366,83 @@ class AWSAnalyticsStack(Stack):
                     )
             ), 
                 authorizer=auth,
-                authorization_type=apigateway.AuthorizationType.COGNITO
+                authorization_type=apigateway.AuthorizationType.COGNITO,
+                request_models={"application/json": event_model} if event_model else None,
+                request_validator=request_validator if event_model else None,
             )
             # add method response that will essentially be the integration response passed through
             method.add_method_response(status_code='200', response_models={'application/json': apigateway.Model.EMPTY_MODEL})
             method.grant_execute(api_role)
 
-            #Adding request validator to API GTW
-            api.add_request_validator('test-validator',
-                request_validator_name='test-validator',
-                validate_request_body=True,
-                validate_request_parameters=True
+            # -----------------------------------------------------------------------------------------------------------
+            # defines POST /batch which takes a JSON array of events and sends them to kinesis with one PutRecords call
+            # the model caps the batch at the 500 records of PutRecords, kinesis itself rejects requests over 5 MB
+            # the response lists the outcome of every record so that the caller can resend only the failed ones
+            # -----------------------------------------------------------------------------------------------------------
+            batch_model = api.add_model("BatchEventsModel",
+                content_type="application/json",
+                model_name="BatchEvents",
+                schema=apigateway.JsonSchema(
+                    schema=apigateway.JsonSchemaVersion.DRAFT4,
+                    title="BatchEvents",
+                    type=apigateway.JsonSchemaType.ARRAY,
+                    min_items=1,
+                    max_items=500,
+                    items=api_gateway_json_schema(event_json_schema(event_projection)) if event_projection
+                    else apigateway.JsonSchema(type=apigateway.JsonSchemaType.OBJECT),
+                )
+            )
+
+            batch_template = '{"StreamName" :"'+ stream_name +'"'+""",
+                    "Records" : [
+                    #foreach($event in $input.path('$'))
+                    #set($index = $foreach.index)
+                    """ + api_gateway_partition_key_template(partition_key_strategy, partition_key_salt,
+                                                             event="$event", random_key="$context.requestId-$index") + \
+                    (api_gateway_projection_template(event_projection, path="$[$index]") if event_projection else "") + """
+                    {"Data" : "$util.base64Encode(""" + ('"$projected"' if event_projection else '$input.json("$[$index]")') + """)",
+                     "PartitionKey" : "$util.escapeJavaScript("$partitionKey")"}#if($foreach.hasNext),#end
+                    #end
+                    ]}"""
+
+            batch_response_template = """#set($response = $input.path('$'))
+                    {"FailedRecordCount" : $response.FailedRecordCount,
+                     "Records" : [
+                    #foreach($record in $response.Records)
+                    #if("$!record.ErrorCode" != "")
+                    {"Index" : $foreach.index, "ErrorCode" : "$record.ErrorCode", "ErrorMessage" : "$util.escapeJavaScript($record.ErrorMessage)"}#else
+                    {"Index" : $foreach.index, "ShardId" : "$record.ShardId", "SequenceNumber" : "$record.SequenceNumber"}#end#if($foreach.hasNext),#end
+                    #end
+                    ]}"""
+
+            batch_method = api.root.add_resource("batch").add_method("POST", apigateway.AwsIntegration(
+                service='kinesis',
+                action='PutRecords',
+                options=apigateway.IntegrationOptions(
+                    credentials_role=api_role,
+                    request_templates={"application/json": batch_template},
+                    integration_responses=[
+                        apigateway.IntegrationResponse(status_code="200",
+                            response_templates={"application/json": batch_response_template}),
+                        # e.g. a batch over the 5 MB PutRecords limit
+                        apigateway.IntegrationResponse(status_code="400", selection_pattern="4\\d{2}"),
+                        apigateway.IntegrationResponse(status_code="500", selection_pattern="5\\d{2}"),
+                    ],
+                    passthrough_behavior=apigateway.PassthroughBehavior.NEVER,
+                    )
+            ),
+                authorizer=auth,
+                authorization_type=apigateway.AuthorizationType.COGNITO,
+                request_models={"application/json": batch_model},
+                request_validator=request_validator,
+                method_responses=[
+                    apigateway.MethodResponse(status_code="200", response_models={'application/json': apigateway.Model.EMPTY_MODEL}),
+                    apigateway.MethodResponse(status_code="400", response_models={'application/json': apigateway.Model.ERROR_MODEL}),
+                    apigateway.MethodResponse(status_code="500", response_models={'application/json': apigateway.Model.ERROR_MODEL}),
+                ]
             )
+            batch_method.grant_execute(api_role)
+
             # add usage plan and api-key
             plan = api.add_usage_plan("GTagStackUsagePlan", name="GTagStackUsagePlan")
             plan.add_api_stage(stage=api.deployment_stage)
@@ -187,79 +458,111 @@ class AWSAnalyticsStack(Stack):
         else:
             # Producer service in the same cluster
             # cpu and memory min settings needed to avoid java heap error
-            # may need to set DOCKER_DEFAULT_PLATFORM=linux/amd64 before starting deploy
+            # the records buffered in the KPL are bounded by MAX_OUTSTANDING_RECORDS, see deployment/producer_settings.py
+            # may need to set DOCKER_DEFAULT_PLATFORM=linux/amd64 (linux/arm64 for ARM64) before starting deploy
             producer_task_definition = ecs.FargateTaskDefinition(self, "GTMproducerTaskDefinition", 
-                cpu=1024,
-                memory_limit_mib=2048,
-                runtime_platform=ecs.RuntimePlatform(cpu_architecture=ecs.CpuArchitecture.X86_64, operating_system_family=ecs.OperatingSystemFamily.LINUX)
+                cpu=capacity_plan.producer_cpu,
+                memory_limit_mib=capacity_plan.producer_memory_mib,
+                runtime_platform=ecs.RuntimePlatform(cpu_architecture=ecs.CpuArchitecture.of(producer_cpu_architecture), operating_system_family=ecs.OperatingSystemFamily.LINUX)
             )
 
             producer_task_definition.add_container("GTMproducerContainer",
                 image=ecs.ContainerImage.from_asset("source/producer",
-                    platform=Platform.LINUX_AMD64,
+                    platform=Platform.LINUX_ARM64 if producer_cpu_architecture == "ARM64" else Platform.LINUX_AMD64,
+                    # the image builds the jar itself, a local maven build would otherwise be hashed on every synth
+                    exclude=["target", ".idea", "*.iml"],
                     ),
                 environment= {
                     'REGION': region,
                     'STREAM_NAME': stream_name,
-                    'JAVA_TOOL_OPTIONS': '-XX:InitialHeapSize=1g -XX:MaxHeapSize=2g'
+                    'JAVA_TOOL_OPTIONS': capacity_plan.producer_java_tool_options,
+                    'PARTITION_KEY_STRATEGY': partition_key_strategy,
+                    'PARTITION_KEY_SALT': partition_key_salt,
+                    **backpressure_environment(self.node.try_get_context("producer_backpressure"),
+                                               capacity_plan.producer_max_outstanding_records),
+                    # KPL aggregation, batching and metrics settings, see deployment/producer_settings.py
+                    **kpl_environment(self.node.try_get_context("kpl_settings")),
+                    # sampled logging of the records instead of logging every payload
+                    **logging_environment(self.node.try_get_context("producer_logging")),
+                    # allow list projection and validation of the events, see deployment/event_schema.py
+                    **projection_environment(event_projection),
                 },
-                port_mappings=[ecs.PortMapping(container_port=8080, host_port=8080)],
+                port_mappings=[ecs.PortMapping(container_port=8080, host_port=8080, name=PRODUCER_PORT_NAME, app_protocol=ecs.AppProtocol.http)],
                 logging=producer_log_driver
             )
             gtm_producer_service = ecs.FargateService(self, "GTMproducerService",
                 service_name="GTMServerSideproducerService",
                 cluster=cluster,
                 task_definition=producer_task_definition,
-                desired_count=1,
+                desired_count=capacity_plan.producer_desired_count,
+                capacity_provider_strategies=fargate_capacity_provider_strategies(capacity_plan.producer_min_capacity, fargate_spot_weight),
+                service_connect_configuration=producer_configuration(service_connect, producer_dns) if service_connect else None,
             )
 
-            load_balancer.listeners[0].add_targets(
-                "GTMproducerServiceTargetGroup",
-                targets=[
-                    gtm_producer_service.load_balancer_target(
-                        container_name="GTMproducerContainer",
-                        container_port=8080
-                    )
-                ],
-                conditions=[elbv2.ListenerCondition.host_headers([producer_dns])],
-                priority=3,
-                protocol=elbv2.ApplicationProtocol.HTTP,
-                port=8080,
-                health_check=elbv2.HealthCheck(path="/healthcheck", protocol=elbv2.Protocol.HTTP,port="8080")
-            )
-
-            gtm_producer_service.connections.allow_from(
-                load_balancer.connections.security_groups[0],
-                # lb_security_group,
-                port_range=ec2.Port.tcp(8080),
-                description="Allow inbound traffic from ELB to producer Service"
+            # with service connect the load balancer path is optional, the primary tasks reach the producer in the namespace
+            load_balancer_path = not service_connect or service_connect["load_balancer_path"]
+            producer_target_group = None
+            if load_balancer_path:
+                producer_target_group = load_balancer.listeners[0].add_targets(
+                    "GTMproducerServiceTargetGroup",
+                    targets=[
+                        gtm_producer_service.load_balancer_target(
+                            container_name="GTMproducerContainer",
+                            container_port=8080
+                        )
+                    ],
+                    conditions=[elbv2.ListenerCondition.host_headers([producer_dns])],
+                    priority=3,
+                    protocol=elbv2.ApplicationProtocol.HTTP,
+                    port=8080,
+                    health_check=elbv2.HealthCheck(path="/healthcheck", protocol=elbv2.Protocol.HTTP,port="8080")
                 )
+                monitoring.add_target_groups({"Producer": producer_target_group})
+
+                gtm_producer_service.connections.allow_from(
+                    load_balancer.connections.security_groups[0],
+                    # lb_security_group,
+                    port_range=ec2.Port.tcp(8080),
+                    description="Allow inbound traffic from ELB to producer Service"
+                    )
+            if service_connect:
+                monitoring.add_service_connect("Producer", gtm_producer_service, PRODUCER_PORT_NAME)
+                # the proxies of the primary tasks connect to the producer tasks directly
+                gtm_producer_service.connections.allow_from(
+                    primary_security_group,
+                    port_range=ec2.Port.tcp(8080),
+                    description="Allow inbound traffic from the service connect clients to producer Service"
+                    )
+            monitoring.add_services({"Producer": gtm_producer_service})
             # -----------------------------------------------------------------------------------------------------------
             # defines the autoscaling configuration for producer service
+            # request count and response time policies scale ahead of cpu and memory, see deployment/autoscaling.py
             # -----------------------------------------------------------------------------------------------------------
 
             scalable_target = gtm_producer_service.auto_scale_task_count(
-                max_capacity=10,
-                min_capacity=1
+                max_capacity=capacity_plan.producer_max_capacity,
+                min_capacity=capacity_plan.producer_min_capacity
             )
 
-            scalable_target.scale_on_cpu_utilization("CpuScaling", 
-                target_utilization_percent=70 
-            )
-
-            scalable_target.scale_on_memory_utilization("MemoryScaling",
-                target_utilization_percent=70                
+            configure_service_scaling(scalable_target, producer_target_group,
+                cpu_target=70,
+                memory_target=70,
+                requests_per_target=capacity_plan.producer_requests_per_target,
+                settings=scaling_settings(self.node.try_get_context("producer_autoscaling"))
             )
 
             # Add cname to the existing hosted zone
-            CnameRecord(self, "GTMPreviewRecord",
-                record_name=producer_dns,
-                zone=hosted_zone,
-                domain_name=load_balancer.load_balancer_dns_name
-            )
+            if load_balancer_path:
+                CnameRecord(self, "GTMPreviewRecord",
+                    record_name=producer_dns,
+                    zone=hosted_zone,
+                    domain_name=load_balancer.load_balancer_dns_name
+                )
 
             # Connect the producer service to the kinesis stream
             stream.grant_read_write(gtm_producer_service.task_definition.task_role)
+            # the KPL publishes its metrics to the KinesisProducerLibrary namespace
+            cloudwatch.Metric.grant_put_metric_data(gtm_producer_service.task_definition.task_role)
 
             kinesis_endpoint = vpc.add_interface_endpoint("KinesisInterfaceEndpoint",
                 service=ec2.InterfaceVpcEndpointAwsService.KINESIS_STREAMS
@@ -0,0 +1,234 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Sizes both stacks from the peak event rate. app.py calls plan_capacity with the capacity_planning context:
+#   "capacity_planning": {"peak_events_per_second": 2000, "average_payload_bytes": 1600, "headroom": 1.5}
+# Without it the stacks use CapacityPlan(), which holds the sizing the stacks were built with.
+# The report can be printed without synthesizing the stacks:
+#   python -m deployment.capacity_planner --peak-events-per-second 2000 --average-payload-bytes 1600
+import argparse
+import json
+import math
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+MIB = 1024 * 1024
+
+# kinesis provisioned shard write limits
+SHARD_BYTES_PER_SECOND = 1 * MIB
+SHARD_RECORDS_PER_SECOND = 1000
+
+# approximate us-east-1 list prices, only used to choose between provisioned and on-demand streams
+SHARD_HOUR_PRICE = 0.015
+PUT_PAYLOAD_UNIT_PRICE = 0.014 / 1000000
+ON_DEMAND_STREAM_HOUR_PRICE = 0.04
+ON_DEMAND_GB_INGESTED_PRICE = 0.08
+HOURS_PER_MONTH = 730
+
+# fargate cpu units and the memory (MiB) used with them
+FARGATE_TASK_SIZES = [(256, 512), (512, 1024), (1024, 2048), (2048, 4096), (4096, 8192)]
+
+# events one vCPU handles at the scaling target, measure them with the benchmarks before relying on them
+GTM_EVENTS_PER_VCPU = 200
+PRODUCER_EVENTS_PER_VCPU = 1000
+# a bigger task size is picked once a service would need more tasks than this
+MAX_TASKS_PER_SERVICE = 20
+# share of the peak task count kept running at all times to absorb bursts while scaling out
+MIN_CAPACITY_FRACTION = 0.25
+
+# size assumed for a record buffered in the producer when the payload size is not known
+DEFAULT_PAYLOAD_BYTES = 2048
+# share of the producer heap the records buffered in the KPL may take
+PRODUCER_BUFFER_HEAP_FRACTION = 0.25
+
+# firehose buffering hint limits
+FIREHOSE_MIN_BUFFER_MB = 1
+FIREHOSE_MAX_BUFFER_MB = 128
+FIREHOSE_BUFFER_INTERVAL_SECONDS = 300
+
+
+@dataclass
+class CapacityPlan:
+    stream_mode: str = "PROVISIONED"
+    shard_count: Optional[int] = 1
+    primary_cpu: int = 512
+    primary_memory_mib: int = 1024
+    primary_desired_count: int = 3
+    primary_min_capacity: int = 2
+    primary_max_capacity: int = 10
+    producer_cpu: int = 1024
+    producer_memory_mib: int = 2048
+    producer_heap_initial_mib: int = 1024
+    producer_heap_max_mib: int = 2048
+    producer_desired_count: int = 1
+    producer_min_capacity: int = 1
+    producer_max_capacity: int = 10
+    # None keeps the defaults of the firehose construct
+    firehose_buffer_mb: Optional[int] = None
+    firehose_buffer_interval_seconds: Optional[int] = None
+    # inputs of the plan, kept for the report
+    peak_events_per_second: Optional[float] = None
+    average_payload_bytes: Optional[int] = None
+    headroom: Optional[float] = None
+
+    @property
+    def primary_requests_per_target(self):
+        # target of the ALBRequestCountPerTarget scaling, a sum per minute
+        return int(GTM_EVENTS_PER_VCPU * self.primary_cpu / 1024 * 60)
+
+    @property
+    def producer_requests_per_target(self):
+        return int(PRODUCER_EVENTS_PER_VCPU * self.producer_cpu / 1024 * 60)
+
+    @property
+    def producer_max_outstanding_records(self):
+        # records buffered in the KPL before the producer answers with 503
+        buffer_bytes = self.producer_heap_max_mib * MIB * PRODUCER_BUFFER_HEAP_FRACTION
+        return int(buffer_bytes // (self.average_payload_bytes or DEFAULT_PAYLOAD_BYTES))
+
+    @property
+    def producer_java_tool_options(self):
+        return f"-XX:InitialHeapSize={_jvm_size(self.producer_heap_initial_mib)} -XX:MaxHeapSize={_jvm_size(self.producer_heap_max_mib)}"
+
+
+def _jvm_size(mib):
+    return f"{mib // 1024}g" if mib % 1024 == 0 else f"{mib}m"
+
+
+def shards_needed(events_per_second, average_payload_bytes):
+    """
+    Shards needed to write the given rate, whichever of the byte or record limit is hit first
+    """
+    by_bytes = events_per_second * average_payload_bytes / SHARD_BYTES_PER_SECOND
+    by_records = events_per_second / SHARD_RECORDS_PER_SECOND
+    return max(1, math.ceil(max(by_bytes, by_records)))
+
+
+def monthly_stream_cost(stream_mode, shard_count, average_events_per_second, average_payload_bytes):
+    seconds_per_month = HOURS_PER_MONTH * 3600
+    if stream_mode == "ON_DEMAND":
+        gigabytes = average_events_per_second * average_payload_bytes * seconds_per_month / 1024 ** 3
+        return ON_DEMAND_STREAM_HOUR_PRICE * HOURS_PER_MONTH + ON_DEMAND_GB_INGESTED_PRICE * gigabytes
+    # a PUT payload unit is 25 KB
+    put_units = average_events_per_second * math.ceil(average_payload_bytes / 25600) * seconds_per_month
+    return SHARD_HOUR_PRICE * HOURS_PER_MONTH * shard_count + PUT_PAYLOAD_UNIT_PRICE * put_units
+
+
+def size_service(events_per_second, events_per_vcpu, min_size_index, min_floor):
+    """
+    Returns (cpu, memory_mib, min_capacity, max_capacity) of a service handling events_per_second at peak.
+    The task size starts at FARGATE_TASK_SIZES[min_size_index] and grows while the service needs more
+    than MAX_TASKS_PER_SERVICE tasks.
+    """
+    for index in range(min_size_index, len(FARGATE_TASK_SIZES)):
+        cpu, memory_mib = FARGATE_TASK_SIZES[index]
+        tasks = max(1, math.ceil(events_per_second / (events_per_vcpu * cpu / 1024)))
+        if tasks <= MAX_TASKS_PER_SERVICE:
+            break
+    min_capacity = max(min_floor, math.ceil(tasks * MIN_CAPACITY_FRACTION))
+    return cpu, memory_mib, min_capacity, max(tasks, min_capacity + 1)
+
+
+def firehose_buffer_mb(bytes_per_second, interval_seconds=FIREHOSE_BUFFER_INTERVAL_SECONDS):
+    """
+    Buffer size that fills in about the buffer interval, so objects are written by size at peak
+    and the interval only flushes the quiet periods
+    """
+    buffer_mb = math.ceil(bytes_per_second * interval_seconds / MIB)
+    return min(FIREHOSE_MAX_BUFFER_MB, max(FIREHOSE_MIN_BUFFER_MB, buffer_mb))
+
+
+def plan_capacity(peak_events_per_second, average_payload_bytes, headroom=1.5, stream_mode="auto",
+                  average_events_per_second=None):
+    """
+    Sizes the stream, the services and the firehose buffers for peak_events_per_second * headroom.
+    stream_mode is PROVISIONED, ON_DEMAND or auto. auto picks the cheaper mode for average_events_per_second
+    and stays provisioned when the average rate is not known.
+    """
+    if peak_events_per_second <= 0 or average_payload_bytes <= 0:
+        raise ValueError("peak_events_per_second and average_payload_bytes have to be positive")
+    if headroom < 1:
+        raise ValueError("headroom has to be at least 1")
+
+    design_events_per_second = peak_events_per_second * headroom
+    design_bytes_per_second = design_events_per_second * average_payload_bytes
+    shard_count = shards_needed(design_events_per_second, average_payload_bytes)
+
+    if stream_mode == "auto":
+        stream_mode = "PROVISIONED"
+        if average_events_per_second:
+            provisioned = monthly_stream_cost("PROVISIONED", shard_count, average_events_per_second, average_payload_bytes)
+            on_demand = monthly_stream_cost("ON_DEMAND", shard_count, average_events_per_second, average_payload_bytes)
+            stream_mode = "ON_DEMAND" if on_demand < provisioned else "PROVISIONED"
+    elif stream_mode not in ("PROVISIONED", "ON_DEMAND"):
+        raise ValueError(f"Unknown stream mode '{stream_mode}', use PROVISIONED, ON_DEMAND or auto")
+
+    primary_cpu, primary_memory, primary_min, primary_max = size_service(design_events_per_second, GTM_EVENTS_PER_VCPU, 1, 2)
+    producer_cpu, producer_memory, producer_min, producer_max = size_service(design_events_per_second, PRODUCER_EVENTS_PER_VCPU, 2, 1)
+
+    return CapacityPlan(
+        stream_mode=stream_mode,
+        shard_count=shard_count if stream_mode == "PROVISIONED" else None,
+        primary_cpu=primary_cpu,
+        primary_memory_mib=primary_memory,
+        # google recommends at least three servers for production traffic
+        primary_desired_count=max(3, primary_min),
+        primary_min_capacity=primary_min,
+        primary_max_capacity=primary_max,
+        producer_cpu=producer_cpu,
+        producer_memory_mib=producer_memory,
+        # the kinesis producer library runs a native daemon next to the JVM, half of the task memory is left to it
+        producer_heap_initial_mib=producer_memory // 4,
+        producer_heap_max_mib=producer_memory // 2,
+        producer_desired_count=producer_min,
+        producer_min_capacity=producer_min,
+        producer_max_capacity=producer_max,
+        firehose_buffer_mb=firehose_buffer_mb(design_bytes_per_second),
+        firehose_buffer_interval_seconds=FIREHOSE_BUFFER_INTERVAL_SECONDS,
+        peak_events_per_second=peak_events_per_second,
+        average_payload_bytes=average_payload_bytes,
+        headroom=headroom,
+    )
+
+
+def format_report(plan):
+    lines = ["Capacity plan"]
+    if plan.peak_events_per_second:
+        design = plan.peak_events_per_second * plan.headroom
+        lines.append(f"  input        peak {plan.peak_events_per_second:g} events/s x headroom {plan.headroom:g} = {design:g} events/s"
+                     f" of {plan.average_payload_bytes} bytes ({design * plan.average_payload_bytes / MIB:.2f} MiB/s)")
+    shards = f", {plan.shard_count} shards" if plan.shard_count else ""
+    lines.append(f"  kinesis      {plan.stream_mode}{shards}")
+    lines.append(f"  gtm primary  {plan.primary_cpu} cpu / {plan.primary_memory_mib} MiB, desired {plan.primary_desired_count},"
+                 f" min {plan.primary_min_capacity}, max {plan.primary_max_capacity}")
+    lines.append(f"  producer     {plan.producer_cpu} cpu / {plan.producer_memory_mib} MiB ({plan.producer_java_tool_options}),"
+                 f" desired {plan.producer_desired_count}, min {plan.producer_min_capacity}, max {plan.producer_max_capacity}")
+    if plan.firehose_buffer_mb:
+        lines.append(f"  firehose     buffer {plan.firehose_buffer_mb} MB / {plan.firehose_buffer_interval_seconds} s")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Size the stacks for a peak event rate")
+    parser.add_argument("--peak-events-per-second", type=float, required=True)
+    parser.add_argument("--average-payload-bytes", type=int, required=True)
+    parser.add_argument("--headroom", type=float, default=1.5)
+    parser.add_argument("--stream-mode", default="auto", choices=["auto", "PROVISIONED", "ON_DEMAND"])
+    parser.add_argument("--average-events-per-second", type=float)
+    parser.add_argument("--json", action="store_true", help="print the plan as the capacity_planning context would produce it")
+    args = parser.parse_args(argv)
+
+    plan = plan_capacity(args.peak_events_per_second, args.average_payload_bytes, args.headroom,
+                         args.stream_mode, args.average_events_per_second)
+    if args.json:
+        print(json.dumps(asdict(plan), indent=4))
+    else:
+        print(format_report(plan))
+
+
+if __name__ == "__main__":
+    main()
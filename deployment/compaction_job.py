@@ -0,0 +1,131 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Scheduled fargate task running analytics/compaction.py on the data bucket. It is deployed when the
+# compaction_job context value is set:
+#   {
+#     "schedule": "cron(20 * * * ? *)",
+#     "format": "parquet",
+#     "granularity": "hour",
+#     "target_file_mb": 512,
+#     "row_group_mb": 128,
+#     "settle_minutes": 15,
+#     "delete_source": false,
+#     "workers": 2,
+#     "cpu": 1024,
+#     "memory_mib": 4096
+#   }
+# The job compacts the JSON objects firehose writes under the static part of the firehose prefix into
+# compacted/, so it doesn't apply to parquet_delivery.
+import os
+from aws_cdk import (
+    RemovalPolicy,
+    aws_applicationautoscaling as appscaling,
+    aws_ecs as ecs,
+    aws_ecs_patterns as ecs_patterns,
+    aws_logs as logs,
+    aws_s3 as s3,
+)
+from constructs import Construct
+
+from analytics.compaction import (
+    DEFAULT_DESTINATION_PREFIX,
+    DEFAULT_ROW_GROUP_MB,
+    DEFAULT_SETTLE_MINUTES,
+    DEFAULT_TARGET_FILE_MB,
+    FORMATS,
+)
+
+DIRNAME = os.path.dirname(__file__)
+ANALYTICS_PATH = os.path.join(DIRNAME, "..", "analytics")
+
+DEFAULT_COMPACTION_SETTINGS = {
+    # every hour, once firehose flushed the buffers of the previous hour
+    "schedule": "cron(20 * * * ? *)",
+    # parquet, zstd-json or gzip-json
+    "format": "parquet",
+    # hour or day partitions
+    "granularity": "hour",
+    "target_file_mb": DEFAULT_TARGET_FILE_MB,
+    "row_group_mb": DEFAULT_ROW_GROUP_MB,
+    # partitions with objects younger than this are left for the next run
+    "settle_minutes": DEFAULT_SETTLE_MINUTES,
+    # keep the firehose objects unless the compacted files are the only copy needed
+    "delete_source": False,
+    # partitions compacted in parallel, each holds a row group in memory
+    "workers": 2,
+    "cpu": 1024,
+    "memory_mib": 4096,
+}
+
+
+def compaction_settings(context_settings):
+    settings = dict(DEFAULT_COMPACTION_SETTINGS)
+    settings.update(context_settings or {})
+    if settings["format"] not in FORMATS:
+        raise ValueError(f"Unknown compaction format '{settings['format']}', use one of {', '.join(FORMATS)}")
+    if settings["granularity"] not in ("hour", "day"):
+        raise ValueError("compaction granularity has to be hour or day")
+    return settings
+
+
+def source_prefix(firehose_prefix):
+    """
+    Returns the directory of the firehose prefix in front of its first expression, raw/ for raw/dt=!{...}/
+    """
+    static = firehose_prefix.split("!{")[0]
+    return static[:static.rfind("/") + 1]
+
+
+def compaction_command(settings, bucket_location, firehose_prefix):
+    command = [
+        bucket_location,
+        "--format", settings["format"],
+        "--granularity", settings["granularity"],
+        "--source-prefix", source_prefix(firehose_prefix),
+        "--destination-prefix", DEFAULT_DESTINATION_PREFIX,
+        "--target-file-mb", str(settings["target_file_mb"]),
+        "--row-group-mb", str(settings["row_group_mb"]),
+        "--settle-minutes", str(settings["settle_minutes"]),
+        "--workers", str(settings["workers"]),
+    ]
+    if settings["delete_source"]:
+        command.append("--delete-source")
+    return command
+
+
+class CompactionJob(Construct):
+
+    def __init__(self, scope: Construct, construct_id: str, cluster: ecs.ICluster, bucket: s3.IBucket,
+                 firehose_prefix: str, settings: dict) -> None:
+        super().__init__(scope, construct_id)
+
+        prefix = source_prefix(firehose_prefix)
+        if not prefix:
+            raise ValueError("The compaction job needs a firehose prefix with a static directory like raw/")
+
+        log_group = logs.LogGroup(self, "LogGroup", retention=logs.RetentionDays.ONE_MONTH,
+                                  removal_policy=RemovalPolicy.DESTROY)
+
+        self.task = ecs_patterns.ScheduledFargateTask(self, "Task",
+            cluster=cluster,
+            schedule=appscaling.Schedule.expression(settings["schedule"]),
+            scheduled_fargate_task_image_options=ecs_patterns.ScheduledFargateTaskImageOptions(
+                image=ecs.ContainerImage.from_asset(ANALYTICS_PATH, exclude=["__pycache__"]),
+                command=compaction_command(settings, f"s3://{bucket.bucket_name}", firehose_prefix),
+                cpu=settings["cpu"],
+                memory_limit_mib=settings["memory_mib"],
+                log_driver=ecs.AwsLogDriver(stream_prefix="GTMCompaction", log_group=log_group),
+            ),
+        )
+
+        task_role = self.task.task_definition.task_role
+        bucket.grant_read_write(task_role, f"{DEFAULT_DESTINATION_PREFIX}*")
+        if settings["delete_source"]:
+            bucket.grant_read_write(task_role, f"{prefix}*")
+        else:
+            bucket.grant_read(task_role, f"{prefix}*")
@@ -0,0 +1,133 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# CloudFront distribution in front of the primary gtm service. It is deployed when the cloudfront context
+# value is set:
+#   {
+#     "origin_domain_name": "origin-analytics.root.domain",
+#     "certificate_arn": "arn:aws:acm:us-east-1:111111111111:certificate/...",
+#     "domain_names": ["analytics.root.domain"],
+#     "script_paths": ["/gtag/js*", "/gtm.js*"],
+#     "script_default_ttl_seconds": 900,
+#     "script_max_ttl_seconds": 3600,
+#     "price_class": "PriceClass_All"
+#   }
+# The script paths are cached by their query string (container id, data layer name) and the preview header,
+# so preview sessions never get the published scripts. Every other path, like /g/collect, is forwarded uncached
+# with the viewer headers, cookies and query string the tagging server needs.
+# origin_domain_name has to resolve to the load balancer (a public CNAME) and be covered by ssl_cert_arn, the
+# viewer certificate has to be in us-east-1 and cover domain_names (primary_server_dns by default).
+# CloudFront adds a secret header to the origin requests and the load balancer only forwards requests of the
+# primary host carrying it, so the primary service only receives edge traffic.
+from aws_cdk import (
+    Duration,
+    aws_certificatemanager as acm,
+    aws_cloudfront as cloudfront,
+    aws_cloudfront_origins as origins,
+    aws_secretsmanager as secretsmanager,
+)
+from constructs import Construct
+
+DEFAULT_EDGE_SETTINGS = {
+    # public name of the load balancer covered by ssl_cert_arn, required
+    "origin_domain_name": None,
+    # certificate in us-east-1 of domain_names, ssl_cert_arn when the stack is deployed in us-east-1
+    "certificate_arn": None,
+    # None serves primary_server_dns
+    "domain_names": None,
+    "script_paths": ["/gtag/js*", "/gtm.js*"],
+    # used when the tagging server doesn't send a Cache-Control header
+    "script_default_ttl_seconds": 900,
+    "script_max_ttl_seconds": 3600,
+    "price_class": "PriceClass_All",
+}
+
+PRICE_CLASSES = {
+    "PriceClass_100": cloudfront.PriceClass.PRICE_CLASS_100,
+    "PriceClass_200": cloudfront.PriceClass.PRICE_CLASS_200,
+    "PriceClass_All": cloudfront.PriceClass.PRICE_CLASS_ALL,
+}
+ORIGIN_VERIFY_HEADER = "X-Origin-Verify"
+# sent by the gtm preview (tag assistant) sessions, their scripts differ from the published ones
+PREVIEW_HEADER = "X-Gtm-Server-Preview"
+
+
+def edge_settings(context_settings, stack_region=None, ssl_cert_arn=None):
+    settings = dict(DEFAULT_EDGE_SETTINGS)
+    settings.update(context_settings or {})
+    if not settings["origin_domain_name"]:
+        raise ValueError("cloudfront needs the origin_domain_name of the load balancer, covered by ssl_cert_arn")
+    if settings["price_class"] not in PRICE_CLASSES:
+        raise ValueError(f"Unknown price_class '{settings['price_class']}', use one of {', '.join(PRICE_CLASSES)}")
+    if not settings["certificate_arn"]:
+        if stack_region != "us-east-1":
+            raise ValueError("cloudfront needs a certificate_arn in us-east-1 when the stack isn't deployed in us-east-1")
+        settings["certificate_arn"] = ssl_cert_arn
+    return settings
+
+
+class GTMEdgeDistribution(Construct):
+
+    def __init__(self, scope: Construct, construct_id: str, settings: dict, domain_names: list) -> None:
+        super().__init__(scope, construct_id)
+
+        # rotate by changing the secret and deploying, the distribution and the listener rule read it on deploy
+        self.origin_verify_secret = secretsmanager.Secret(self, "OriginVerifySecret",
+            description="Value of the X-Origin-Verify header CloudFront sends to the gtm load balancer",
+            generate_secret_string=secretsmanager.SecretStringGenerator(exclude_punctuation=True, password_length=32),
+        )
+        self.origin_verify_value = self.origin_verify_secret.secret_value.unsafe_unwrap()
+
+        origin = origins.HttpOrigin(settings["origin_domain_name"],
+            protocol_policy=cloudfront.OriginProtocolPolicy.HTTPS_ONLY,
+            custom_headers={ORIGIN_VERIFY_HEADER: self.origin_verify_value},
+        )
+
+        script_cache_policy = cloudfront.CachePolicy(self, "ScriptCachePolicy",
+            comment="gtm scripts by query string and preview header",
+            default_ttl=Duration.seconds(settings["script_default_ttl_seconds"]),
+            max_ttl=Duration.seconds(settings["script_max_ttl_seconds"]),
+            min_ttl=Duration.seconds(0),
+            query_string_behavior=cloudfront.CacheQueryStringBehavior.all(),
+            header_behavior=cloudfront.CacheHeaderBehavior.allow_list(PREVIEW_HEADER),
+            cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+            enable_accept_encoding_gzip=True,
+            enable_accept_encoding_brotli=True,
+        )
+        # the load balancer routes the primary service by host header
+        script_origin_request_policy = cloudfront.OriginRequestPolicy(self, "ScriptOriginRequestPolicy",
+            comment="host header for the load balancer rules",
+            header_behavior=cloudfront.OriginRequestHeaderBehavior.allow_list("Host"),
+            query_string_behavior=cloudfront.OriginRequestQueryStringBehavior.all(),
+            cookie_behavior=cloudfront.OriginRequestCookieBehavior.none(),
+        )
+        script_behavior = cloudfront.BehaviorOptions(
+            origin=origin,
+            viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+            allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD,
+            cache_policy=script_cache_policy,
+            origin_request_policy=script_origin_request_policy,
+            compress=True,
+        )
+
+        self.distribution = cloudfront.Distribution(self, "Distribution",
+            comment="Google Tag Manager server side container",
+            domain_names=domain_names,
+            certificate=acm.Certificate.from_certificate_arn(self, "Certificate", settings["certificate_arn"]),
+            minimum_protocol_version=cloudfront.SecurityPolicyProtocol.TLS_V1_2_2021,
+            http_version=cloudfront.HttpVersion.HTTP2_AND_3,
+            price_class=PRICE_CLASSES[settings["price_class"]],
+            # collection hits carry cookies and client hints, they are forwarded uncached
+            default_behavior=cloudfront.BehaviorOptions(
+                origin=origin,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_ALL,
+                cache_policy=cloudfront.CachePolicy.CACHING_DISABLED,
+                origin_request_policy=cloudfront.OriginRequestPolicy.ALL_VIEWER_AND_CLOUDFRONT_2022,
+            ),
+            additional_behaviors={path: script_behavior for path in settings["script_paths"]},
+        )
@@ -0,0 +1,248 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Derives the Glue table schema of the GA events from the canonical event shape in assets/GA-sample.json.
+# The column types of the flink notebook (click_stream_live_stream) take precedence over the inferred ones
+# so that both the Athena table and the flink table read the same values the same way.
+#
+# The same shape gives the projection of both ingestion paths, enabled by the event_projection context value
+# (true takes the defaults):
+#   {
+#     "drop_fields": ["client_hints.full_version_list", "client_hints.brands"],
+#     "allow_list": true,
+#     "required_fields": ["event_name", "client_id"]
+#   }
+# Events that aren't JSON objects or miss a required field are rejected with 400, the others are sent without
+# the dropped fields and, with allow_list, only with the top level fields of the canonical event (the columns of
+# the events table). The projection is implemented by project_event, the api gateway mapping template below and
+# the producer (source/producer/.../EventProjection.java), keep them in sync. The api gateway model only checks
+# what the projection checks, so both paths reject the same events.
+import copy
+import json
+import os
+
+from aws_cdk import aws_apigateway as apigateway
+
+DIRNAME = os.path.dirname(__file__)
+SAMPLE_EVENT_PATH = os.path.join(DIRNAME, "..", "assets", "GA-sample.json")
+
+# numeric columns as declared in source/Gtag_ServerSide_Clickstream_Agg_Flink.ipynb
+# GA sends them as strings, the JSON serde of the format conversion casts them
+COLUMN_TYPE_OVERRIDES = {
+    "x-ga-page_id": "bigint",
+    "x-ga-request_count": "int",
+    "ga_session_number": "int",
+    "x-ga-tfd": "int",
+    "engagement_time_msec": "int",
+}
+
+# event_name is taken out of the record and used as the first level of the S3 prefix
+PARTITION_KEYS = [
+    {"name": "event_name", "type": "string"},
+    {"name": "dt", "type": "string"},
+    {"name": "hr", "type": "string"},
+]
+
+
+def load_sample_event(path=SAMPLE_EVENT_PATH):
+    with open(path) as sample:
+        return json.load(sample)
+
+
+def column_name(key):
+    # glue/athena column names are lower case and cannot contain dashes
+    return key.replace("-", "_").lower()
+
+
+def hive_type(value):
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "bigint"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, dict):
+        fields = ",".join(f"{column_name(k)}:{hive_type(v)}" for k, v in value.items())
+        return f"struct<{fields}>"
+    if isinstance(value, list):
+        # the element type is taken from the first element, GA arrays are homogeneous
+        return f"array<{hive_type(value[0]) if value else 'string'}>"
+    return "string"
+
+
+def glue_columns(event=None):
+    """
+    Returns the non partition columns of the events table as a list of {"name", "type", "json_key"}
+    """
+    event = load_sample_event() if event is None else event
+    partition_names = {key["name"] for key in PARTITION_KEYS}
+    columns = []
+    for key, value in event.items():
+        if column_name(key) in partition_names:
+            continue
+        columns.append({
+            "name": column_name(key),
+            "type": COLUMN_TYPE_OVERRIDES.get(key, hive_type(value)),
+            "json_key": key,
+        })
+    return columns
+
+
+def json_key_mappings(columns):
+    """
+    Column to JSON key mappings for the OpenX JSON serde, only needed where the GA key is not a valid column name
+    """
+    return {column["name"]: column["json_key"] for column in columns if column["name"] != column["json_key"]}
+
+
+DEFAULT_PROJECTION_SETTINGS = {
+    # dotted paths removed from every event, the brand lists repeat what user_agent already says
+    "drop_fields": ["client_hints.full_version_list", "client_hints.brands"],
+    # keeps only the top level fields of the canonical event, custom parameters are dropped
+    "allow_list": True,
+    # events without a non empty scalar value for these fields are rejected
+    "required_fields": ["event_name", "client_id"],
+}
+
+
+def projection_settings(context_settings):
+    """
+    None when event_projection isn't set or false
+    """
+    if not context_settings:
+        return None
+    settings = dict(DEFAULT_PROJECTION_SETTINGS)
+    if isinstance(context_settings, dict):
+        settings.update(context_settings)
+    for path in settings["drop_fields"]:
+        if path.count(".") > 1:
+            raise ValueError(f"drop_fields path '{path}' is nested too deep, use <field> or <field>.<child>")
+    dropped = set(settings["drop_fields"])
+    for field in settings["required_fields"]:
+        if field in dropped:
+            raise ValueError(f"required field '{field}' can't be dropped")
+    return settings
+
+
+def _drop(event, drop_fields):
+    for path in drop_fields:
+        parent, _, child = path.partition(".")
+        if not child:
+            event.pop(parent, None)
+        elif isinstance(event.get(parent), dict):
+            event[parent] = {key: value for key, value in event[parent].items() if key != child}
+    return event
+
+
+def projected_shape(settings, event=None):
+    """
+    The canonical event without the dropped fields
+    """
+    event = copy.deepcopy(load_sample_event() if event is None else event)
+    return _drop(event, settings["drop_fields"])
+
+
+def project_event(event, settings, allowed_fields=None):
+    """
+    Returns the projected event, raises ValueError for malformed events.
+    allowed_fields defaults to the top level fields of the canonical event.
+    """
+    if not isinstance(event, dict):
+        raise ValueError("event is not a JSON object")
+    for field in settings["required_fields"]:
+        value = event.get(field)
+        if value is None or value == "" or isinstance(value, (dict, list)):
+            raise ValueError(f"event has no value for required field '{field}'")
+    if settings["allow_list"]:
+        allowed = set(projected_shape(settings)) if allowed_fields is None else set(allowed_fields)
+        event = {key: value for key, value in event.items() if key in allowed}
+    else:
+        event = dict(event)
+    return _drop(event, settings["drop_fields"])
+
+
+def event_json_schema(settings):
+    """
+    Draft 4 JSON schema with the checks of project_event, so the api gateway model and the producer reject the
+    same events: a JSON object with a non empty scalar value for the required fields. The other fields aren't
+    typed, the projection passes any value (null included) through.
+    """
+    return {
+        "$schema": "http://json-schema.org/draft-04/schema#",
+        "title": "GAEvent",
+        "type": "object",
+        "required": list(settings["required_fields"]),
+        # minLength only applies to strings, GA sends most values as strings and other clients numbers or booleans
+        "properties": {field: {"type": ["string", "number", "boolean"], "minLength": 1}
+                       for field in settings["required_fields"]},
+    }
+
+
+def api_gateway_json_schema(schema):
+    """
+    apigateway.JsonSchema of a JSON schema dict
+    """
+    types = schema.get("type")
+    if isinstance(types, list):
+        types = [apigateway.JsonSchemaType[value.upper()] for value in types]
+    elif types is not None:
+        types = apigateway.JsonSchemaType[types.upper()]
+    return apigateway.JsonSchema(
+        schema=apigateway.JsonSchemaVersion.DRAFT4 if "$schema" in schema else None,
+        title=schema.get("title"),
+        type=types,
+        required=schema.get("required"),
+        min_length=schema.get("minLength"),
+        min_items=schema.get("minItems"),
+        max_items=schema.get("maxItems"),
+        properties={key: api_gateway_json_schema(child) for key, child in schema["properties"].items()}
+        if "properties" in schema else None,
+        items=api_gateway_json_schema(schema["items"]) if "items" in schema else None,
+    )
+
+
+def api_gateway_projection_template(settings, event="$event", path="$"):
+    """
+    Returns the velocity statements that define $projected, the projected JSON of the event, in an api gateway
+    mapping template. event is the velocity reference of the event and path its JSONPath, e.g. $[$index] in a
+    batch. The required fields are checked by the model of the method.
+    """
+    dropped_children = {}
+    dropped_fields = []
+    for drop_path in settings["drop_fields"]:
+        parent, _, child = drop_path.partition(".")
+        if child:
+            dropped_children.setdefault(parent, []).append(child)
+        else:
+            dropped_fields.append(parent)
+
+    def quoted(names):
+        return "[" + ",".join(f'"{name}"' for name in names) + "]"
+
+    # the objects with dropped children are written child by child, the other fields are copied as they are
+    field = (
+        f'#if($dropped.containsKey($key) && $input.json("{path}[\'$key\']").startsWith("{{"))'
+        '$separator"$key":{#set($childSeparator = "")'
+        f'#foreach($child in {event}.get($key).keySet())'
+        '#if(!$dropped.get($key).contains($child))'
+        f'$childSeparator"$child":$input.json("{path}[\'$key\'][\'$child\']")#set($childSeparator = ",")'
+        '#end#end}'
+        '#{else}'
+        f'$separator"$key":$input.json("{path}[\'$key\']")'
+        '#end#set($separator = ",")'
+    )
+    if settings["allow_list"]:
+        keys = [key for key in projected_shape(settings)]
+        loop = f'#foreach($key in {quoted(keys)})#if({event}.containsKey($key)){field}#end#end'
+    else:
+        loop = f'#foreach($key in {event}.keySet())#if(!$droppedFields.contains($key)){field}#end#end'
+    dropped = "{" + ",".join(f'"{parent}":{quoted(children)}' for parent, children in dropped_children.items()) + "}"
+    return (
+        f"#set($dropped = {dropped})\n"
+        f"#set($droppedFields = {quoted(dropped_fields)})\n"
+        f'#define($projected){{#set($separator = ""){loop}}}#end\n'
+    )
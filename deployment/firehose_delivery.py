@@ -0,0 +1,104 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# S3 destination settings of the firehose delivery stream, read from the firehose_delivery context value:
+#   {
+#     "buffer_mb": 64,
+#     "buffer_interval_seconds": 300,
+#     "compression": "GZIP",
+#     "newline_delimiter": true,
+#     "prefix": "raw/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/",
+#     "error_prefix": "errors/!{firehose:error-output-type}/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/"
+#   }
+# Bigger buffers write fewer and bigger objects, which keeps S3 listing and reads fast and cheap.
+# With parquet_delivery the compression applies to the parquet pages and the prefix is the one of the glue table.
+from deployment.capacity_planner import FIREHOSE_MAX_BUFFER_MB, FIREHOSE_MIN_BUFFER_MB
+
+DEFAULT_FIREHOSE_SETTINGS = {
+    # None takes the buffer of the capacity plan, or 64 MB / 300 s without one
+    "buffer_mb": None,
+    "buffer_interval_seconds": None,
+    # None is GZIP for json objects and SNAPPY for parquet
+    "compression": None,
+    # firehose concatenates the records, the delimiter makes the objects newline delimited JSON
+    "newline_delimiter": True,
+    "prefix": "raw/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/",
+    "error_prefix": "errors/!{firehose:error-output-type}/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/",
+}
+
+DEFAULT_BUFFER_MB = 64
+DEFAULT_BUFFER_INTERVAL_SECONDS = 300
+MAX_BUFFER_INTERVAL_SECONDS = 900
+# format conversion and dynamic partitioning need a buffer of at least 64 MB
+PARQUET_MIN_BUFFER_MB = 64
+
+# object compression of the S3 destination
+COMPRESSION_FORMATS = ("UNCOMPRESSED", "GZIP", "ZIP", "Snappy", "HADOOP_SNAPPY")
+# page compression of the parquet serde
+PARQUET_COMPRESSION_FORMATS = ("UNCOMPRESSED", "GZIP", "SNAPPY")
+
+
+def firehose_settings(context_settings):
+    settings = dict(DEFAULT_FIREHOSE_SETTINGS)
+    settings.update(context_settings or {})
+    return settings
+
+
+def _validate(settings, parquet):
+    compression = settings["compression"]
+    formats = PARQUET_COMPRESSION_FORMATS if parquet else COMPRESSION_FORMATS
+    if compression is not None and compression not in formats:
+        raise ValueError(f"Unknown firehose compression '{compression}', use one of {', '.join(formats)}."
+                         " Firehose doesn't write ZSTD objects, use parquet_delivery or the compaction job for it")
+
+    buffer_mb = settings["buffer_mb"]
+    if buffer_mb is not None and not FIREHOSE_MIN_BUFFER_MB <= buffer_mb <= FIREHOSE_MAX_BUFFER_MB:
+        raise ValueError(f"buffer_mb has to be between {FIREHOSE_MIN_BUFFER_MB} and {FIREHOSE_MAX_BUFFER_MB}")
+    interval = settings["buffer_interval_seconds"]
+    if interval is not None and not 0 <= interval <= MAX_BUFFER_INTERVAL_SECONDS:
+        raise ValueError(f"buffer_interval_seconds has to be between 0 and {MAX_BUFFER_INTERVAL_SECONDS}")
+
+
+def s3_destination(settings, capacity_plan, parquet=False):
+    """
+    Returns the camel case extendedS3DestinationConfiguration passed to the solutions construct.
+    With parquet the record format conversion, its prefix and processors are added by the stack.
+    """
+    _validate(settings, parquet)
+
+    buffer_mb = settings["buffer_mb"] or capacity_plan.firehose_buffer_mb or DEFAULT_BUFFER_MB
+    interval = settings["buffer_interval_seconds"]
+    if interval is None:
+        interval = capacity_plan.firehose_buffer_interval_seconds or DEFAULT_BUFFER_INTERVAL_SECONDS
+
+    destination = {
+        "bufferingHints": {
+            "intervalInSeconds": interval,
+            "sizeInMBs": max(PARQUET_MIN_BUFFER_MB, buffer_mb) if parquet else buffer_mb,
+        },
+        "errorOutputPrefix": settings["error_prefix"],
+    }
+    if parquet:
+        # parquet files are compressed by the serde, the object level compression has to be turned off
+        destination["compressionFormat"] = "UNCOMPRESSED"
+        return destination
+
+    destination["compressionFormat"] = settings["compression"] or "GZIP"
+    destination["prefix"] = settings["prefix"]
+    if settings["newline_delimiter"]:
+        destination["processingConfiguration"] = {
+            "enabled": True,
+            "processors": [{
+                "type": "AppendDelimiterToRecord",
+                "parameters": [{"parameterName": "Delimiter", "parameterValue": "\\n"}],
+            }],
+        }
+    return destination
+
+
+def parquet_compression(settings):
+    return settings["compression"] or "SNAPPY"
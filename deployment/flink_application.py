@@ -0,0 +1,174 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Managed Service for Apache Flink application running the windowed notebook rollups of source/flink on the
+# kinesis stream. It is deployed when the flink_application context value is set:
+#   {
+#     "parallelism": 2,
+#     "parallelism_per_kpu": 1,
+#     "autoscaling": true,
+#     "window_seconds": 60,
+#     "slide_seconds": null,
+#     "watermark_seconds": 5,
+#     "initial_position": "LATEST"
+#   }
+# Without a parallelism the application runs one task per shard of the stream. With a consumer (the flink
+# consumer of deployment/kinesis_stream.py) the source reads with enhanced fan-out instead of polling the shards.
+# The application code is bundled in docker (like the producer image), the connector jar is downloaded with maven.
+import os
+from aws_cdk import (
+    BundlingOptions,
+    DockerImage,
+    RemovalPolicy,
+    Stack,
+    aws_iam as iam,
+    aws_kinesis as kds,
+    aws_kinesisanalytics as kda,
+    aws_logs as logs,
+    aws_s3 as s3,
+    aws_s3_assets as s3_assets,
+)
+from constructs import Construct
+
+DIRNAME = os.path.dirname(__file__)
+FLINK_SOURCE_PATH = os.path.join(DIRNAME, "..", "source", "flink")
+RUNTIME_ENVIRONMENT = "FLINK-1_18"
+CONNECTOR_JAR = "lib/flink-sql-connector-kinesis-4.2.0-1.18.jar"
+OUTPUT_PREFIX = "aggregates/page_session_event_counts"
+
+DEFAULT_FLINK_SETTINGS = {
+    # None runs one task per shard
+    "parallelism": None,
+    "parallelism_per_kpu": 1,
+    "autoscaling": True,
+    "window_seconds": 60,
+    # sliding windows of window_seconds every slide_seconds, tumbling windows if not set
+    "slide_seconds": None,
+    # how far events may arrive out of order
+    "watermark_seconds": 5,
+    "initial_position": "LATEST",
+}
+
+
+def flink_settings(context_settings):
+    settings = dict(DEFAULT_FLINK_SETTINGS)
+    settings.update(context_settings or {})
+    return settings
+
+
+class ClickstreamFlinkApplication(Construct):
+
+    def __init__(self, scope: Construct, construct_id: str, stream: kds.IStream, bucket: s3.IBucket,
+                 settings: dict, default_parallelism: int = 1, consumer: kds.CfnStreamConsumer = None) -> None:
+        super().__init__(scope, construct_id)
+        stack = Stack.of(self)
+
+        code = s3_assets.Asset(self, "Code",
+            path=FLINK_SOURCE_PATH,
+            exclude=["application_properties.json"],
+            bundling=BundlingOptions(
+                image=DockerImage.from_registry("public.ecr.aws/docker/library/maven:3.8.7-amazoncorretto-11"),
+                command=["bash", "-c", " && ".join([
+                    "cp -r /asset-input /tmp/flink",
+                    "mvn -q -f /tmp/flink/pom.xml dependency:copy-dependencies -DexcludeTransitive=true"
+                    " -DoutputDirectory=/tmp/flink/lib -Dmaven.repo.local=/tmp/m2",
+                    "cp -r /tmp/flink/main.py /tmp/flink/sql /tmp/flink/lib /asset-output/",
+                ])],
+            ),
+        )
+
+        role = iam.Role(self, "Role", assumed_by=iam.ServicePrincipal("kinesisanalytics.amazonaws.com"))
+        stream.grant_read(role)
+        bucket.grant_read_write(role, f"{OUTPUT_PREFIX}/*")
+        code.grant_read(role)
+
+        log_group = logs.LogGroup(self, "LogGroup", removal_policy=RemovalPolicy.DESTROY)
+        log_stream = logs.LogStream(self, "LogStream", log_group=log_group, removal_policy=RemovalPolicy.DESTROY)
+        log_group.grant_write(role)
+        role.add_to_policy(iam.PolicyStatement(
+            actions=["logs:DescribeLogGroups", "logs:DescribeLogStreams"],
+            resources=[log_group.log_group_arn],
+        ))
+
+        application_properties = {
+            "stream_name": stream.stream_name,
+            "region": stack.region,
+            "initial_position": settings["initial_position"],
+            "bucket_name": bucket.bucket_name,
+            "output_prefix": OUTPUT_PREFIX,
+            "window_seconds": str(settings["window_seconds"]),
+            "watermark_seconds": str(settings["watermark_seconds"]),
+        }
+        # property values cannot be empty
+        if settings["slide_seconds"]:
+            application_properties["slide_seconds"] = str(settings["slide_seconds"])
+        if consumer is not None:
+            # registered by the stack, the connector only subscribes to it
+            application_properties["efo_consumer_name"] = consumer.consumer_name
+            application_properties["efo_consumer_arn"] = consumer.attr_consumer_arn
+            role.add_to_policy(iam.PolicyStatement(
+                actions=["kinesis:SubscribeToShard", "kinesis:DescribeStreamConsumer"],
+                resources=[consumer.attr_consumer_arn],
+            ))
+
+        self.application = kda.CfnApplicationV2(self, "Application",
+            application_name="GTMClickstreamAggregation",
+            runtime_environment=RUNTIME_ENVIRONMENT,
+            service_execution_role=role.role_arn,
+            application_configuration=kda.CfnApplicationV2.ApplicationConfigurationProperty(
+                application_code_configuration=kda.CfnApplicationV2.ApplicationCodeConfigurationProperty(
+                    code_content_type="ZIPFILE",
+                    code_content=kda.CfnApplicationV2.CodeContentProperty(
+                        s3_content_location=kda.CfnApplicationV2.S3ContentLocationProperty(
+                            bucket_arn=code.bucket.bucket_arn,
+                            file_key=code.s3_object_key,
+                        ),
+                    ),
+                ),
+                application_snapshot_configuration=kda.CfnApplicationV2.ApplicationSnapshotConfigurationProperty(
+                    snapshots_enabled=True,
+                ),
+                flink_application_configuration=kda.CfnApplicationV2.FlinkApplicationConfigurationProperty(
+                    checkpoint_configuration=kda.CfnApplicationV2.CheckpointConfigurationProperty(
+                        configuration_type="DEFAULT",
+                    ),
+                    monitoring_configuration=kda.CfnApplicationV2.MonitoringConfigurationProperty(
+                        configuration_type="CUSTOM",
+                        log_level="WARN",
+                        metrics_level="TASK",
+                    ),
+                    parallelism_configuration=kda.CfnApplicationV2.ParallelismConfigurationProperty(
+                        configuration_type="CUSTOM",
+                        parallelism=settings["parallelism"] or default_parallelism,
+                        parallelism_per_kpu=settings["parallelism_per_kpu"],
+                        auto_scaling_enabled=settings["autoscaling"],
+                    ),
+                ),
+                environment_properties=kda.CfnApplicationV2.EnvironmentPropertiesProperty(
+                    property_groups=[
+                        kda.CfnApplicationV2.PropertyGroupProperty(
+                            property_group_id="kinesis.analytics.flink.run.options",
+                            property_map={"python": "main.py", "jarfile": CONNECTOR_JAR},
+                        ),
+                        # read by source/flink/main.py
+                        kda.CfnApplicationV2.PropertyGroupProperty(
+                            property_group_id="FlinkApplicationProperties",
+                            property_map=application_properties,
+                        ),
+                    ],
+                ),
+            ),
+        )
+        self.application.node.add_dependency(role)
+
+        kda.CfnApplicationCloudWatchLoggingOptionV2(self, "Logging",
+            application_name=self.application.ref,
+            cloud_watch_logging_option=kda.CfnApplicationCloudWatchLoggingOptionV2.CloudWatchLoggingOptionProperty(
+                log_stream_arn=f"arn:{stack.partition}:logs:{stack.region}:{stack.account}:log-group:"
+                               f"{log_group.log_group_name}:log-stream:{log_stream.log_stream_name}",
+            ),
+        )
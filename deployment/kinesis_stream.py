@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Mode, size, retention and enhanced fan-out consumers of the kinesis stream, read from the kinesis_stream
+# context value:
+#   {
+#     "stream_mode": "ON_DEMAND",
+#     "shard_count": null,
+#     "retention_hours": 24,
+#     "consumers": ["flink"]
+#   }
+# stream_mode and shard_count override the capacity plan (deployment/capacity_planner.py).
+# Firehose polls the shards with GetRecords and shares their 2 MB/s of reads with every other polling reader.
+# Each consumer registered here gets its own 2 MB/s per shard pushed with SubscribeToShard, so a real time
+# reader doesn't slow the delivery to S3 down. The flink application reads through the consumer named flink,
+# the consumer ARNs are stack outputs for the readers deployed outside of the stack.
+from aws_cdk import (
+    CfnOutput,
+    Duration,
+    aws_kinesis as kds,
+)
+from constructs import Construct
+
+DEFAULT_STREAM_SETTINGS = {
+    # PROVISIONED or ON_DEMAND, None keeps the mode of the capacity plan
+    "stream_mode": None,
+    # shards of a provisioned stream, None keeps the shard count of the capacity plan
+    "shard_count": None,
+    # 24 hours to 365 days, the replay tool (analytics/replay.py) covers what is older
+    "retention_hours": 24,
+    # names of the enhanced fan-out consumers, at most 20 per stream
+    "consumers": [],
+}
+
+STREAM_MODES = ("PROVISIONED", "ON_DEMAND")
+MIN_RETENTION_HOURS = 24
+MAX_RETENTION_HOURS = 8760
+MAX_CONSUMERS = 20
+# consumer the flink application reads through when it is registered
+FLINK_CONSUMER = "flink"
+
+
+def stream_settings(context_settings, capacity_plan):
+    """
+    Settings with the stream_mode and shard_count resolved against the capacity plan
+    """
+    settings = dict(DEFAULT_STREAM_SETTINGS)
+    settings.update(context_settings or {})
+    settings["stream_mode"] = settings["stream_mode"] or capacity_plan.stream_mode
+    if settings["stream_mode"] not in STREAM_MODES:
+        raise ValueError(f"Unknown stream_mode '{settings['stream_mode']}', use one of {', '.join(STREAM_MODES)}")
+    if settings["stream_mode"] == "ON_DEMAND":
+        if (context_settings or {}).get("shard_count"):
+            raise ValueError("shard_count can't be set for an ON_DEMAND stream")
+        settings["shard_count"] = None
+    else:
+        settings["shard_count"] = settings["shard_count"] or capacity_plan.shard_count or 1
+    if not MIN_RETENTION_HOURS <= settings["retention_hours"] <= MAX_RETENTION_HOURS:
+        raise ValueError(f"retention_hours has to be between {MIN_RETENTION_HOURS} and {MAX_RETENTION_HOURS}")
+    if len(settings["consumers"]) > MAX_CONSUMERS or len(set(settings["consumers"])) != len(settings["consumers"]):
+        raise ValueError(f"consumers has to list at most {MAX_CONSUMERS} distinct names")
+    return settings
+
+
+def add_consumers(scope: Construct, stream: kds.IStream, names: list) -> dict:
+    """
+    Registers an enhanced fan-out consumer per name, returns the CfnStreamConsumer by name
+    """
+    consumers = {}
+    for name in names:
+        consumers[name] = kds.CfnStreamConsumer(scope, f"StreamConsumer{name}",
+            consumer_name=name,
+            stream_arn=stream.stream_arn,
+        )
+        CfnOutput(scope, f"StreamConsumer{name}Arn", value=consumers[name].attr_consumer_arn,
+            description=f"ARN of the {name} enhanced fan-out consumer")
+    return consumers
+
+
+def stream_props(settings: dict) -> dict:
+    return {
+        "stream_mode": kds.StreamMode(settings["stream_mode"]),
+        "shard_count": settings["shard_count"],
+        "retention_period": Duration.hours(settings["retention_hours"]),
+    }
@@ -0,0 +1,211 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Dashboard and alarms of the hot path, one per stack: load balancer target groups and gtm services in
+# ServerSideTaggerStack, producer (target group or service connect) or api gateway, kinesis stream and firehose
+# in AWSAnalyticsStack.
+# The alarm thresholds are read from the monitoring context value:
+#   {
+#     "target_response_time_p99_seconds": 1,
+#     "target_5xx_per_minute": 10,
+#     "service_cpu_percent": 85,
+#     "service_memory_percent": 85,
+#     "write_throughput_exceeded_per_minute": 0,
+#     "iterator_age_seconds": 60,
+#     "firehose_data_freshness_seconds": 900,
+#     "api_latency_p99_ms": 1000,
+#     "evaluation_periods": 3,
+#     "alarm_topic_arn": null
+#   }
+# A threshold set to false removes its alarms. With alarm_topic_arn the alarms notify the SNS topic.
+from aws_cdk import (
+    Duration,
+    aws_apigateway as apigateway,
+    aws_cloudwatch as cloudwatch,
+    aws_cloudwatch_actions as cloudwatch_actions,
+    aws_ecs as ecs,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_kinesis as kds,
+    aws_sns as sns,
+)
+from constructs import Construct
+
+DEFAULT_MONITORING_SETTINGS = {
+    # p99 response time of the targets of a target group
+    "target_response_time_p99_seconds": 1,
+    "target_5xx_per_minute": 10,
+    # average of the tasks of a service
+    "service_cpu_percent": 85,
+    "service_memory_percent": 85,
+    # records rejected by the stream, rejections minute after minute mean the stream needs more shards
+    "write_throughput_exceeded_per_minute": 0,
+    # how far firehose and the other consumers are behind the stream
+    "iterator_age_seconds": 60,
+    # age of the oldest record not yet in S3, above the buffer interval when delivery lags
+    "firehose_data_freshness_seconds": 900,
+    "api_latency_p99_ms": 1000,
+    # consecutive minutes above the threshold before an alarm goes off
+    "evaluation_periods": 3,
+    "alarm_topic_arn": None,
+}
+
+PERIOD = Duration.minutes(1)
+WIDGET_WIDTH = 12
+
+
+def monitoring_settings(context_settings):
+    settings = dict(DEFAULT_MONITORING_SETTINGS)
+    settings.update(context_settings or {})
+    return settings
+
+
+class PipelineMonitoring(Construct):
+    """
+    Dashboard of the hot path, the add_ methods add the widgets and alarms of a component
+    """
+
+    def __init__(self, scope: Construct, construct_id: str, dashboard_name: str, settings: dict) -> None:
+        super().__init__(scope, construct_id)
+        self.settings = settings
+        self.alarms = []
+        self.dashboard = cloudwatch.Dashboard(self, "Dashboard", dashboard_name=dashboard_name)
+        self.alarm_action = None
+        if settings["alarm_topic_arn"]:
+            self.alarm_action = cloudwatch_actions.SnsAction(
+                sns.Topic.from_topic_arn(self, "AlarmTopic", settings["alarm_topic_arn"]))
+
+    def _graph(self, title, left, right=None, left_unit=None):
+        return cloudwatch.GraphWidget(title=title, left=left, right=right or [], width=WIDGET_WIDTH,
+                                      left_y_axis=cloudwatch.YAxisProps(label=left_unit, show_units=False) if left_unit else None)
+
+    def _alarm(self, construct_id, metric, setting, description, scale=1):
+        threshold = self.settings[setting]
+        if threshold is None or threshold is False:
+            return None
+        alarm = metric.create_alarm(self, construct_id,
+            threshold=threshold * scale,
+            evaluation_periods=self.settings["evaluation_periods"],
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            alarm_description=description,
+        )
+        if self.alarm_action:
+            alarm.add_alarm_action(self.alarm_action)
+        self.alarms.append(alarm)
+        return alarm
+
+    def add_target_groups(self, target_groups: dict) -> None:
+        """
+        target_groups maps a name to an ApplicationTargetGroup
+        """
+        response_times, requests, errors = [], [], []
+        for name, target_group in target_groups.items():
+            metrics = target_group.metrics
+            p99 = metrics.target_response_time(statistic="p99", period=PERIOD, label=f"{name} p99")
+            response_times += [p99, metrics.target_response_time(statistic="p50", period=PERIOD, label=f"{name} p50")]
+            requests.append(metrics.request_count_per_target(period=PERIOD, label=name))
+            target_5xx = metrics.http_code_target(elbv2.HttpCodeTarget.TARGET_5XX_COUNT, period=PERIOD, label=f"{name} 5xx")
+            errors.append(target_5xx)
+            self._alarm(f"{name}ResponseTimeAlarm", p99, "target_response_time_p99_seconds",
+                        f"p99 TargetResponseTime of the {name} targets")
+            self._alarm(f"{name}Target5xxAlarm", target_5xx, "target_5xx_per_minute",
+                        f"5xx responses of the {name} targets")
+        self.dashboard.add_widgets(
+            self._graph("TargetResponseTime", response_times, left_unit="seconds"),
+            self._graph("RequestCountPerTarget and target 5xx", requests, errors),
+        )
+
+    def add_services(self, services: dict) -> None:
+        """
+        services maps a name to a FargateService
+        """
+        cpu, memory = [], []
+        for name, service in services.items():
+            service_cpu = service.metric_cpu_utilization(period=PERIOD, label=name)
+            service_memory = service.metric_memory_utilization(period=PERIOD, label=name)
+            cpu.append(service_cpu)
+            memory.append(service_memory)
+            self._alarm(f"{name}CpuAlarm", service_cpu, "service_cpu_percent", f"CPU utilization of the {name} service")
+            self._alarm(f"{name}MemoryAlarm", service_memory, "service_memory_percent",
+                        f"Memory utilization of the {name} service")
+        self.dashboard.add_widgets(
+            self._graph("ECS CPUUtilization", cpu, left_unit="%"),
+            self._graph("ECS MemoryUtilization", memory, left_unit="%"),
+        )
+
+    def add_service_connect(self, name: str, service: ecs.FargateService, discovery_name: str) -> None:
+        """
+        Requests the service connect proxies of service received, the traffic that doesn't go through a target group
+        """
+        dimensions = {"ClusterName": service.cluster.cluster_name, "ServiceName": service.service_name,
+                      "DiscoveryName": discovery_name}
+
+        def metric(metric_name, statistic, label):
+            return cloudwatch.Metric(namespace="AWS/ECS", metric_name=metric_name, dimensions_map=dimensions,
+                                     statistic=statistic, period=PERIOD, label=label)
+
+        response_time = metric("TargetResponseTime", "Average", f"{name} average")
+        target_5xx = metric("HTTPCode_Target_5XX_Count", "Sum", f"{name} 5xx")
+        self._alarm(f"{name}ServiceConnect5xxAlarm", target_5xx, "target_5xx_per_minute",
+                    f"5xx responses of the {name} service connect service")
+        self.dashboard.add_widgets(
+            self._graph(f"{name} service connect TargetResponseTime",
+                        [response_time, metric("TargetResponseTime", "Maximum", f"{name} maximum")], left_unit="ms"),
+            self._graph(f"{name} service connect RequestCount and target 5xx",
+                        [metric("RequestCount", "Sum", name), metric("ActiveConnectionCount", "Average", f"{name} connections")],
+                        [target_5xx]),
+        )
+
+    def add_stream(self, stream: kds.IStream) -> None:
+        incoming = stream.metric_incoming_records(period=PERIOD, statistic="Sum")
+        throttled = stream.metric_write_provisioned_throughput_exceeded(period=PERIOD, statistic="Sum")
+        iterator_age = stream.metric_get_records_iterator_age_milliseconds(period=PERIOD, statistic="Maximum")
+        self._alarm("WriteThroughputExceededAlarm", throttled, "write_throughput_exceeded_per_minute",
+                    "Records rejected by the kinesis stream, add shards")
+        self._alarm("IteratorAgeAlarm", iterator_age, "iterator_age_seconds",
+                    "Consumers of the kinesis stream are behind", scale=1000)
+        self.dashboard.add_widgets(
+            self._graph("Kinesis IncomingRecords and WriteProvisionedThroughputExceeded", [incoming], [throttled]),
+            self._graph("Kinesis GetRecords.IteratorAgeMilliseconds", [iterator_age], left_unit="ms"),
+        )
+
+    def add_stream_consumers(self, stream_name: str, consumer_names: list) -> None:
+        """
+        How far the enhanced fan-out consumers are behind, they don't show in the iterator age of the stream
+        """
+        behind = []
+        for name in consumer_names:
+            millis_behind = cloudwatch.Metric(namespace="AWS/Kinesis", metric_name="SubscribeToShardEvent.MillisBehindLatest",
+                dimensions_map={"StreamName": stream_name, "ConsumerName": name}, statistic="Maximum", period=PERIOD, label=name)
+            behind.append(millis_behind)
+            self._alarm(f"{name}ConsumerBehindAlarm", millis_behind, "iterator_age_seconds",
+                        f"The {name} enhanced fan-out consumer is behind", scale=1000)
+        self.dashboard.add_widgets(
+            self._graph("Kinesis SubscribeToShardEvent.MillisBehindLatest", behind, left_unit="ms"),
+        )
+
+    def add_delivery_stream(self, delivery_stream_name: str) -> None:
+        freshness = cloudwatch.Metric(namespace="AWS/Firehose", metric_name="DeliveryToS3.DataFreshness",
+            dimensions_map={"DeliveryStreamName": delivery_stream_name}, statistic="Maximum", period=PERIOD)
+        records = cloudwatch.Metric(namespace="AWS/Firehose", metric_name="DeliveryToS3.Records",
+            dimensions_map={"DeliveryStreamName": delivery_stream_name}, statistic="Sum", period=PERIOD)
+        self._alarm("DataFreshnessAlarm", freshness, "firehose_data_freshness_seconds",
+                    "Firehose delivery to S3 is behind")
+        self.dashboard.add_widgets(
+            self._graph("Firehose DeliveryToS3.DataFreshness and records", [freshness], [records], left_unit="seconds"),
+        )
+
+    def add_rest_api(self, api: apigateway.RestApi) -> None:
+        p99 = api.metric_latency(statistic="p99", period=PERIOD, label="Latency p99")
+        self._alarm("ApiLatencyAlarm", p99, "api_latency_p99_ms", "p99 latency of the api gateway")
+        self.dashboard.add_widgets(
+            self._graph("API Gateway latency", [
+                p99,
+                api.metric_latency(statistic="p50", period=PERIOD, label="Latency p50"),
+                api.metric_integration_latency(statistic="p99", period=PERIOD, label="IntegrationLatency p99"),
+            ], [api.metric_server_error(period=PERIOD, statistic="Sum", label="5XXError")], left_unit="ms"),
+        )
@@ -0,0 +1,95 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Partition key strategies shared by both ingestion paths. The strategy is picked with the
+# partition_key_strategy (and partition_key_salt) context values:
+#   session_id - ga_session_id of the event
+#   client_id  - client_id of the event
+#   random     - a random key per event, spreads evenly but loses per session ordering
+#   composite  - <salt>|<client_id>|<ga_session_id>, changing the salt reshuffles the keys over the shards
+# Events that don't carry the fields of the strategy get a random key so they don't pile up on one shard.
+# The same rules are implemented in the api gateway mapping template below and in the producer
+# (source/producer/.../PartitionKeyStrategy.java), keep them in sync.
+import json
+import uuid
+
+SESSION_ID = "session_id"
+CLIENT_ID = "client_id"
+RANDOM = "random"
+COMPOSITE = "composite"
+STRATEGIES = (SESSION_ID, CLIENT_ID, RANDOM, COMPOSITE)
+DEFAULT_STRATEGY = SESSION_ID
+
+
+def validate_strategy(strategy):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown partition key strategy '{strategy}', use one of {', '.join(STRATEGIES)}")
+    return strategy
+
+
+def partition_key(event, strategy=DEFAULT_STRATEGY, salt="", random_key=None):
+    """
+    Returns the partition key of a GA event. random_key is called for the random strategy and
+    for events missing the strategy fields, by default it returns a random uuid.
+    """
+    validate_strategy(strategy)
+    random_key = random_key or (lambda: uuid.uuid4().hex)
+    event = event if isinstance(event, dict) else {}
+    session_id = _value_of(event.get("ga_session_id"))
+    client_id = _value_of(event.get("client_id"))
+
+    if strategy == SESSION_ID and session_id is not None:
+        return session_id
+    if strategy == CLIENT_ID and client_id is not None:
+        return client_id
+    if strategy == COMPOSITE and (client_id is not None or session_id is not None):
+        return f"{salt}|{client_id or ''}|{session_id or ''}"
+    return random_key()
+
+
+def _value_of(value):
+    # like valueOf of the producer: only null and "" are missing, 0 and false are keys
+    if value is None:
+        return None
+    text = json.dumps(value) if isinstance(value, bool) else str(value)
+    return text or None
+
+
+def api_gateway_partition_key_template(strategy=DEFAULT_STRATEGY, salt="", event=None, random_key="$context.requestId"):
+    """
+    Returns the velocity statements that set $partitionKey in an api gateway mapping template.
+    event is the velocity reference of the event, by default the request body. random_key stands in
+    for the random key, $context.requestId is unique per request but has to be suffixed per record in a batch.
+    """
+    validate_strategy(strategy)
+
+    def field(name):
+        return f"$input.path('$.{name}')" if event is None else f"{event}.{name}"
+
+    # velocity doesn't assign null values, the variables are reset so a batch doesn't reuse the previous record's key
+    if strategy == RANDOM:
+        return f"#set($partitionKey = \"{random_key}\")\n"
+    if strategy == COMPOSITE:
+        return (
+            "#set($clientId = \"\")\n"
+            "#set($sessionId = \"\")\n"
+            f"#set($clientId = {field('client_id')})\n"
+            f"#set($sessionId = {field('ga_session_id')})\n"
+            "#if(\"$!clientId\" == \"\" && \"$!sessionId\" == \"\")\n"
+            f"#set($partitionKey = \"{random_key}\")\n"
+            "#else\n"
+            f"#set($partitionKey = \"{salt}|$!clientId|$!sessionId\")\n"
+            "#end\n"
+        )
+    key_field = "ga_session_id" if strategy == SESSION_ID else "client_id"
+    return (
+        "#set($partitionKey = \"\")\n"
+        f"#set($partitionKey = {field(key_field)})\n"
+        "#if(\"$!partitionKey\" == \"\")\n"
+        f"#set($partitionKey = \"{random_key}\")\n"
+        "#end\n"
+    )
@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Settings of the kinesis producer service, passed to the container as environment variables.
+# The backpressure limits are read from the producer_backpressure context value:
+#   {
+#     "max_outstanding_records": 20000,
+#     "retry_after_seconds": 1,
+#     "synchronous_ack": false,
+#     "ack_timeout_millis": 2000
+#   }
+# The KPL settings are read from the kpl_settings context value, settings left out keep the KPL default:
+#   {
+#     "record_max_buffered_time": 100,
+#     "aggregation_enabled": true,
+#     "aggregation_max_count": 4294967295,
+#     "aggregation_max_size": 51200,
+#     "collection_max_count": 500,
+#     "max_connections": 24,
+#     "request_timeout": 6000,
+#     "rate_limit": 150,
+#     "metrics_level": "summary"
+#   }
+# The logging of the records is read from the producer_logging context value:
+#   {"sample_rate": 0.001, "debug": false}
+# The projection of the events is read from the event_projection context value, see deployment/event_schema.py.
+# Raising record_max_buffered_time packs more events into each aggregated record and PutRecords call at the cost
+# of latency, see https://docs.aws.amazon.com/streams/latest/dev/kinesis-kpl-config.html
+from deployment.event_schema import projected_shape
+
+DEFAULT_BACKPRESSURE_SETTINGS = {
+    # records buffered in the KPL before requests are answered with 503, None derives it from the heap size
+    "max_outstanding_records": None,
+    # Retry-After header of the 503 responses
+    "retry_after_seconds": 1,
+    # wait for the kinesis result of every record and return it instead of answering once the record is buffered
+    "synchronous_ack": False,
+    "ack_timeout_millis": 2000,
+}
+
+
+def backpressure_environment(context_settings, max_outstanding_records):
+    """
+    Environment variables read by BackpressureLimits.java
+    """
+    settings = dict(DEFAULT_BACKPRESSURE_SETTINGS)
+    settings.update(context_settings or {})
+    return {
+        'MAX_OUTSTANDING_RECORDS': str(settings["max_outstanding_records"] or max_outstanding_records),
+        'RETRY_AFTER_SECONDS': str(settings["retry_after_seconds"]),
+        'SYNCHRONOUS_ACK': str(bool(settings["synchronous_ack"])).lower(),
+        'ACK_TIMEOUT_MILLIS': str(settings["ack_timeout_millis"]),
+    }
+
+
+DEFAULT_LOGGING_SETTINGS = {
+    # share of the records logged with their payload, every logged byte is shipped to CloudWatch Logs
+    "sample_rate": 0.001,
+    # true logs every record, only for troubleshooting
+    "debug": False,
+}
+
+
+def logging_environment(context_settings):
+    """
+    Environment variables read by EventLogger.java
+    """
+    settings = dict(DEFAULT_LOGGING_SETTINGS)
+    settings.update(context_settings or {})
+    return {
+        'LOG_SAMPLE_RATE': str(settings["sample_rate"]),
+        'LOG_DEBUG': str(bool(settings["debug"])).lower(),
+    }
+
+
+# context keys and the KinesisProducerConfiguration properties they set
+KPL_PROPERTIES = {
+    "record_max_buffered_time": "RecordMaxBufferedTime",
+    "aggregation_enabled": "AggregationEnabled",
+    "aggregation_max_count": "AggregationMaxCount",
+    "aggregation_max_size": "AggregationMaxSize",
+    "collection_max_count": "CollectionMaxCount",
+    "collection_max_size": "CollectionMaxSize",
+    "max_connections": "MaxConnections",
+    "request_timeout": "RequestTimeout",
+    "rate_limit": "RateLimit",
+    "metrics_level": "MetricsLevel",
+    "metrics_granularity": "MetricsGranularity",
+}
+
+DEFAULT_KPL_SETTINGS = {
+    # the task role may put the KPL metrics, summary keeps them to the stream level metrics
+    "metrics_level": "summary",
+}
+
+
+def kpl_environment(context_settings):
+    """
+    Environment variables read by KplConfiguration.java, e.g. KPL_RECORD_MAX_BUFFERED_TIME for record_max_buffered_time
+    """
+    settings = dict(DEFAULT_KPL_SETTINGS)
+    settings.update(context_settings or {})
+    unknown = sorted(set(settings) - set(KPL_PROPERTIES))
+    if unknown:
+        raise ValueError(f"Unknown kpl_settings {unknown}, use {sorted(KPL_PROPERTIES)}")
+
+    environment = {}
+    for key, value in settings.items():
+        if value is None:
+            continue
+        environment[f"KPL_{key.upper()}"] = str(value).lower() if isinstance(value, bool) else str(value)
+    return environment
+
+
+def projection_environment(settings):
+    """
+    Environment variables read by EventProjection.java, settings are the projection_settings of event_schema.py
+    """
+    if not settings:
+        return {'EVENT_PROJECTION': 'false'}
+    return {
+        'EVENT_PROJECTION': 'true',
+        'EVENT_ALLOWED_FIELDS': ",".join(projected_shape(settings)) if settings["allow_list"] else "",
+        'EVENT_DROP_FIELDS': ",".join(settings["drop_fields"]),
+        'EVENT_REQUIRED_FIELDS': ",".join(settings["required_fields"]),
+    }
@@ -6,6 +6,7 @@
 # specific language governing permissions and limitations under the License.
 import os
 from aws_cdk import (
+    CfnOutput,
     Stack,
     aws_certificatemanager as acm,
     aws_ec2 as ec2,
@@ -14,17 +15,26 @@ from aws_cdk import (
     RemovalPolicy,
     aws_logs as logs,
 )
-from aws_cdk.aws_elasticloadbalancingv2 import ListenerCondition, Protocol, HealthCheck, ApplicationProtocol
+from aws_cdk.aws_ecr_assets import DockerImageAsset, Platform
+from aws_cdk.aws_elasticloadbalancingv2 import ListenerAction, ListenerCondition, Protocol, HealthCheck, ApplicationProtocol
 from aws_cdk.aws_route53 import PrivateHostedZone, CnameRecord
 from constructs import Construct
+from deployment.autoscaling import configure_service_scaling, fargate_capacity_provider_strategies, scaling_settings
+from deployment.capacity_planner import CapacityPlan
+from deployment.edge_distribution import ORIGIN_VERIFY_HEADER, GTMEdgeDistribution, edge_settings
+from deployment.monitoring import PipelineMonitoring, monitoring_settings
+from deployment.service_connect import add_namespace, client_configuration, service_connect_settings
 
 DIRNAME = os.path.dirname(__file__)
 
 class ServerSideTaggerStack(Stack):
 
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, capacity_plan: CapacityPlan = None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # sizing of the primary service, see deployment/capacity_planner.py
+        capacity_plan = capacity_plan or CapacityPlan()
+
         ssl_cert_arn = self.node.try_get_context("ssl_cert_arn")
         gtm_cloud_image = self.node.try_get_context("gtm_cloud_image")
         container_config = self.node.try_get_context("container_config")
@@ -34,6 +44,17 @@ class ServerSideTaggerStack(Stack):
         # adding below to include in target groups
         primary_dns = self.node.try_get_context("primary_server_dns")
         root_dns = self.node.try_get_context("root_dns")
+        # flag to run the tasks from an ECR copy of the gtm image and keep image pulls and logs off the NAT gateways
+        ecr_image_mirror = self.node.try_get_context("ecr_image_mirror")
+        gtm_cloud_image_digest = self.node.try_get_context("gtm_cloud_image_digest")
+        # X86_64 or ARM64, ARM64 only works if the gtm image is published for linux/arm64
+        gtm_cpu_architecture = self.node.try_get_context("gtm_cpu_architecture") or "X86_64"
+        # weight of FARGATE_SPOT against FARGATE for the tasks above the minimum capacity, 0 runs everything on FARGATE
+        fargate_spot_weight = self.node.try_get_context("fargate_spot_weight") or 0
+        # settings of the optional cloudfront distribution in front of the primary service, see deployment/edge_distribution.py
+        cloudfront_settings = self.node.try_get_context("cloudfront")
+        # service connect from the primary service to the producer, see deployment/service_connect.py
+        service_connect = service_connect_settings(self.node.try_get_context("producer_service_connect"))
         # -----------------------------------------------------------------------------------------------------------
         # defines a certificate from the ARN of a cert you have already created
         # -----------------------------------------------------------------------------------------------------------
@@ -48,12 +69,51 @@ class ServerSideTaggerStack(Stack):
         vpc = ec2.Vpc(self, "GTMVPC", vpc_name="GTMServerSideVPC")
         self.vpc = vpc
 
+        # -----------------------------------------------------------------------------------------------------------
+        # defines the image of the google tag manager services
+        # by default the tasks pull the image from gcr.io through the NAT gateways on every scale out
+        # with ecr_image_mirror the image is copied into ECR at deploy time, pinned to gtm_cloud_image_digest if set,
+        # and the VPC endpoints below keep image pulls and log shipping inside the VPC
+        # ECR pull through cache rules don't support gcr.io as upstream registry, hence the copy
+        # -----------------------------------------------------------------------------------------------------------
+
+        gtm_image = ecs.ContainerImage.from_registry(gtm_cloud_image)
+        if ecr_image_mirror:
+            pinned_gtm_cloud_image = f"{gtm_cloud_image}@{gtm_cloud_image_digest}" if gtm_cloud_image_digest else gtm_cloud_image
+            gtm_image = ecs.ContainerImage.from_docker_image_asset(DockerImageAsset(self, "GTMCloudImage",
+                directory=os.path.join(DIRNAME, "..", "source", "gtm_image"),
+                build_args={"GTM_CLOUD_IMAGE": pinned_gtm_cloud_image},
+                platform=Platform.LINUX_ARM64 if gtm_cpu_architecture == "ARM64" else Platform.LINUX_AMD64,
+            ))
+
+            vpc.add_interface_endpoint("ECRInterfaceEndpoint",
+                service=ec2.InterfaceVpcEndpointAwsService.ECR
+            )
+            vpc.add_interface_endpoint("ECRDockerInterfaceEndpoint",
+                service=ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER
+            )
+            vpc.add_interface_endpoint("CloudWatchLogsInterfaceEndpoint",
+                service=ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS
+            )
+            # image layers are served from S3
+            vpc.add_gateway_endpoint("S3GatewayEndpoint",
+                service=ec2.GatewayVpcEndpointAwsService.S3
+            )
+
         # -----------------------------------------------------------------------------------------------------------
         # defines an ECS cluster
         # -----------------------------------------------------------------------------------------------------------
 
-        cluster = ecs.Cluster(self, "GTMCluster", vpc=vpc, cluster_name="GTMServerSideCluster")        
+        cluster = ecs.Cluster(self, "GTMCluster", vpc=vpc, cluster_name="GTMServerSideCluster",
+                              enable_fargate_capacity_providers=bool(fargate_spot_weight))
         self.ecs_cluster = cluster
+        if service_connect:
+            add_namespace(cluster, service_connect)
+
+        gtm_runtime_platform = ecs.RuntimePlatform(
+            cpu_architecture=ecs.CpuArchitecture.of(gtm_cpu_architecture),
+            operating_system_family=ecs.OperatingSystemFamily.LINUX
+        )
 
         # -----------------------------------------------------------------------------------------------------------
         # defines the primary google tag manager service
@@ -71,10 +131,13 @@ class ServerSideTaggerStack(Stack):
             memory_limit_mib=1024,
             cpu=512,
             desired_count=1,
+            runtime_platform=gtm_runtime_platform,
+            # the single preview task stays on FARGATE
+            capacity_provider_strategies=fargate_capacity_provider_strategies(1, fargate_spot_weight),
             listener_port=443,
             certificate=cert,
             task_image_options=ecs_patterns.ApplicationLoadBalancedTaskImageOptions(
-                image=ecs.ContainerImage.from_registry(gtm_cloud_image),
+                image=gtm_image,
                 environment= {
                     'PORT': '80',
                     'CONTAINER_CONFIG': container_config,
@@ -103,12 +166,13 @@ class ServerSideTaggerStack(Stack):
         # -----------------------------------------------------------------------------------------------------------
         
         primary_task_definition = ecs.FargateTaskDefinition(self, "GTMPrimaryTaskDefinition", 
-            cpu=512,
-            memory_limit_mib=1024
+            cpu=capacity_plan.primary_cpu,
+            memory_limit_mib=capacity_plan.primary_memory_mib,
+            runtime_platform=gtm_runtime_platform
         )
 
         primary_task_definition.add_container("GTMPrimaryContainer",
-            image=ecs.ContainerImage.from_registry(gtm_cloud_image),
+            image=gtm_image,
             environment= {
                 'PORT': '80',
                 'CONTAINER_CONFIG': container_config,
@@ -122,10 +186,36 @@ class ServerSideTaggerStack(Stack):
             service_name="GTMServerSidePrimaryService",
             cluster=cluster,
             task_definition=primary_task_definition,
-            desired_count=3,
+            desired_count=capacity_plan.primary_desired_count,
+            capacity_provider_strategies=fargate_capacity_provider_strategies(capacity_plan.primary_min_capacity, fargate_spot_weight),
+            service_connect_configuration=client_configuration() if service_connect else None,
         )
+        # the producer of the analytics stack accepts the service connect traffic of this group
+        self.primary_security_group = gtm_service.connections.security_groups[0]
 
-        gtm_preview_service.load_balancer.listeners[0].add_targets(
+        # -----------------------------------------------------------------------------------------------------------
+        # defines the optional cloudfront distribution caching the gtm scripts in front of the primary service
+        # the primary rule then requires the origin verify header and the primary host is denied without it
+        # -----------------------------------------------------------------------------------------------------------
+
+        primary_conditions = [ListenerCondition.host_headers([primary_dns])]
+        if cloudfront_settings is not None:
+            edge_distribution = GTMEdgeDistribution(self, "GTMEdgeDistribution",
+                settings=edge_settings(cloudfront_settings, self.region, ssl_cert_arn),
+                domain_names=cloudfront_settings.get("domain_names") or [primary_dns],
+            )
+            primary_conditions.append(ListenerCondition.http_header(ORIGIN_VERIFY_HEADER, [edge_distribution.origin_verify_value]))
+            gtm_preview_service.load_balancer.listeners[0].add_action("GTMPrimaryDirectAccessDenied",
+                conditions=[ListenerCondition.host_headers([primary_dns])],
+                priority=2,
+                action=ListenerAction.fixed_response(403, content_type="text/plain", message_body="Forbidden"),
+            )
+            CfnOutput(self, "GTMEdgeDistributionDomainName",
+                value=edge_distribution.distribution.distribution_domain_name,
+                description="point primary_server_dns at this name",
+            )
+
+        primary_target_group = gtm_preview_service.load_balancer.listeners[0].add_targets(
             "GTMPrimaryServiceTargetGroup",
             targets=[
                 gtm_service.load_balancer_target(
@@ -133,7 +223,7 @@ class ServerSideTaggerStack(Stack):
                     container_port=80
                 )
             ],
-            conditions=[ListenerCondition.host_headers([primary_dns])],
+            conditions=primary_conditions,
             priority=1,
             protocol=ApplicationProtocol.HTTP,
             health_check=HealthCheck(path="/healthz", protocol=Protocol.HTTP)
@@ -147,21 +237,32 @@ class ServerSideTaggerStack(Stack):
             )
         # -----------------------------------------------------------------------------------------------------------
         # defines the autoscaling configuration for primary service
+        # request count and response time policies scale ahead of cpu and memory, see deployment/autoscaling.py
         # -----------------------------------------------------------------------------------------------------------
 
         scalable_target = gtm_service.auto_scale_task_count(
-            max_capacity=10,
-            min_capacity=2
+            max_capacity=capacity_plan.primary_max_capacity,
+            min_capacity=capacity_plan.primary_min_capacity
         )
 
-        scalable_target.scale_on_cpu_utilization("CpuScaling", 
-            target_utilization_percent=50 
+        configure_service_scaling(scalable_target, primary_target_group,
+            cpu_target=50,
+            memory_target=50,
+            requests_per_target=capacity_plan.primary_requests_per_target,
+            settings=scaling_settings(self.node.try_get_context("primary_autoscaling"))
         )
+        
+        # -----------------------------------------------------------------------------------------------------------
+        # defines the dashboard and alarms of the load balancer and the gtm services, see deployment/monitoring.py
+        # -----------------------------------------------------------------------------------------------------------
 
-        scalable_target.scale_on_memory_utilization("MemoryScaling",
-            target_utilization_percent=50                
+        monitoring = PipelineMonitoring(self, "GTMMonitoring",
+            dashboard_name="GTMServerSideTagger",
+            settings=monitoring_settings(self.node.try_get_context("monitoring")),
         )
-        
+        monitoring.add_target_groups({"Primary": primary_target_group, "Preview": gtm_preview_service.target_group})
+        monitoring.add_services({"Primary": gtm_service, "Preview": gtm_preview_service.service})
+
         # -----------------------------------------------------------------------------------------------------------
         # defines the hosted zone for internal DNS resolution from primary service to preview service and SSL handling
         # -----------------------------------------------------------------------------------------------------------
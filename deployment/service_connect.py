@@ -0,0 +1,71 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# ECS service connect from the primary gtm service to the producer, enabled by the producer_service_connect
+# context value (true takes the defaults):
+#   {
+#     "namespace": "gtm.internal",
+#     "port": 80,
+#     "load_balancer_path": false
+#   }
+# The cluster gets a cloud map namespace, the primary tasks join it as clients and the producer registers
+# producer_service_dns in it. The service connect proxy of the primary tasks resolves http://<producer_service_dns>
+# (port) to the producer tasks and keeps pooled connections to them, the events no longer go through the
+# public load balancer, its TLS handshakes and its listener rules. The gtm tag template has to send to the http url.
+# Without load_balancer_path the producer has no target group, listener rule or CNAME and is only reachable
+# inside the vpc, with it the load balancer path stays while the tag template is moved over.
+from aws_cdk import (
+    aws_ecs as ecs,
+    aws_servicediscovery as servicediscovery,
+)
+
+DEFAULT_SERVICE_CONNECT_SETTINGS = {
+    "namespace": "gtm.internal",
+    # port the primary tasks call the producer on, the proxy forwards to the container port 8080
+    "port": 80,
+    # keeps the producer behind the load balancer as well
+    "load_balancer_path": False,
+}
+
+# name of the producer port mapping the service connect service refers to
+PRODUCER_PORT_NAME = "producer"
+
+
+def service_connect_settings(context_settings):
+    """
+    None when producer_service_connect isn't set or false
+    """
+    if not context_settings:
+        return None
+    settings = dict(DEFAULT_SERVICE_CONNECT_SETTINGS)
+    if isinstance(context_settings, dict):
+        settings.update(context_settings)
+    return settings
+
+
+def add_namespace(cluster: ecs.Cluster, settings: dict) -> None:
+    # has to be added before the services of the cluster are defined, they read the default namespace
+    cluster.add_default_cloud_map_namespace(name=settings["namespace"],
+        type=servicediscovery.NamespaceType.HTTP,
+        use_for_service_connect=True,
+    )
+
+
+def client_configuration() -> ecs.ServiceConnectProps:
+    # no services, the tasks only call the services of the namespace
+    return ecs.ServiceConnectProps()
+
+
+def producer_configuration(settings: dict, producer_dns: str) -> ecs.ServiceConnectProps:
+    return ecs.ServiceConnectProps(services=[
+        ecs.ServiceConnectService(
+            port_mapping_name=PRODUCER_PORT_NAME,
+            discovery_name=PRODUCER_PORT_NAME,
+            dns_name=producer_dns,
+            port=settings["port"],
+        ),
+    ])
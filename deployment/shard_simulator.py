@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Simulates how a partition key strategy spreads a sample of events over the shards of the stream.
+# Kinesis maps a record to the shard whose hash key range contains the MD5 of the partition key,
+# a stream created with N shards splits the 128 bit hash key space in N equal ranges.
+#
+#   python -m deployment.shard_simulator events.json --shards 4 --strategy client_id
+#
+# The events file can be newline delimited JSON (as delivered to S3), a JSON array or a single event.
+import argparse
+import hashlib
+import json
+import random
+from collections import Counter
+
+from deployment.partition_key import DEFAULT_STRATEGY, STRATEGIES, partition_key
+
+HASH_KEY_SPACE = 2 ** 128
+
+
+def hash_key(key):
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16)
+
+
+def shard_for_key(key, shard_count):
+    # shard i owns the hash keys [i * space / n, (i + 1) * space / n)
+    return hash_key(key) * shard_count // HASH_KEY_SPACE
+
+
+def read_events(path):
+    with open(path) as events_file:
+        content = events_file.read()
+    try:
+        events = json.loads(content)
+        return events if isinstance(events, list) else [events]
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def simulate(events, shard_count, strategy=DEFAULT_STRATEGY, salt="", seed=0):
+    """
+    Returns the per shard record and byte counts of the events and the hottest partition keys
+    """
+    rng = random.Random(seed)
+    records = [0] * shard_count
+    sizes = [0] * shard_count
+    keys = Counter()
+    for event in events:
+        key = partition_key(event, strategy, salt, random_key=lambda: "%032x" % rng.getrandbits(128))
+        shard = shard_for_key(key, shard_count)
+        records[shard] += 1
+        sizes[shard] += len(json.dumps(event, separators=(",", ":")).encode("utf-8"))
+        keys[key] += 1
+
+    total = sum(records)
+    mean = total / shard_count if shard_count else 0
+    return {
+        "strategy": strategy,
+        "shard_count": shard_count,
+        "records": total,
+        "shards": [
+            {"shard": shard, "records": records[shard], "bytes": sizes[shard],
+             "share": records[shard] / total if total else 0.0}
+            for shard in range(shard_count)
+        ],
+        # max/mean of 1.0 is a perfectly even spread, a shard throttles first when its share is skew times the mean
+        "skew": max(records) / mean if mean else 0.0,
+        "distinct_keys": len(keys),
+        "hot_keys": keys.most_common(5),
+    }
+
+
+def format_report(report):
+    lines = [
+        f"strategy={report['strategy']} shards={report['shard_count']} records={report['records']} "
+        f"distinct_keys={report['distinct_keys']} skew(max/mean)={report['skew']:.2f}",
+        f"{'shard':>5} {'records':>10} {'bytes':>12} {'share':>7}",
+    ]
+    for shard in report["shards"]:
+        lines.append(f"{shard['shard']:>5} {shard['records']:>10} {shard['bytes']:>12} {shard['share']:>7.1%}")
+    lines.append("hot keys: " + ", ".join(f"{key} ({count})" for key, count in report["hot_keys"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report how a partition key strategy spreads events over the shards")
+    parser.add_argument("events", help="newline delimited JSON, JSON array or single event")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--strategy", choices=STRATEGIES, help="defaults to all strategies")
+    parser.add_argument("--salt", default="")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random keys")
+    args = parser.parse_args(argv)
+
+    events = read_events(args.events)
+    for strategy in [args.strategy] if args.strategy else STRATEGIES:
+        print(format_report(simulate(events, args.shards, strategy, args.salt, args.seed)))
+        print()
+
+
+if __name__ == "__main__":
+    main()
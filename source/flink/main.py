@@ -0,0 +1,98 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# PyFlink application deployed by deployment/flink_application.py. It runs the SQL files in sql/ with the
+# values of the FlinkApplicationProperties property group of the application, so the stream, region, start
+# position and window are set by the stack instead of being hard-coded like in the notebook.
+# Run it locally with an application_properties.json next to this file.
+import json
+import os
+from string import Template
+
+DIRNAME = os.path.dirname(os.path.abspath(__file__))
+# where managed service for apache flink puts the runtime properties of the application
+APPLICATION_PROPERTIES_PATH = "/etc/flink/application_properties.json"
+LOCAL_APPLICATION_PROPERTIES_PATH = os.path.join(DIRNAME, "application_properties.json")
+PROPERTY_GROUP_ID = "FlinkApplicationProperties"
+
+DEFAULT_PROPERTIES = {
+    "stream_name": "gtagStream",
+    "region": "us-west-2",
+    "initial_position": "LATEST",
+    "bucket_name": "",
+    "output_prefix": "aggregates/page_session_event_counts",
+    "window_seconds": "60",
+    "slide_seconds": "",
+    "watermark_seconds": "5",
+    # set when the stack registered an enhanced fan-out consumer for the application
+    "efo_consumer_name": "",
+    "efo_consumer_arn": "",
+}
+
+# the source and sink tables are created first, the inserts run together as one job
+TABLE_FILES = ["click_stream_live_stream.sql", "page_session_event_counts.sql"]
+INSERT_FILES = ["insert_page_session_event_counts.sql"]
+
+
+def load_properties(path=None):
+    path = path or (APPLICATION_PROPERTIES_PATH if os.path.isfile(APPLICATION_PROPERTIES_PATH) else LOCAL_APPLICATION_PROPERTIES_PATH)
+    properties = dict(DEFAULT_PROPERTIES)
+    if os.path.isfile(path):
+        with open(path) as properties_file:
+            for group in json.load(properties_file):
+                if group["PropertyGroupId"] == PROPERTY_GROUP_ID:
+                    properties.update(group["PropertyMap"])
+    return properties
+
+
+def window_function(properties):
+    """
+    Window table valued function over event_time, HOP when slide_seconds is set, TUMBLE otherwise
+    """
+    window = f"INTERVAL '{int(properties['window_seconds'])}' SECOND"
+    if properties.get("slide_seconds"):
+        slide = f"INTERVAL '{int(properties['slide_seconds'])}' SECOND"
+        return f"HOP(TABLE click_stream_live_stream, DESCRIPTOR(event_time), {slide}, {window})"
+    return f"TUMBLE(TABLE click_stream_live_stream, DESCRIPTOR(event_time), {window})"
+
+
+def consumer_options(properties):
+    """
+    Options of the kinesis source reading through the enhanced fan-out consumer, polling without one
+    """
+    if not properties.get("efo_consumer_arn"):
+        return ""
+    return (
+        "\n  'scan.stream.recordpublisher' = 'EFO',"
+        f"\n  'scan.stream.efo.consumername' = '{properties['efo_consumer_name']}',"
+        "\n  'scan.stream.efo.registration' = 'NONE',"
+        f"\n  'scan.stream.efo.consumerarn.{properties['stream_name']}' = '{properties['efo_consumer_arn']}',"
+    )
+
+
+def render(file_name, properties):
+    with open(os.path.join(DIRNAME, "sql", file_name)) as sql_file:
+        return Template(sql_file.read()).substitute(properties, window=window_function(properties),
+                                                    consumer_options=consumer_options(properties))
+
+
+def main():
+    from pyflink.table import EnvironmentSettings, TableEnvironment
+
+    properties = load_properties()
+    table_env = TableEnvironment.create(EnvironmentSettings.in_streaming_mode())
+    for file_name in TABLE_FILES:
+        table_env.execute_sql(render(file_name, properties))
+
+    statement_set = table_env.create_statement_set()
+    for file_name in INSERT_FILES:
+        statement_set.add_insert_sql(render(file_name, properties))
+    statement_set.execute()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+-- Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+-- Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+-- in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+-- or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+-- specific language governing permissions and limitations under the License.
+--
+-- click_stream_live_stream of the notebook with the event time the windows are computed on.
+-- GA events don't carry an event timestamp, the server side container adds the request time.
+CREATE TABLE `click_stream_live_stream`(
+  `x-ga-protocol_version` string ,
+  `x-ga-measurement_id` string ,
+  `x-ga-gtm_version` string ,
+  `x-ga-page_id` bigint ,
+  `x-ga-mp2-gcd` string ,
+  `x-ga-dma` string ,
+  `x-ga-gdid` string ,
+  `client_id` string ,
+  `language` string ,
+  `screen_resolution` string ,
+  `x-ga-are` string ,
+  `x-ga-request_count` int ,
+  `page_location` string ,
+  `page_referrer` string ,
+  `ga_session_id` string ,
+  `ga_session_number` int ,
+  `x-ga-mp2-seg` string ,
+  `page_title` string ,
+  `event_name` string ,
+  `x-ga-tfd` int ,
+  `ip_override` string ,
+  `user_agent` string ,
+  `engagement_time_msec` int ,
+  `x-sst-system_properties` ROW<`request_start_time_ms` string> ,
+  `event_time` AS TO_TIMESTAMP_LTZ(CAST(`x-sst-system_properties`.`request_start_time_ms` AS BIGINT), 3) ,
+  WATERMARK FOR `event_time` AS `event_time` - INTERVAL '${watermark_seconds}' SECOND )
+WITH (
+  'connector' = 'kinesis',
+  'stream' = '${stream_name}',
+  'aws.region' = '${region}',
+  'scan.stream.initpos' = '${initial_position}',${consumer_options}
+  'format' = 'json',
+  'json.ignore-parse-errors' = 'true'
+);
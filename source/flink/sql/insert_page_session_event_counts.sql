@@ -0,0 +1,23 @@
+-- Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+-- Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+-- in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+-- or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+-- specific language governing permissions and limitations under the License.
+--
+-- Windowed version of the notebook query
+--   SELECT count(*) as event_count, event_name, page_location, ga_session_id ... group by page_location, ga_session_id, event_name
+-- The window is a TUMBLE or HOP window over event_time, a window is emitted once the watermark passes its end
+-- so the state only holds the open windows.
+INSERT INTO `page_session_event_counts`
+SELECT
+  window_start,
+  window_end,
+  page_location,
+  ga_session_id,
+  event_name,
+  COUNT(*) AS event_count,
+  DATE_FORMAT(window_start, 'yyyy-MM-dd') AS dt,
+  DATE_FORMAT(window_start, 'HH') AS hr
+FROM TABLE(${window})
+GROUP BY window_start, window_end, page_location, ga_session_id, event_name;
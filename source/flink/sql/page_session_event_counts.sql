@@ -0,0 +1,25 @@
+-- Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+-- Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+-- in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+-- or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+-- specific language governing permissions and limitations under the License.
+--
+-- Aggregates of the notebook query written to S3 partitioned by the date and hour of the window.
+-- The files of a partition are committed with every checkpoint.
+CREATE TABLE `page_session_event_counts`(
+  `window_start` TIMESTAMP(3) ,
+  `window_end` TIMESTAMP(3) ,
+  `page_location` string ,
+  `ga_session_id` string ,
+  `event_name` string ,
+  `event_count` bigint ,
+  `dt` string ,
+  `hr` string )
+PARTITIONED BY (`dt`, `hr`)
+WITH (
+  'connector' = 'filesystem',
+  'path' = 's3://${bucket_name}/${output_prefix}',
+  'format' = 'json',
+  'sink.partition-commit.policy.kind' = 'success-file'
+);
@@ -2,7 +2,8 @@
 // Original source code is made available by stape.io is the GTM template library and in github under Apache2.0
 // https://help.stape.io/hc/en-us/articles/6093296436125-JSON-HTTP-request
 // https://github.com/stape-io/json-http-request-tag
-// Line 24 is the only change
+// Line 24 is the change needed for the producer service, the retry of failed records is added for the api gateway /batch resource
+// and of requests the producer service rejects with 503 and Retry-After 0 while its buffer is full
 const sendHttpRequest = require('sendHttpRequest');
 const getAllEventData = require('getAllEventData');
 const makeInteger = require('makeInteger');
@@ -21,8 +22,13 @@ let postBodyData = {};
 
 if (data.includeEventData) {
     // This is the changge from the original template
-    // producer service expects a key "data" in the request payload
-    postBodyData.data = getAllEventData();
+    // producer service expects a key "data" in the request payload, the api gateway /batch resource
+    // (inside_array) reads the fields of the events themselves
+    if (data.inside_array) {
+        postBodyData = getAllEventData();
+    } else {
+        postBodyData.data = getAllEventData();
+    }
 }
 
 if (data.headers) {
@@ -47,42 +53,84 @@ if (data.inside_array) {
     postBodyData = [postBodyData];
 }
 
-const postBody = JSON.stringify(postBodyData);
 let requestOptions = {headers: postHeaders, method: data.requestMethod};
 
 if (data.requestTimeout) {
     requestOptions.timeout = makeInteger(data.requestTimeout);
 }
 
-if (isLoggingEnabled) {
-    logToConsole(JSON.stringify({
-        'Name': 'JsonRequest',
-        'Type': 'Request',
-        'TraceId': traceId,
-        'RequestMethod': data.requestMethod,
-        'RequestUrl': data.url,
-        'RequestBody': postBodyData,
-    }));
-}
+sendRequest(postBodyData, 1);
+
+function sendRequest(requestBodyData, retries) {
+    const postBody = JSON.stringify(requestBodyData);
 
-sendHttpRequest(data.url, (statusCode, headers, body) => {
     if (isLoggingEnabled) {
         logToConsole(JSON.stringify({
             'Name': 'JsonRequest',
-            'Type': 'Response',
+            'Type': 'Request',
             'TraceId': traceId,
-            'ResponseStatusCode': statusCode,
-            'ResponseHeaders': headers,
-            'ResponseBody': body,
+            'RequestMethod': data.requestMethod,
+            'RequestUrl': data.url,
+            'RequestBody': requestBodyData,
         }));
     }
 
-    if (statusCode >= 200 && statusCode < 300) {
-        data.gtmOnSuccess();
-    } else {
-        data.gtmOnFailure();
+    sendHttpRequest(data.url, (statusCode, headers, body) => {
+        if (isLoggingEnabled) {
+            logToConsole(JSON.stringify({
+                'Name': 'JsonRequest',
+                'Type': 'Response',
+                'TraceId': traceId,
+                'ResponseStatusCode': statusCode,
+                'ResponseHeaders': headers,
+                'ResponseBody': body,
+            }));
+        }
+
+        // the producer service answers 503 while too many records wait to be sent to kinesis, the sandbox has
+        // no timer to wait for the Retry-After seconds so the request is only sent again when it asks for none
+        if (statusCode === 503 && retries > 0 && retryAfterSeconds(headers) === 0) {
+            sendRequest(requestBodyData, retries - 1);
+            return;
+        }
+
+        if (statusCode < 200 || statusCode >= 300) {
+            data.gtmOnFailure();
+            return;
+        }
+
+        // the api gateway /batch resource answers 200 with the outcome of every record, only the failed ones are sent again
+        const failed = failedRecords(requestBodyData, body);
+        if (failed.length === 0) {
+            data.gtmOnSuccess();
+        } else if (retries > 0) {
+            sendRequest(failed, retries - 1);
+        } else {
+            data.gtmOnFailure();
+        }
+    }, requestOptions, postBody);
+}
+
+function retryAfterSeconds(headers) {
+    const retryAfter = headers ? headers['retry-after'] || headers['Retry-After'] : undefined;
+    return retryAfter === undefined ? undefined : makeInteger(retryAfter);
+}
+
+function failedRecords(requestBodyData, body) {
+    let failed = [];
+    let response = body ? JSON.parse(body) : undefined;
+
+    if (!response || !response.FailedRecordCount || !response.Records) {
+        return failed;
     }
-}, requestOptions, postBody);
+
+    for (let i = 0; i < response.Records.length; i++) {
+        if (response.Records[i].ErrorCode) {
+            failed.push(requestBodyData[response.Records[i].Index]);
+        }
+    }
+    return failed;
+}
 
 
 function escapeKeys(ob) {
@@ -0,0 +1,62 @@
+/**
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+ */
+
+package com.amazonaws.services.kinesis.samples.dataprocessor;
+
+/**
+ * Limits on the records buffered in the KPL, set by the stack, see deployment/producer_settings.py
+ *   MAX_OUTSTANDING_RECORDS - requests are answered with 503 and Retry-After once the KPL holds this many records
+ *   RETRY_AFTER_SECONDS     - value of the Retry-After header
+ *   SYNCHRONOUS_ACK         - true waits for the kinesis result of the record and returns it
+ *   ACK_TIMEOUT_MILLIS      - how long a synchronous request waits for the result
+ */
+public class BackpressureLimits {
+
+    private final long maxOutstandingRecords;
+    private final int retryAfterSeconds;
+    private final boolean synchronousAck;
+    private final long ackTimeoutMillis;
+
+    public BackpressureLimits(long maxOutstandingRecords, int retryAfterSeconds, boolean synchronousAck, long ackTimeoutMillis) {
+        this.maxOutstandingRecords = maxOutstandingRecords;
+        this.retryAfterSeconds = retryAfterSeconds;
+        this.synchronousAck = synchronousAck;
+        this.ackTimeoutMillis = ackTimeoutMillis;
+    }
+
+    //Read Config from env variables
+    public static BackpressureLimits fromEnvironment() {
+        return new BackpressureLimits(
+            Long.parseLong(getenv("MAX_OUTSTANDING_RECORDS", "20000")),
+            Integer.parseInt(getenv("RETRY_AFTER_SECONDS", "1")),
+            Boolean.parseBoolean(getenv("SYNCHRONOUS_ACK", "false")),
+            Long.parseLong(getenv("ACK_TIMEOUT_MILLIS", "2000")));
+    }
+
+    public boolean isFull(long outstandingRecords) {
+        return outstandingRecords >= maxOutstandingRecords;
+    }
+
+    public int getRetryAfterSeconds() {
+        return retryAfterSeconds;
+    }
+
+    public boolean isSynchronousAck() {
+        return synchronousAck;
+    }
+
+    public long getAckTimeoutMillis() {
+        return ackTimeoutMillis;
+    }
+
+    private static String getenv(String name, String defaultValue) {
+        String value = System.getenv(name);
+        return value == null || value.isEmpty() ? defaultValue : value;
+    }
+}
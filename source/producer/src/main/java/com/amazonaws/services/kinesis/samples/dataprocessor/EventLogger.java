@@ -0,0 +1,66 @@
+/**
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+ */
+
+package com.amazonaws.services.kinesis.samples.dataprocessor;
+
+import java.nio.charset.StandardCharsets;
+import java.util.LinkedHashMap;
+import java.util.Map;
+import java.util.concurrent.ThreadLocalRandom;
+
+import org.slf4j.Logger;
+import org.slf4j.LoggerFactory;
+
+import com.fasterxml.jackson.core.JsonProcessingException;
+import com.fasterxml.jackson.databind.ObjectMapper;
+
+/**
+ * Logs a sample of the records as one JSON line each, set by the stack, see deployment/producer_settings.py
+ *   LOG_SAMPLE_RATE - share of the records logged, 0 logs none
+ *   LOG_DEBUG       - true logs every record
+ * The lines go through the async appender in logback-spring.xml, so request threads never wait on stdout.
+ */
+public class EventLogger {
+
+    private static final Logger LOGGER = LoggerFactory.getLogger(EventLogger.class);
+
+    private final ObjectMapper mapper;
+    private final double sampleRate;
+    private final boolean debug;
+
+    public EventLogger(ObjectMapper mapper, double sampleRate, boolean debug) {
+        this.mapper = mapper;
+        this.sampleRate = sampleRate;
+        this.debug = debug;
+    }
+
+    //Read Config from env variables
+    public static EventLogger fromEnvironment(ObjectMapper mapper) {
+        String sampleRate = System.getenv("LOG_SAMPLE_RATE");
+        return new EventLogger(mapper,
+            sampleRate == null || sampleRate.isEmpty() ? 0 : Double.parseDouble(sampleRate),
+            Boolean.parseBoolean(System.getenv("LOG_DEBUG")));
+    }
+
+    public void record(String partitionKey, byte[] data) {
+        if (!debug && (sampleRate <= 0 || ThreadLocalRandom.current().nextDouble() >= sampleRate)) {
+            return;
+        }
+        Map<String, Object> line = new LinkedHashMap<>();
+        line.put("message", "record");
+        line.put("partitionKey", partitionKey);
+        line.put("bytes", data.length);
+        line.put("data", new String(data, StandardCharsets.UTF_8));
+        try {
+            LOGGER.info(mapper.writeValueAsString(line));
+        } catch (JsonProcessingException e) {
+            LOGGER.warn("Could not log record", e);
+        }
+    }
+}
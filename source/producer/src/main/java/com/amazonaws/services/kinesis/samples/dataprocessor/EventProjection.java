@@ -0,0 +1,114 @@
+/**
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+ */
+
+package com.amazonaws.services.kinesis.samples.dataprocessor;
+
+import java.io.IOException;
+import java.util.ArrayList;
+import java.util.Collection;
+import java.util.HashSet;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Map;
+import java.util.Set;
+
+import com.fasterxml.jackson.databind.ObjectMapper;
+
+/**
+ * Projection of the events shared with the api gateway mapping template, set by the stack, see deployment/event_schema.py
+ *   EVENT_PROJECTION      - true projects the events, otherwise they are sent as they are
+ *   EVENT_ALLOWED_FIELDS  - comma separated top level fields kept, empty keeps every field
+ *   EVENT_DROP_FIELDS     - comma separated field or field.child paths removed
+ *   EVENT_REQUIRED_FIELDS - events without a non empty scalar value for one of these are rejected
+ * The url encoded data parameter holds the event as a JSON string, it is parsed before the projection.
+ */
+public class EventProjection {
+
+    private final ObjectMapper mapper;
+    private final boolean enabled;
+    private final Set<String> allowedFields;
+    private final List<String[]> dropPaths = new ArrayList<>();
+    private final List<String> requiredFields;
+
+    public EventProjection(ObjectMapper mapper, boolean enabled, List<String> allowedFields, List<String> dropFields,
+                           List<String> requiredFields) {
+        this.mapper = mapper;
+        this.enabled = enabled;
+        this.allowedFields = new HashSet<>(allowedFields);
+        for (String path : dropFields) {
+            dropPaths.add(path.split("\\.", 2));
+        }
+        this.requiredFields = requiredFields;
+    }
+
+    //Read Config from env variables
+    public static EventProjection fromEnvironment(ObjectMapper mapper) {
+        return new EventProjection(mapper,
+            Boolean.parseBoolean(System.getenv("EVENT_PROJECTION")),
+            fields(System.getenv("EVENT_ALLOWED_FIELDS")),
+            fields(System.getenv("EVENT_DROP_FIELDS")),
+            fields(System.getenv("EVENT_REQUIRED_FIELDS")));
+    }
+
+    /**
+     * Returns the projected event, null when the event is malformed
+     */
+    public Object project(Object element) {
+        if (!enabled) {
+            return element;
+        }
+        if (element instanceof String) {
+            try {
+                element = mapper.readValue((String) element, Object.class);
+            } catch (IOException e) {
+                return null;
+            }
+        }
+        if (!(element instanceof Map)) {
+            return null;
+        }
+        Map<?, ?> event = (Map<?, ?>) element;
+        for (String field : requiredFields) {
+            Object value = event.get(field);
+            if (value == null || value instanceof Map || value instanceof Collection || value.toString().isEmpty()) {
+                return null;
+            }
+        }
+
+        Map<Object, Object> projected = new LinkedHashMap<>();
+        for (Map.Entry<?, ?> entry : event.entrySet()) {
+            if (allowedFields.isEmpty() || allowedFields.contains(String.valueOf(entry.getKey()))) {
+                projected.put(entry.getKey(), entry.getValue());
+            }
+        }
+        for (String[] path : dropPaths) {
+            if (path.length == 1) {
+                projected.remove(path[0]);
+            } else if (projected.get(path[0]) instanceof Map) {
+                Map<Object, Object> child = new LinkedHashMap<>((Map<?, ?>) projected.get(path[0]));
+                child.remove(path[1]);
+                projected.put(path[0], child);
+            }
+        }
+        return projected;
+    }
+
+    private static List<String> fields(String value) {
+        List<String> fields = new ArrayList<>();
+        if (value == null) {
+            return fields;
+        }
+        for (String field : value.split(",")) {
+            if (!field.trim().isEmpty()) {
+                fields.add(field.trim());
+            }
+        }
+        return fields;
+    }
+}
@@ -12,27 +12,48 @@
  import org.springframework.web.bind.annotation.*;
  import org.springframework.http.*;
  
- import java.io.UnsupportedEncodingException;
  import java.nio.ByteBuffer;
  import java.util.*;
+ import java.util.concurrent.ExecutionException;
+ import java.util.concurrent.Future;
+ import java.util.concurrent.TimeUnit;
+ import java.util.concurrent.TimeoutException;
+ import javax.annotation.PreDestroy;
  
  import com.amazonaws.services.kinesis.producer.*;
 import com.fasterxml.jackson.core.JsonProcessingException;
 import com.fasterxml.jackson.databind.ObjectMapper;
+import org.slf4j.Logger;
+import org.slf4j.LoggerFactory;
  
  
  @RestController
  public class InputEventController {
  
+     private static final Logger LOGGER = LoggerFactory.getLogger(InputEventController.class);
+ 
      //Read Config from env variables
      String region = System.getenv("REGION");
      static String streamName = System.getenv("STREAM_NAME");
+     private final PartitionKeyStrategy partitionKeys = PartitionKeyStrategy.fromEnvironment();
+     private final BackpressureLimits limits = BackpressureLimits.fromEnvironment();
+     // ObjectMapper is thread safe once configured, one instance serves every request
+     private static final ObjectMapper MAPPER = new ObjectMapper();
+     private final EventLogger eventLogger = EventLogger.fromEnvironment(MAPPER);
+     private final EventProjection projection = EventProjection.fromEnvironment(MAPPER);
  
  
  
-     private final KinesisProducerConfiguration config = new KinesisProducerConfiguration().setRegion(region);
+     private final KinesisProducerConfiguration config = KplConfiguration.fromEnvironment(region);
      private final KinesisProducer kinesis = new KinesisProducer(config);
  
+     //Flush buffered records when the task is stopped, e.g. on a FARGATE_SPOT interruption
+     @PreDestroy
+     public void shutdown() {
+         kinesis.flushSync();
+         kinesis.destroy();
+     }
+
      //Healthcheck
      @GetMapping(value="/healthcheck")
      public void returnHealthy() {
@@ -45,28 +66,10 @@ import com.fasterxml.jackson.databind.ObjectMapper;
          consumes = "!application/x-www-form-urlencoded",
          produces = MediaType.APPLICATION_JSON_VALUE
          )
-     public void processInputEvent(@RequestBody Map<String, Object> payload) throws UnsupportedEncodingException {
+     public ResponseEntity<Map<String, Object>> processInputEvent(@RequestBody Map<String, Object> payload) {
         //String element = (String) payload.get("data");
         Object element = (Object) payload.get("data");
-        //String key = UUID.randomUUID().toString();
-        final String key = Long.toString(System.currentTimeMillis());
-        // covert element to ByteBuffer
-        ObjectMapper mapper = new ObjectMapper();
-        try {
-                String element_json = mapper.writeValueAsString(element);
-                System.out.println("ResultingJSONstring = " + element_json);
-                //System.out.println(json);
-                ByteBuffer data = ByteBuffer.wrap(element_json.getBytes("UTF-8"));
-                kinesis.addUserRecord(streamName, key, data);
-            } catch (JsonProcessingException e) {
-                e.printStackTrace();
-            }
-         /*
-         * You can implement a synchronous or asynchronous response to results
-         * https://docs.aws.amazon.com/streams/latest/dev/kinesis-kpl-writing.html 
-         */
- 
-         return;
+        return putRecord(element);
      }
      //Handler for post requests with URL encoded input
      @PostMapping(
@@ -74,28 +77,102 @@ import com.fasterxml.jackson.databind.ObjectMapper;
          consumes = "application/x-www-form-urlencoded",
          produces = MediaType.APPLICATION_JSON_VALUE
          )
-     public void processInputEventUrlEncoded(@RequestParam Map<String, Object> payload) throws UnsupportedEncodingException {
+     public ResponseEntity<Map<String, Object>> processInputEventUrlEncoded(@RequestParam Map<String, Object> payload) {
          //String element = (String) payload.get("data");
          Object element = (Object) payload.get("data");
-         //String key = UUID.randomUUID().toString()
-         final String key = Long.toString(System.currentTimeMillis());
+         return putRecord(element);
+     }
+
+     private ResponseEntity<Map<String, Object>> putRecord(Object element) {
+         // the KPL buffers records without limit, reject the request while the buffer is full so the caller retries
+         // instead of the heap filling up
+         if (limits.isFull(kinesis.getOutstandingRecordsCount())) {
+             return unavailable("OutstandingRecordsLimitExceeded", "Too many records waiting to be sent to kinesis");
+         }
+         // drops the unused fields before the record is sized and buffered, malformed events never reach kinesis
+         final Object event = projection.project(element);
+         if (event == null) {
+             return badRequest("MalformedEvent", "The event is not a JSON object or misses a required field");
+         }
+         // the url encoded data parameter holds the event as a JSON string, the key is read from its fields
+         // whether or not the projection parsed it
+         final String key = partitionKeys.keyFor(parsed(event));
          // covert element to ByteBuffer
-         ObjectMapper mapper = new ObjectMapper();
+         Future<UserRecordResult> result;
          try {
-                String element_json = mapper.writeValueAsString(element);
-                System.out.println("ResultingJSONstring = " + element_json);
-                //System.out.println(json);
-                ByteBuffer data = ByteBuffer.wrap(element_json.getBytes("UTF-8"));
-                kinesis.addUserRecord(streamName, key, data);
+                byte[] element_json = MAPPER.writeValueAsBytes(event);
+                eventLogger.record(key, element_json);
+                ByteBuffer data = ByteBuffer.wrap(element_json);
+                result = kinesis.addUserRecord(streamName, key, data);
             } catch (JsonProcessingException e) {
-                e.printStackTrace();
+                LOGGER.warn("Could not serialize event", e);
+                return ResponseEntity.badRequest().build();
             }
-         
          /*
          * You can implement a synchronous or asynchronous response to results
          * https://docs.aws.amazon.com/streams/latest/dev/kinesis-kpl-writing.html 
+         * by default the request is answered once the record is buffered, SYNCHRONOUS_ACK waits for the result
          */
- 
-         return;
+         if (!limits.isSynchronousAck()) {
+             return ResponseEntity.ok().build();
+         }
+         try {
+             UserRecordResult recordResult = result.get(limits.getAckTimeoutMillis(), TimeUnit.MILLISECONDS);
+             if (!recordResult.isSuccessful()) {
+                 return failed(recordResult);
+             }
+             Map<String, Object> body = new HashMap<>();
+             body.put("ShardId", recordResult.getShardId());
+             body.put("SequenceNumber", recordResult.getSequenceNumber());
+             return ResponseEntity.ok(body);
+         } catch (ExecutionException e) {
+             if (e.getCause() instanceof UserRecordFailedException) {
+                 return failed(((UserRecordFailedException) e.getCause()).getResult());
+             }
+             return unavailable("RecordFailed", String.valueOf(e.getCause()));
+         } catch (TimeoutException e) {
+             // the record stays buffered and may still be written, the caller's retry can duplicate it
+             return unavailable("AckTimeout", "No result from kinesis within " + limits.getAckTimeoutMillis() + " ms");
+         } catch (InterruptedException e) {
+             Thread.currentThread().interrupt();
+             return unavailable("Interrupted", "Interrupted while waiting for the kinesis result");
+         }
+     }
+
+     private static Object parsed(Object element) {
+         if (!(element instanceof String)) {
+             return element;
+         }
+         try {
+             return MAPPER.readValue((String) element, Object.class);
+         } catch (JsonProcessingException e) {
+             // not JSON, keyFor falls back to a random key
+             return element;
+         }
+     }
+
+     private ResponseEntity<Map<String, Object>> failed(UserRecordResult recordResult) {
+         List<Attempt> attempts = recordResult.getAttempts();
+         if (attempts.isEmpty()) {
+             return unavailable("RecordFailed", "Record was not written to kinesis");
+         }
+         Attempt last = attempts.get(attempts.size() - 1);
+         return unavailable(last.getErrorCode(), last.getErrorMessage());
+     }
+
+     private ResponseEntity<Map<String, Object>> badRequest(String errorCode, String errorMessage) {
+         Map<String, Object> body = new HashMap<>();
+         body.put("ErrorCode", errorCode);
+         body.put("ErrorMessage", errorMessage);
+         return ResponseEntity.badRequest().body(body);
+     }
+
+     private ResponseEntity<Map<String, Object>> unavailable(String errorCode, String errorMessage) {
+         Map<String, Object> body = new HashMap<>();
+         body.put("ErrorCode", errorCode);
+         body.put("ErrorMessage", errorMessage);
+         return ResponseEntity.status(HttpStatus.SERVICE_UNAVAILABLE)
+             .header(HttpHeaders.RETRY_AFTER, String.valueOf(limits.getRetryAfterSeconds()))
+             .body(body);
      }
- } 
\ No newline at end of file
+ }
@@ -0,0 +1,53 @@
+/**
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+ */
+
+package com.amazonaws.services.kinesis.samples.dataprocessor;
+
+import java.util.Map;
+import java.util.Properties;
+
+import com.amazonaws.services.kinesis.producer.KinesisProducerConfiguration;
+
+/**
+ * Builds the KPL configuration from the KPL_ environment variables set by the stack, see deployment/producer_settings.py
+ * KPL_RECORD_MAX_BUFFERED_TIME=100 sets the RecordMaxBufferedTime property, settings without a variable keep the KPL default.
+ */
+public final class KplConfiguration {
+
+    private static final String PREFIX = "KPL_";
+
+    private KplConfiguration() {
+    }
+
+    //Read Config from env variables
+    public static KinesisProducerConfiguration fromEnvironment(String region) {
+        return fromProperties(System.getenv(), region);
+    }
+
+    static KinesisProducerConfiguration fromProperties(Map<String, String> environment, String region) {
+        Properties properties = new Properties();
+        for (Map.Entry<String, String> variable : environment.entrySet()) {
+            if (variable.getKey().startsWith(PREFIX) && !variable.getValue().isEmpty()) {
+                properties.setProperty(propertyName(variable.getKey()), variable.getValue());
+            }
+        }
+        return KinesisProducerConfiguration.fromProperties(properties).setRegion(region);
+    }
+
+    // KPL_AGGREGATION_MAX_COUNT -> AggregationMaxCount
+    static String propertyName(String variable) {
+        StringBuilder name = new StringBuilder();
+        for (String word : variable.substring(PREFIX.length()).toLowerCase().split("_")) {
+            if (!word.isEmpty()) {
+                name.append(Character.toUpperCase(word.charAt(0))).append(word.substring(1));
+            }
+        }
+        return name.toString();
+    }
+}
@@ -0,0 +1,70 @@
+/**
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+ */
+
+package com.amazonaws.services.kinesis.samples.dataprocessor;
+
+import java.util.Map;
+import java.util.concurrent.ThreadLocalRandom;
+
+/**
+ * Partition key strategies shared with the api gateway mapping template, see deployment/partition_key.py
+ *   session_id - ga_session_id of the event
+ *   client_id  - client_id of the event
+ *   random     - a random key per event
+ *   composite  - salt|client_id|ga_session_id
+ * Events that don't carry the fields of the strategy get a random key so they don't pile up on one shard.
+ */
+public class PartitionKeyStrategy {
+
+    private final String strategy;
+    private final String salt;
+
+    public PartitionKeyStrategy(String strategy, String salt) {
+        this.strategy = strategy == null || strategy.isEmpty() ? "session_id" : strategy;
+        this.salt = salt == null ? "" : salt;
+    }
+
+    //Read Config from env variables
+    public static PartitionKeyStrategy fromEnvironment() {
+        return new PartitionKeyStrategy(System.getenv("PARTITION_KEY_STRATEGY"), System.getenv("PARTITION_KEY_SALT"));
+    }
+
+    public String keyFor(Object element) {
+        Map<?, ?> event = element instanceof Map ? (Map<?, ?>) element : null;
+        String sessionId = event == null ? null : valueOf(event.get("ga_session_id"));
+        String clientId = event == null ? null : valueOf(event.get("client_id"));
+
+        switch (strategy) {
+            case "session_id":
+                return sessionId != null ? sessionId : randomKey();
+            case "client_id":
+                return clientId != null ? clientId : randomKey();
+            case "composite":
+                if (clientId == null && sessionId == null) {
+                    return randomKey();
+                }
+                return salt + "|" + (clientId == null ? "" : clientId) + "|" + (sessionId == null ? "" : sessionId);
+            default:
+                return randomKey();
+        }
+    }
+
+    private static String valueOf(Object value) {
+        if (value == null) {
+            return null;
+        }
+        String text = value.toString();
+        return text.isEmpty() ? null : text;
+    }
+
+    private static String randomKey() {
+        ThreadLocalRandom random = ThreadLocalRandom.current();
+        return Long.toHexString(random.nextLong()) + Long.toHexString(random.nextLong());
+    }
+}
@@ -0,0 +1,18 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import pytest
+
+from tests.unit.helpers import synth_stacks
+
+
+@pytest.fixture
+def synth_templates():
+    """
+    Returns synth_stacks, the function that synthesizes both stacks with the example context updated with the
+    given values and returns the (ServerSideTaggerStack, AWSAnalyticsStack) templates
+    """
+    return synth_stacks
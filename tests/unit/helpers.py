@@ -0,0 +1,45 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Example context and synthesis shared by the stack tests, the synth_templates fixture of conftest.py returns synth_stacks.
+import json
+import os
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from deployment.aws_analytics_stack import AWSAnalyticsStack
+from deployment.server_side_tagger_stack import ServerSideTaggerStack
+
+DIRNAME = os.path.dirname(__file__)
+
+with open(os.path.join(DIRNAME, "..", "..", "cdk.context.json.example")) as example:
+    CONTEXT = json.load(example)
+
+# the stacks read the account and region the cdk cli sets for the app
+os.environ.setdefault("CDK_DEFAULT_ACCOUNT", "111111111111")
+os.environ.setdefault("CDK_DEFAULT_REGION", "us-west-2")
+ENV = core.Environment(account=os.environ["CDK_DEFAULT_ACCOUNT"], region=os.environ["CDK_DEFAULT_REGION"])
+
+
+def synth_stacks(capacity_plan=None, **context):
+    """
+    Synthesizes both stacks with the example context updated with the given values and returns the
+    (ServerSideTaggerStack, AWSAnalyticsStack) templates
+    """
+    # asset bundling (the flink application code) needs docker, the templates don't depend on it
+    app = core.App(context={**CONTEXT, "aws:cdk:bundling-stacks": [], **context})
+    server_side_tagger_stack = ServerSideTaggerStack(app, "ServerSideTaggerStack", env=ENV, capacity_plan=capacity_plan)
+    aws_analytics_stack = AWSAnalyticsStack(app, "AWSAnalyticsStack", env=ENV,
+        vpc=server_side_tagger_stack.vpc,
+        load_balancer=server_side_tagger_stack.load_balancer,
+        cluster=server_side_tagger_stack.ecs_cluster,
+        hosted_zone=server_side_tagger_stack.hosted_zone,
+        primary_security_group=server_side_tagger_stack.primary_security_group,
+        capacity_plan=capacity_plan,
+    )
+    return assertions.Template.from_stack(server_side_tagger_stack), assertions.Template.from_stack(aws_analytics_stack)
@@ -0,0 +1,313 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import json
+import os
+import re
+import subprocess
+
+import pytest
+from aws_cdk.assertions import Match
+
+from deployment.capacity_planner import CapacityPlan
+from deployment.event_schema import load_sample_event
+
+GTM_TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "source", "gtm_template.js")
+# runs the tag template with the sandbox apis it requires and prints the bodies it sends
+GTM_SANDBOX = """
+const fs = require('fs');
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+const bodies = [];
+const apis = {
+    sendHttpRequest: (url, callback, options, body) => { bodies.push(JSON.parse(body)); callback(200, {}, ''); },
+    getAllEventData: () => JSON.parse(JSON.stringify(input.event)),
+    makeInteger: (value) => parseInt(value, 10),
+    makeTableMap: () => ({}),
+    JSON: JSON,
+    getRequestHeader: () => undefined,
+    logToConsole: () => {},
+    getContainerVersion: () => ({debugMode: false}),
+};
+const data = Object.assign({url: 'https://gtm.example', requestMethod: 'POST', gtmOnSuccess: () => {}, gtmOnFailure: () => {}}, input.data);
+new Function('require', 'data', fs.readFileSync(input.path, 'utf8'))((name) => apis[name], data);
+console.log(JSON.stringify(bodies));
+"""
+
+
+def tag_request_bodies(event, **data):
+    """
+    Bodies the gtm tag template sends for the event with the tag fields in data
+    """
+    result = subprocess.run(["node", "-e", GTM_SANDBOX], input=json.dumps({"path": GTM_TEMPLATE_PATH, "event": event, "data": data}),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def test_producer_service_scales_on_requests_and_response_time(synth_templates):
+    _, template = synth_templates(data_capture_api_method="kinesis_producer",
+                                  producer_autoscaling={"response_time_steps": [{"lower": 0.2, "change": 2}]})
+
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": {
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ALBRequestCountPerTarget"},
+            "TargetValue": 60000,
+        },
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": {
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ECSServiceAverageMemoryUtilization"},
+            "TargetValue": 70,
+        },
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "StepScaling",
+        "StepScalingPolicyConfiguration": {
+            "StepAdjustments": [Match.object_like({"MetricIntervalLowerBound": 0, "ScalingAdjustment": 2})],
+        },
+    })
+
+
+def test_api_gateway_mode_has_no_producer_scaling(synth_templates):
+    _, template = synth_templates(data_capture_api_method="api_gateway")
+
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalingPolicy", 0)
+
+
+def test_producer_runs_on_graviton_and_spot(synth_templates):
+    tagger, template = synth_templates(data_capture_api_method="kinesis_producer",
+                                       producer_cpu_architecture="ARM64", fargate_spot_weight=3)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "RuntimePlatform": {"CpuArchitecture": "ARM64", "OperatingSystemFamily": "LINUX"},
+    })
+    template.has_resource_properties("AWS::ECS::Service", {
+        "CapacityProviderStrategy": [
+            {"CapacityProvider": "FARGATE", "Base": 1, "Weight": 1},
+            {"CapacityProvider": "FARGATE_SPOT", "Weight": 3},
+        ],
+    })
+    tagger.has_resource_properties("AWS::ECS::ClusterCapacityProviderAssociations", {
+        "CapacityProviders": ["FARGATE", "FARGATE_SPOT"],
+    })
+    # the gtm image stays on X86_64 unless gtm_cpu_architecture is set
+    tagger.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "RuntimePlatform": {"CpuArchitecture": "X86_64"},
+    })
+
+
+def test_producer_backpressure_environment(synth_templates):
+    _, template = synth_templates(data_capture_api_method="kinesis_producer",
+                                  producer_backpressure={"synchronous_ack": True, "retry_after_seconds": 2})
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [Match.object_like({
+            "Environment": Match.array_with([
+                # a quarter of the 2 GiB heap at 2 KiB per record
+                {"Name": "MAX_OUTSTANDING_RECORDS", "Value": "262144"},
+                {"Name": "RETRY_AFTER_SECONDS", "Value": "2"},
+                {"Name": "SYNCHRONOUS_ACK", "Value": "true"},
+                {"Name": "ACK_TIMEOUT_MILLIS", "Value": "2000"},
+            ]),
+        })],
+    })
+
+
+def test_producer_kpl_settings(synth_templates):
+    _, template = synth_templates(data_capture_api_method="kinesis_producer",
+                                  kpl_settings={"record_max_buffered_time": 500, "rate_limit": 90})
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [Match.object_like({
+            "Environment": Match.array_with([
+                {"Name": "KPL_METRICS_LEVEL", "Value": "summary"},
+                {"Name": "KPL_RECORD_MAX_BUFFERED_TIME", "Value": "500"},
+                {"Name": "KPL_RATE_LIMIT", "Value": "90"},
+            ]),
+        })],
+    })
+    template.has_resource_properties("AWS::IAM::Policy", {
+        "PolicyDocument": {
+            "Statement": Match.array_with([Match.object_like({"Action": "cloudwatch:PutMetricData", "Resource": "*"})]),
+        },
+    })
+
+
+def test_firehose_defaults_write_newline_delimited_gzip(synth_templates):
+    _, template = synth_templates()
+
+    template.has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "ExtendedS3DestinationConfiguration": Match.object_like({
+            "BufferingHints": {"IntervalInSeconds": 300, "SizeInMBs": 64},
+            "CompressionFormat": "GZIP",
+            "Prefix": "raw/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/",
+            "ErrorOutputPrefix": "errors/!{firehose:error-output-type}/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/",
+            "ProcessingConfiguration": {
+                "Enabled": True,
+                "Processors": [{
+                    "Type": "AppendDelimiterToRecord",
+                    "Parameters": [{"ParameterName": "Delimiter", "ParameterValue": "\\n"}],
+                }],
+            },
+        }),
+    })
+
+
+def test_firehose_settings_from_context(synth_templates):
+    _, template = synth_templates(firehose_delivery={
+        "buffer_mb": 128, "buffer_interval_seconds": 900, "compression": "Snappy", "newline_delimiter": False,
+        "prefix": "json/", "error_prefix": "failed/",
+    })
+
+    template.has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "ExtendedS3DestinationConfiguration": Match.object_like({
+            "BufferingHints": {"IntervalInSeconds": 900, "SizeInMBs": 128},
+            "CompressionFormat": "Snappy",
+            "Prefix": "json/",
+            "ErrorOutputPrefix": "failed/",
+            "ProcessingConfiguration": Match.absent(),
+        }),
+    })
+
+
+def test_parquet_delivery_compresses_pages(synth_templates):
+    _, template = synth_templates(parquet_delivery=True, firehose_delivery={"compression": "GZIP", "buffer_mb": 16})
+
+    template.has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "ExtendedS3DestinationConfiguration": Match.object_like({
+            "BufferingHints": {"IntervalInSeconds": 300, "SizeInMBs": 64},
+            "CompressionFormat": "UNCOMPRESSED",
+            "Prefix": Match.string_like_regexp("^events/event_name="),
+            "DataFormatConversionConfiguration": Match.object_like({
+                "OutputFormatConfiguration": {"Serializer": {"ParquetSerDe": {"Compression": "GZIP"}}},
+            }),
+        }),
+    })
+
+
+def test_firehose_rejects_unsupported_compression(synth_templates):
+    with pytest.raises(ValueError, match="ZSTD"):
+        synth_templates(firehose_delivery={"compression": "ZSTD"})
+    with pytest.raises(ValueError):
+        synth_templates(firehose_delivery={"buffer_mb": 256})
+
+
+def test_producer_service_connect_bypasses_the_load_balancer(synth_templates):
+    tagger, template = synth_templates(data_capture_api_method="kinesis_producer", producer_service_connect=True)
+
+    tagger.has_resource_properties("AWS::ServiceDiscovery::HttpNamespace", {"Name": "gtm.internal"})
+    tagger.has_resource_properties("AWS::ECS::Service", {
+        "ServiceName": "GTMServerSidePrimaryService",
+        "ServiceConnectConfiguration": {"Enabled": True, "Namespace": "gtm.internal", "Services": Match.absent()},
+    })
+    template.has_resource_properties("AWS::ECS::Service", {
+        "ServiceName": "GTMServerSideproducerService",
+        "ServiceConnectConfiguration": {
+            "Enabled": True,
+            "Services": [{"PortName": "producer", "DiscoveryName": "producer",
+                          "ClientAliases": [{"DnsName": Match.any_value(), "Port": 80}]}],
+        },
+    })
+    # only the primary tasks reach the producer, not the whole vpc
+    template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+        "FromPort": 8080,
+        "SourceSecurityGroupId": {"Fn::ImportValue": Match.string_like_regexp("GTMPrimaryServiceSecurityGroup")},
+    })
+    template.resource_properties_count_is("AWS::EC2::SecurityGroupIngress", {"CidrIp": Match.any_value()}, 0)
+    # internal only, no listener rule, CNAME or target group based scaling
+    tagger.resource_properties_count_is("AWS::ElasticLoadBalancingV2::ListenerRule", {"Priority": 3}, 0)
+    template.resource_count_is("AWS::Route53::RecordSet", 0)
+    template.resource_properties_count_is("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": {
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ALBRequestCountPerTarget"}},
+    }, 0)
+
+    tagger, with_load_balancer = synth_templates(data_capture_api_method="kinesis_producer",
+                                                 producer_service_connect={"load_balancer_path": True, "port": 8080})
+    tagger.resource_properties_count_is("AWS::ElasticLoadBalancingV2::ListenerRule", {"Priority": 3}, 1)
+    with_load_balancer.resource_count_is("AWS::Route53::RecordSet", 1)
+
+    with pytest.raises(ValueError, match="api_gateway"):
+        synth_templates(data_capture_api_method="api_gateway", producer_service_connect=True)
+
+
+def test_event_projection_in_both_ingestion_paths(synth_templates):
+    _, api_gateway = synth_templates(data_capture_api_method="api_gateway", event_projection=True)
+
+    api_gateway.has_resource_properties("AWS::ApiGateway::Model", {
+        "Name": "GAEvent",
+        "Schema": Match.object_like({"required": ["event_name", "client_id"]}),
+    })
+    methods = api_gateway.find_resources("AWS::ApiGateway::Method", {"Properties": {"HttpMethod": "POST"}}).values()
+    assert len(methods) == 2
+    for method in methods:
+        properties = method["Properties"]
+        assert "RequestValidatorId" in properties and "application/json" in properties["RequestModels"]
+        template = properties["Integration"]["RequestTemplates"]["application/json"]
+        assert '#set($dropped = {"client_hints":["full_version_list","brands"]})' in template
+        assert '$util.base64Encode("$projected")' in template
+
+    _, producer = synth_templates(data_capture_api_method="kinesis_producer",
+                                  event_projection={"allow_list": False, "drop_fields": ["client_hints.brands"]})
+    producer.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": [Match.object_like({"Environment": Match.array_with([
+            {"Name": "EVENT_PROJECTION", "Value": "true"},
+            {"Name": "EVENT_ALLOWED_FIELDS", "Value": ""},
+            {"Name": "EVENT_DROP_FIELDS", "Value": "client_hints.brands"},
+            {"Name": "EVENT_REQUIRED_FIELDS", "Value": "event_name,client_id"},
+        ])})],
+    })
+
+
+@pytest.mark.parametrize("event_projection", [False, True])
+def test_batch_resource_reads_the_tag_envelope(synth_templates, event_projection):
+    event = load_sample_event()
+    (body,) = tag_request_bodies(event, includeEventData=True, inside_array=True)
+    # the producer reads the event from the data key of a single event
+    assert tag_request_bodies(event, includeEventData=True) == [{"data": event}]
+
+    _, template = synth_templates(data_capture_api_method="api_gateway", event_projection=event_projection)
+    (model,) = template.find_resources("AWS::ApiGateway::Model", {"Properties": {"Name": "BatchEvents"}}).values()
+    resources = template.find_resources("AWS::ApiGateway::Resource", {"Properties": {"PathPart": "batch"}})
+    (method,) = [method["Properties"] for method in template.find_resources("AWS::ApiGateway::Method").values()
+                 if method["Properties"].get("ResourceId") == {"Ref": next(iter(resources))}]
+    request_template = method["Integration"]["RequestTemplates"]["application/json"]
+
+    assert isinstance(body, list) and len(body) == 1
+    items = model["Properties"]["Schema"]["items"]
+    assert all(field in body[0] for field in items.get("required", []))
+    # the partition key and the projection read the fields at the top of every record
+    fields = set(re.findall(r"\$event\.(\w+)(?![\w(])", request_template))
+    assert fields and fields <= body[0].keys()
+    assert body == [event]
+
+
+def test_stream_mode_retention_and_consumers(synth_templates):
+    _, template = synth_templates(CapacityPlan(shard_count=4), kinesis_stream={
+        "stream_mode": "ON_DEMAND", "retention_hours": 72, "consumers": ["flink", "realtime"]})
+
+    template.has_resource_properties("AWS::Kinesis::Stream", {
+        "RetentionPeriodHours": 72,
+        "StreamModeDetails": {"StreamMode": "ON_DEMAND"},
+        "ShardCount": Match.absent(),
+    })
+    template.resource_count_is("AWS::Kinesis::StreamConsumer", 2)
+    template.has_output("StreamConsumerrealtimeArn", {})
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "Metrics": [Match.object_like({"MetricStat": Match.object_like({"Metric": Match.object_like({
+            "MetricName": "SubscribeToShardEvent.MillisBehindLatest",
+            "Dimensions": Match.array_with([{"Name": "ConsumerName", "Value": "realtime"}]),
+        })})})],
+    })
+
+    # the shard count of the context overrides the capacity plan
+    _, provisioned = synth_templates(CapacityPlan(shard_count=4), kinesis_stream={"shard_count": 6})
+    provisioned.has_resource_properties("AWS::Kinesis::Stream", {"ShardCount": 6, "RetentionPeriodHours": 24})
+    provisioned.resource_count_is("AWS::Kinesis::StreamConsumer", 0)
+
+    with pytest.raises(ValueError, match="ON_DEMAND"):
+        synth_templates(kinesis_stream={"stream_mode": "ON_DEMAND", "shard_count": 2})
+    with pytest.raises(ValueError, match="retention_hours"):
+        synth_templates(kinesis_stream={"retention_hours": 12})
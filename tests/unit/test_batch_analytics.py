@@ -0,0 +1,117 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import gzip
+import json
+import os
+from collections import Counter
+
+import pytest
+
+from analytics.batch_analytics import BatchReport, main, run, split_objects
+from analytics.compaction import LocalStorage, compact_partition
+from analytics.sketches import CountMinSketch, HyperLogLog
+from analytics.streaming_aggregator import OVERFLOW_KEY
+from benchmarks.events import generate_events
+
+
+def test_hyperloglog_estimate_and_merge():
+    first, second = HyperLogLog(12), HyperLogLog(12)
+    for value in range(20000):
+        first.add(f"client-{value}")
+    for value in range(10000, 40000):
+        second.add(f"client-{value}")
+    # duplicates don't change the estimate
+    for value in range(1000):
+        first.add(f"client-{value}")
+
+    assert first.count() == pytest.approx(20000, rel=0.05)
+    assert first.merge(second).count() == pytest.approx(40000, rel=0.05)
+    assert HyperLogLog.from_dict(first.to_dict()).count() == first.count()
+    assert HyperLogLog(12).count() == 0
+    with pytest.raises(ValueError):
+        first.merge(HyperLogLog(10))
+
+
+def test_count_min_sketch_bounds_and_heavy_hitters():
+    counts = Counter({f"/page-{page}": 1000 // (page + 1) for page in range(200)})
+    first, second = CountMinSketch(width=256, depth=4, heavy_hitters=20), CountMinSketch(width=256, depth=4, heavy_hitters=20)
+    for index, (page, count) in enumerate(counts.items()):
+        (first if index % 2 else second).add(page, count)
+
+    merged = CountMinSketch.from_dict(first.to_dict()).merge(second)
+    for page, count in counts.items():
+        assert count <= merged.estimate(page) <= count + merged.total * 2.72 / 256
+    assert [page for page, _ in merged.most_common(3)] == ["/page-0", "/page-1", "/page-2"]
+    assert merged.total == sum(counts.values())
+
+
+def write_events(root, key, events):
+    path = os.path.join(root, *key.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt") as object_file:
+        for event in events:
+            object_file.write(json.dumps(event) + "\n")
+
+
+def test_report_over_a_directory_matches_exact_counts(tmp_path):
+    root = str(tmp_path)
+    events = list(generate_events(3000, sessions=500, pages=30))
+    for part in range(6):
+        write_events(root, f"raw/dt=2023-12-07/hr=07/stream-{part}", events[part::6])
+    write_events(root, "raw/dt=2023-12-07/hr=07/_COMPACTED.json", [])
+
+    serial = run(LocalStorage(root), "raw/", workers=1).result(top=3)
+    parallel = run(LocalStorage(root), "raw/", workers=2).result(top=3)
+
+    assert serial == parallel
+    assert serial["events"] == 3000
+    assert serial["daily_unique_clients"]["2023-12-07"] == pytest.approx(len({e["client_id"] for e in events}), rel=0.05)
+    page_views = Counter(e["page_location"] for e in events if e["event_name"] == "page_view")
+    assert [row["page_views"] for row in serial["top_pages"]] == [count for _, count in page_views.most_common(3)]
+    assert all(page_views[row["page_location"]] == row["page_views"] for row in serial["top_pages"])
+
+
+@pytest.mark.parametrize("file_format", ["gzip-json", "zstd-json", "parquet"])
+def test_report_over_compacted_files(tmp_path, file_format):
+    root = str(tmp_path)
+    for part, events in enumerate([generate_events(400, sessions=50, seed=1), generate_events(400, sessions=50, seed=2)]):
+        write_events(root, f"raw/dt=2023-12-07/hr=07/stream-{part}", events)
+
+    compact_partition(LocalStorage(root), "raw/dt=2023-12-07/hr=07/", file_format=file_format)
+
+    assert run(LocalStorage(root), "compacted/").result() == run(LocalStorage(root), "raw/").result()
+
+
+def test_pages_over_the_limit_are_counted_as_overflow():
+    report = BatchReport(max_pages=5)
+    for event in generate_events(500, pages=20):
+        report.add(event)
+    report.add({"event_name": "page_view"})
+
+    assert len(report.page_clients) == 6
+    assert OVERFLOW_KEY in report.page_clients
+    assert report.invalid == 1
+
+
+def test_saved_sketches_merge_across_days(tmp_path, capsys):
+    for day, start_time_ms in (("2023-12-07", 1701933991153), ("2023-12-08", 1702020391153)):
+        write_events(str(tmp_path / day), f"raw/dt={day}/hr=00/stream",
+                     generate_events(1000, sessions=200, start_time_ms=start_time_ms))
+        main([str(tmp_path / day), "--workers", "1", "--save", str(tmp_path / f"{day}.json")])
+    capsys.readouterr()
+
+    main(["--merge", str(tmp_path / "2023-12-07.json"), str(tmp_path / "2023-12-08.json")])
+    result = json.loads(capsys.readouterr().out)
+
+    assert result["events"] == 2000
+    assert set(result["daily_unique_clients"]) == {"2023-12-07", "2023-12-08"}
+    assert all(count == pytest.approx(200, rel=0.05) for count in result["daily_unique_clients"].values())
+
+
+def test_split_objects_balances_sizes():
+    groups = split_objects([("a", 100), ("b", 60), ("c", 50), ("d", 10)], 2)
+    assert sorted(groups) == [["a", "d"], ["b", "c"]]
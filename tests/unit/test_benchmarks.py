@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.events import generate_events
+from benchmarks.kinesis_stub import InMemoryKinesis, ProvisionedThroughputExceeded
+from benchmarks.load_generator import check_thresholds, encode_body, run_benchmark
+from benchmarks.producer_stub import ProducerStub
+from deployment.event_schema import projection_settings
+from deployment.partition_key import partition_key
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_shard_record_limit_refills_per_second():
+    clock = FakeClock()
+    kinesis = InMemoryKinesis(1, clock=clock)
+
+    for _ in range(1000):
+        kinesis.put_record("key", b"x")
+    with pytest.raises(ProvisionedThroughputExceeded):
+        kinesis.put_record("key", b"x")
+
+    clock.now = 0.5
+    response = kinesis.put_records([{"PartitionKey": "key", "Data": b"x"}] * 500)
+    assert response["FailedRecordCount"] == 0
+    assert kinesis.put_records([{"PartitionKey": "key", "Data": b"x"}])["Records"][0]["ErrorCode"] == \
+        "ProvisionedThroughputExceededException"
+    assert kinesis.stats()[0] == {"shard_id": "shardId-000000000000", "records": 1500, "bytes": 6000, "throttled": 2}
+
+
+def test_shard_byte_limit():
+    kinesis = InMemoryKinesis(1, clock=FakeClock())
+    data = b"x" * (512 * 1024)
+
+    kinesis.put_record("k", data)
+    with pytest.raises(ProvisionedThroughputExceeded):
+        kinesis.put_record("k", data)
+
+
+@pytest.mark.parametrize("body_format", ["json", "form"])
+def test_producer_stub_accepts_both_bodies(body_format):
+    kinesis = InMemoryKinesis(2, keep_records=True)
+    stub = ProducerStub(kinesis, "client_id")
+    event = next(generate_events(1))
+    content_type, body = encode_body(event, body_format)
+
+    status, _, _ = stub.handle("POST", "/", {"content-type": content_type}, body)
+
+    assert status == 200
+    [(key, data)] = [record for shard in kinesis.shards for record in shard.data]
+    # form bodies carry the event as a string like @RequestParam in the producer, its fields still give the key
+    assert key == event["client_id"]
+    assert json.loads(data) == (event if body_format == "json" else json.dumps(event))
+
+
+def test_form_bodies_keep_the_partition_key_strategy():
+    events = list(generate_events(20, sessions=5))
+    for strategy, salt in [("session_id", ""), ("composite", "s1")]:
+        kinesis = InMemoryKinesis(1, keep_records=True)
+        stub = ProducerStub(kinesis, strategy, salt)
+        for event in events:
+            content_type, body = encode_body(event, "form")
+            assert stub.handle("POST", "/", {"content-type": content_type}, body)[0] == 200
+
+        keys = [key for key, _ in kinesis.shards[0].data]
+        assert keys == [partition_key(event, strategy, salt) for event in events]
+        assert len(set(keys)) == 5
+
+
+def test_producer_stub_throttles_with_retry_after():
+    stub = ProducerStub(InMemoryKinesis(1, records_per_second=1, clock=FakeClock()))
+    _, body = encode_body(next(generate_events(1)), "json")
+
+    assert stub.handle("POST", "/", {}, body)[0] == 200
+    status, headers, _ = stub.handle("POST", "/", {}, body)
+    assert (status, headers["Retry-After"]) == (503, "1")
+    assert stub.handle("POST", "/", {}, b"not json")[0] == 400
+
+
+def test_producer_stub_projects_events():
+    kinesis = InMemoryKinesis(1, keep_records=True)
+    stub = ProducerStub(kinesis, "client_id", projection=projection_settings(True))
+    event = next(generate_events(1))
+
+    for body_format in ("json", "form"):
+        content_type, body = encode_body(event, body_format)
+        assert stub.handle("POST", "/", {"content-type": content_type}, body)[0] == 200
+    # the form body is parsed before the projection and gets the client_id key
+    for key, data in kinesis.shards[0].data:
+        assert key == event["client_id"]
+        assert "brands" not in json.loads(data)["client_hints"]
+        assert len(data) < len(json.dumps(event, separators=(",", ":")))
+
+    status, _, body = stub.handle("POST", "/", {}, json.dumps({"data": {"client_id": "1.2"}}).encode("utf-8"))
+    assert (status, json.loads(body)["ErrorCode"]) == (400, "MalformedEvent")
+
+
+def test_benchmark_report():
+    report = asyncio.run(run_benchmark(rate=200, duration=0.5, concurrency=4, shards=2))
+
+    assert report["requests"] == 100
+    assert report["status_counts"] == {"200": 100}
+    assert sum(shard["records"] for shard in report["shards"]) == 100
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
+    assert check_thresholds(report, min_events_per_second=10 ** 6) != []
+    assert check_thresholds(report, max_throttled=0) == []
@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import pytest
+
+from deployment.capacity_planner import (
+    CapacityPlan, firehose_buffer_mb, format_report, plan_capacity, shards_needed, size_service,
+)
+
+
+def test_default_plan_keeps_stack_sizing():
+    plan = CapacityPlan()
+
+    assert (plan.primary_cpu, plan.primary_memory_mib) == (512, 1024)
+    assert (plan.primary_desired_count, plan.primary_min_capacity, plan.primary_max_capacity) == (3, 2, 10)
+    assert plan.producer_java_tool_options == "-XX:InitialHeapSize=1g -XX:MaxHeapSize=2g"
+
+
+def test_shards_limited_by_records_or_bytes():
+    # 1000 records/s of 100 bytes hits the record limit
+    assert shards_needed(1000, 100) == 1
+    assert shards_needed(1001, 100) == 2
+    # 1000 records/s of 2 KiB hits the 1 MiB/s limit
+    assert shards_needed(1000, 2048) == 2
+    assert shards_needed(0.5, 10) == 1
+
+
+def test_service_grows_task_size_before_task_count():
+    # 1000 events/s at 200 events per vCPU is 10 tasks of 0.5 vCPU
+    assert size_service(1000, 200, 1, 2) == (512, 1024, 3, 10)
+    # 10000 events/s would be 100 tasks of 0.5 vCPU, 4 vCPU tasks need 13
+    assert size_service(10000, 200, 1, 2) == (4096, 8192, 4, 13)
+
+
+def test_firehose_buffer_bounds():
+    assert firehose_buffer_mb(100) == 1
+    assert firehose_buffer_mb(1024 * 1024 / 300 * 10) == 10
+    assert firehose_buffer_mb(10 * 1024 * 1024) == 128
+
+
+def test_plan_applies_headroom():
+    plan = plan_capacity(peak_events_per_second=2000, average_payload_bytes=1600, headroom=1.5)
+
+    # 3000 events/s of 1600 bytes is 4.58 MiB/s
+    assert plan.stream_mode == "PROVISIONED"
+    assert plan.shard_count == 5
+    assert plan.primary_max_capacity == 15
+    assert plan.producer_heap_max_mib == plan.producer_memory_mib // 2
+    assert "5 shards" in format_report(plan)
+
+
+def test_auto_stream_mode_compares_cost():
+    # a spiky workload whose average is far below the peak is cheaper on demand
+    spiky = plan_capacity(20000, 1600, average_events_per_second=50)
+    steady = plan_capacity(2000, 1600, average_events_per_second=1500)
+
+    assert spiky.stream_mode == "ON_DEMAND"
+    assert spiky.shard_count is None
+    assert steady.stream_mode == "PROVISIONED"
+
+
+def test_invalid_inputs():
+    with pytest.raises(ValueError):
+        plan_capacity(0, 1600)
+    with pytest.raises(ValueError):
+        plan_capacity(100, 1600, headroom=0.5)
+    with pytest.raises(ValueError):
+        plan_capacity(100, 1600, stream_mode="fast")
+
+
+def test_producer_buffer_bounded_by_heap():
+    plan = plan_capacity(peak_events_per_second=2000, average_payload_bytes=1600)
+
+    assert plan.producer_max_outstanding_records == plan.producer_heap_max_mib * 1024 * 1024 // 4 // 1600
@@ -0,0 +1,187 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import gzip
+import io
+import json
+import os
+
+import pytest
+import pyarrow.parquet as parquet
+from aws_cdk.assertions import Match
+
+from analytics.compaction import (
+    LocalStorage,
+    MANIFEST_NAME,
+    compact,
+    compact_partition,
+    find_partitions,
+    iter_records,
+    main,
+)
+from deployment.compaction_job import source_prefix
+
+HOUR = "raw/dt=2023-12-07/hr=07/"
+
+
+def write_object(root, key, records, compress=True, delimiter="\n"):
+    path = os.path.join(root, *key.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = "".join(json.dumps(record) + delimiter for record in records).encode()
+    with open(path, "wb") as object_file:
+        object_file.write(gzip.compress(data) if compress else data)
+
+
+def read_json_files(root, keys):
+    records = []
+    for key in keys:
+        with gzip.open(os.path.join(root, *key.split("/")), "rt") as compacted:
+            records.extend(json.loads(line) for line in compacted)
+    return records
+
+
+def test_iter_records_reads_concatenated_and_gzipped_json():
+    records = [{"event_name": "page_view", "n": n, "text": "}{" * n} for n in range(50)]
+    concatenated = "".join(json.dumps(record) for record in records).encode()
+
+    assert list(iter_records(io.BytesIO(concatenated))) == records
+    # firehose gzip objects, one gzip member per record batch
+    members = gzip.compress(concatenated[:10]) + gzip.compress(concatenated[10:])
+    assert list(iter_records(io.BufferedReader(io.BytesIO(members)))) == records
+
+
+def test_records_split_across_read_chunks(monkeypatch):
+    monkeypatch.setattr("analytics.compaction.READ_CHUNK_SIZE", 7)
+    records = [{"n": n, "page_location": "/a" * n} for n in range(20)]
+    data = "\n".join(json.dumps(record) for record in records).encode()
+
+    assert list(iter_records(io.BytesIO(data))) == records
+
+
+def test_compaction_is_idempotent_and_picks_up_late_objects(tmp_path):
+    root = str(tmp_path)
+    storage = LocalStorage(root)
+    write_object(root, HOUR + "stream-1", [{"n": n} for n in range(10)])
+    write_object(root, HOUR + "stream-2", [{"n": n} for n in range(10, 15)], delimiter="")
+    write_object(root, HOUR + "stream-3", [{"n": 15}], compress=False)
+
+    summary = compact_partition(storage, HOUR, file_format="gzip-json")
+    assert summary["status"] == "compacted"
+    assert summary["files"] == ["compacted/dt=2023-12-07/hr=07/part-00000.json.gz"]
+    assert [record["n"] for record in read_json_files(root, summary["files"])] == list(range(16))
+    assert compact_partition(storage, HOUR, file_format="gzip-json")["status"] == "skipped"
+
+    write_object(root, HOUR + "stream-4", [{"n": 16}])
+    summary = compact_partition(storage, HOUR, file_format="gzip-json")
+    assert summary["status"] == "compacted" and summary["records"] == 17
+    manifest = json.loads(storage.read_text("compacted/dt=2023-12-07/hr=07/" + MANIFEST_NAME))
+    assert manifest["sources"][-1] == HOUR + "stream-4"
+
+
+def test_late_objects_after_deleting_the_sources_are_appended(tmp_path):
+    root = str(tmp_path)
+    storage = LocalStorage(root)
+    write_object(root, HOUR + "stream-1", [{"n": n} for n in range(10)])
+    compact_partition(storage, HOUR, file_format="gzip-json", delete_source=True)
+    assert not storage.exists(HOUR + "stream-1")
+
+    write_object(root, HOUR + "stream-2", [{"n": 10}])
+    summary = compact_partition(storage, HOUR, file_format="gzip-json", delete_source=True)
+    assert summary["files"] == ["compacted/dt=2023-12-07/hr=07/part-00000.json.gz",
+                                "compacted/dt=2023-12-07/hr=07/part-00001.json.gz"]
+    assert [record["n"] for record in read_json_files(root, summary["files"])] == list(range(11))
+    manifest = json.loads(storage.read_text("compacted/dt=2023-12-07/hr=07/" + MANIFEST_NAME))
+    assert manifest["sources"] == [HOUR + "stream-1", HOUR + "stream-2"] and manifest["records"] == 11
+    assert not storage.exists(HOUR + "stream-2")
+
+    # a source a stopped run didn't delete is already compacted
+    write_object(root, HOUR + "stream-2", [{"n": 10}])
+    assert compact_partition(storage, HOUR, file_format="gzip-json", force=True)["status"] == "skipped"
+    assert not storage.exists(HOUR + "stream-2")
+    write_object(root, HOUR + "stream-3", [{"n": 11}])
+    with pytest.raises(ValueError, match="gzip-json"):
+        compact_partition(storage, HOUR, file_format="zstd-json")
+
+
+def test_files_roll_over_at_target_size(tmp_path):
+    root = str(tmp_path)
+    storage = LocalStorage(root)
+    write_object(root, HOUR + "stream-1", [{"n": n, "padding": "x" * 1000} for n in range(3000)])
+
+    summary = compact_partition(storage, HOUR, file_format="gzip-json", target_file_mb=1, row_group_mb=1)
+    assert len(summary["files"]) == 3
+    assert len(read_json_files(root, summary["files"])) == 3000
+
+    # the smaller compaction removes the files it doesn't write anymore
+    summary = compact_partition(storage, HOUR, file_format="gzip-json", force=True)
+    assert len(summary["files"]) == 1
+    assert not storage.exists("compacted/dt=2023-12-07/hr=07/part-00001.json.gz")
+
+
+def test_partitions_in_a_process_pool_and_settling(tmp_path):
+    root = str(tmp_path)
+    storage = LocalStorage(root)
+    for hour in range(4):
+        write_object(root, f"raw/dt=2023-12-07/hr={hour:02d}/stream-1", [{"hour": hour}])
+    os.utime(os.path.join(root, "raw", "dt=2023-12-07", "hr=03", "stream-1"), (0, 0))
+
+    assert find_partitions(storage, now=1000) == ["raw/dt=2023-12-07/hr=03/"]
+    assert find_partitions(storage, granularity="day", settle_seconds=0) == ["raw/dt=2023-12-07/"]
+
+    partitions = find_partitions(storage, settle_seconds=0)
+    summaries = list(compact(storage, partitions, workers=2, file_format="gzip-json"))
+    assert [summary["status"] for summary in summaries] == ["compacted"] * 4
+    daily = compact_partition(storage, "raw/dt=2023-12-07/", file_format="gzip-json")
+    assert daily["files"] == ["compacted/dt=2023-12-07/part-00000.json.gz"]
+    assert sorted(record["hour"] for record in read_json_files(root, daily["files"])) == [0, 1, 2, 3]
+
+
+def test_failed_partitions_are_reported(tmp_path, capsys):
+    root = str(tmp_path)
+    write_object(root, HOUR + "stream-1", [{"n": 1}])
+    with open(os.path.join(root, *HOUR.split("/"), "stream-2"), "w") as broken:
+        broken.write('{"n": ')
+
+    assert main([root, "--format", "gzip-json", "--partition", HOUR, "--workers", "1"]) == 1
+    assert json.loads(capsys.readouterr().out)["status"] == "failed"
+
+
+def test_parquet_row_groups(tmp_path):
+    root = str(tmp_path)
+    write_object(root, HOUR + "stream-1", [{"n": n, "params": {"a": n}} for n in range(1000)])
+
+    summary = compact_partition(LocalStorage(root), HOUR, file_format="parquet", row_group_mb=0)
+    table = parquet.ParquetFile(os.path.join(root, *summary["files"][0].split("/")))
+    assert table.metadata.num_rows == 1000
+    assert table.read().column("params")[0].as_py() == '{"a":0}'
+
+
+def test_source_prefix_of_firehose_prefix():
+    assert source_prefix("raw/dt=!{timestamp:yyyy-MM-dd}/hr=!{timestamp:HH}/") == "raw/"
+    assert source_prefix("!{timestamp:yyyy}/") == ""
+
+
+def test_compaction_job(synth_templates):
+    _, template = synth_templates(compaction_job={"format": "zstd-json", "workers": 4})
+
+    template.has_resource_properties("AWS::Events::Rule", {"ScheduleExpression": "cron(20 * * * ? *)"})
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "Cpu": "1024",
+        "Memory": "4096",
+        "ContainerDefinitions": [Match.object_like({
+            "Command": Match.array_with(["--format", "zstd-json", "--source-prefix", "raw/", "--workers", "4"]),
+        })],
+    })
+
+
+def test_compaction_job_needs_json_delivery(synth_templates):
+    _, template = synth_templates()
+    template.resource_count_is("AWS::Events::Rule", 0)
+
+    with pytest.raises(ValueError):
+        synth_templates(compaction_job={}, parquet_delivery=True)
+    with pytest.raises(ValueError):
+        synth_templates(compaction_job={"format": "orc"})
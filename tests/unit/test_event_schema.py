@@ -0,0 +1,126 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import json
+
+import pytest
+
+from deployment.event_schema import (
+    event_json_schema,
+    glue_columns,
+    hive_type,
+    json_key_mappings,
+    load_sample_event,
+    project_event,
+    projection_settings,
+)
+
+
+def test_columns_follow_sample_event():
+    columns = {column["name"]: column["type"] for column in glue_columns()}
+
+    # partition keys are not part of the data columns
+    assert "event_name" not in columns
+    assert columns["x_ga_page_id"] == "bigint"
+    assert columns["engagement_time_msec"] == "int"
+    assert columns["event_location"] == "struct<country:string,region:string>"
+    assert columns["client_hints"].startswith("struct<architecture:string,bitness:string,full_version_list:array<struct<brand:string")
+
+
+def test_json_key_mappings_only_for_renamed_columns():
+    mappings = json_key_mappings(glue_columns())
+
+    assert mappings["x_ga_measurement_id"] == "x-ga-measurement_id"
+    assert "client_id" not in mappings
+
+
+def test_hive_type_of_empty_list():
+    assert hive_type([]) == "array<string>"
+
+
+def test_projection_drops_unused_fields():
+    settings = projection_settings(True)
+    event = {**load_sample_event(), "custom_parameter": "1"}
+
+    projected = project_event(event, settings)
+
+    assert "full_version_list" not in projected["client_hints"] and "brands" not in projected["client_hints"]
+    assert projected["client_hints"]["platform"] == "macOS"
+    assert "custom_parameter" not in projected
+    assert "full_version_list" in event["client_hints"]
+    assert len(json.dumps(projected)) < 0.85 * len(json.dumps(load_sample_event()))
+    # without the allow list only the dropped fields go
+    assert project_event(event, projection_settings({"allow_list": False}))["custom_parameter"] == "1"
+
+
+def test_projection_rejects_malformed_events():
+    settings = projection_settings({"required_fields": ["event_name", "client_id"]})
+
+    for event in ("page_view", [], {"event_name": "page_view"}, {"event_name": "", "client_id": "1.2"},
+                  {"event_name": {"name": "page_view"}, "client_id": "1.2"}):
+        with pytest.raises(ValueError):
+            project_event(event, settings)
+    assert project_event({"event_name": "page_view", "client_id": 12}, settings) == {"event_name": "page_view", "client_id": 12}
+    with pytest.raises(ValueError, match="can't be dropped"):
+        projection_settings({"drop_fields": ["client_id"], "required_fields": ["client_id"]})
+    assert projection_settings(None) is None and projection_settings(False) is None
+
+
+def test_json_schema_of_projected_event():
+    schema = event_json_schema(projection_settings(True))
+
+    assert schema["$schema"] == "http://json-schema.org/draft-04/schema#"
+    assert schema["type"] == "object"
+    assert schema["required"] == ["event_name", "client_id"]
+    assert schema["properties"] == {field: {"type": ["string", "number", "boolean"], "minLength": 1}
+                                    for field in ["event_name", "client_id"]}
+
+
+JSON_TYPES = {"object": dict, "array": list, "string": str, "boolean": bool, "null": type(None)}
+
+
+def conforms(value, schema):
+    # the draft 4 keywords of the api gateway model
+    types = schema.get("type", [])
+    types = types if isinstance(types, list) else [types]
+    if types and not any(isinstance(value, (int, float)) and not isinstance(value, bool) if name == "number"
+                         else isinstance(value, JSON_TYPES[name]) for name in types):
+        return False
+    if isinstance(value, str) and len(value) < schema.get("minLength", 0):
+        return False
+    if isinstance(value, dict):
+        return all(field in value for field in schema.get("required", [])) and \
+            all(conforms(value[field], child) for field, child in schema.get("properties", {}).items() if field in value)
+    return True
+
+
+def test_model_and_projection_reject_the_same_events(synth_templates):
+    settings = projection_settings(True)
+    _, template = synth_templates(data_capture_api_method="api_gateway", event_projection=True)
+    (model,) = template.find_resources("AWS::ApiGateway::Model", {"Properties": {"Name": "GAEvent"}}).values()
+    sample = load_sample_event()
+
+    events = [
+        sample,
+        dict(sample, page_referrer=None, client_hints=None, custom_parameter={"a": [1]}),
+        dict(sample, client_hints="unavailable", ga_session_id=1701932400, engagement_time_msec=True),
+        dict(sample, client_id=12),
+        {"event_name": "page_view", "client_id": "1.2"},
+        {"event_name": "page_view"},
+        dict(sample, client_id=None),
+        dict(sample, client_id=""),
+        dict(sample, event_name={"name": "page_view"}),
+        dict(sample, event_name=["page_view"]),
+        "page_view",
+        [sample],
+    ]
+    for event in events:
+        try:
+            project_event(event, settings)
+            projected = True
+        except ValueError:
+            projected = False
+        assert conforms(event, model["Properties"]["Schema"]) == projected, event
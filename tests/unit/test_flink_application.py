@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import importlib.util
+import json
+import os
+
+from aws_cdk.assertions import Match
+
+from deployment.capacity_planner import CapacityPlan
+
+MAIN_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "source", "flink", "main.py")
+spec = importlib.util.spec_from_file_location("flink_main", MAIN_PATH)
+flink_main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(flink_main)
+
+
+def test_sql_rendered_from_application_properties(tmp_path):
+    properties_path = tmp_path / "application_properties.json"
+    properties_path.write_text(json.dumps([{
+        "PropertyGroupId": "FlinkApplicationProperties",
+        "PropertyMap": {"region": "eu-west-1", "initial_position": "TRIM_HORIZON", "bucket_name": "bucket",
+                        "window_seconds": "300", "slide_seconds": "60"},
+    }]))
+    properties = flink_main.load_properties(str(properties_path))
+
+    source = flink_main.render("click_stream_live_stream.sql", properties)
+    insert = flink_main.render("insert_page_session_event_counts.sql", properties)
+    sink = flink_main.render("page_session_event_counts.sql", properties)
+
+    assert "'aws.region' = 'eu-west-1'" in source
+    assert "'scan.stream.initpos' = 'TRIM_HORIZON'" in source
+    assert "INTERVAL '5' SECOND" in source
+    assert "HOP(TABLE click_stream_live_stream, DESCRIPTOR(event_time), INTERVAL '60' SECOND, INTERVAL '300' SECOND)" in insert
+    assert "'path' = 's3://bucket/aggregates/page_session_event_counts'" in sink
+    assert "TUMBLE(" in flink_main.render("insert_page_session_event_counts.sql", flink_main.DEFAULT_PROPERTIES)
+
+
+def test_flink_application_parallelism(synth_templates):
+    _, default = synth_templates(flink_application={})
+    _, template = synth_templates(CapacityPlan(shard_count=4),
+                                  flink_application={"parallelism_per_kpu": 2, "autoscaling": False, "slide_seconds": 10})
+
+    default.has_resource_properties("AWS::KinesisAnalyticsV2::Application", {
+        "RuntimeEnvironment": "FLINK-1_18",
+        "ApplicationConfiguration": Match.object_like({
+            "FlinkApplicationConfiguration": Match.object_like({
+                "ParallelismConfiguration": {"ConfigurationType": "CUSTOM", "Parallelism": 1, "ParallelismPerKPU": 1,
+                                             "AutoScalingEnabled": True},
+            }),
+        }),
+    })
+    template.has_resource_properties("AWS::KinesisAnalyticsV2::Application", {
+        "ApplicationConfiguration": Match.object_like({
+            "FlinkApplicationConfiguration": Match.object_like({
+                "ParallelismConfiguration": {"ConfigurationType": "CUSTOM", "Parallelism": 4, "ParallelismPerKPU": 2,
+                                             "AutoScalingEnabled": False},
+            }),
+            "EnvironmentProperties": {"PropertyGroups": Match.array_with([Match.object_like({
+                "PropertyGroupId": "FlinkApplicationProperties",
+                "PropertyMap": Match.object_like({"slide_seconds": "10", "initial_position": "LATEST"}),
+            })])},
+        }),
+    })
+
+
+def test_flink_application_is_optional(synth_templates):
+    _, template = synth_templates()
+
+    template.resource_count_is("AWS::KinesisAnalyticsV2::Application", 0)
+
+
+def test_flink_reads_through_its_enhanced_fan_out_consumer(synth_templates):
+    properties = {**flink_main.DEFAULT_PROPERTIES, "efo_consumer_name": "flink",
+                  "efo_consumer_arn": "arn:aws:kinesis:us-west-2:111111111111:stream/gtagStream/consumer/flink:1"}
+    source = flink_main.render("click_stream_live_stream.sql", properties)
+    assert "'scan.stream.recordpublisher' = 'EFO'" in source
+    assert "'scan.stream.efo.consumerarn.gtagStream' = 'arn:aws:kinesis:us-west-2:111111111111:stream/gtagStream/consumer/flink:1'," in source
+    assert "recordpublisher" not in flink_main.render("click_stream_live_stream.sql", flink_main.DEFAULT_PROPERTIES)
+
+    _, template = synth_templates(flink_application={}, kinesis_stream={"consumers": ["flink"]})
+    template.has_resource_properties("AWS::KinesisAnalyticsV2::Application", {
+        "ApplicationConfiguration": Match.object_like({
+            "EnvironmentProperties": {"PropertyGroups": Match.array_with([Match.object_like({
+                "PropertyMap": Match.object_like({
+                    "efo_consumer_name": "flink",
+                    "efo_consumer_arn": {"Fn::GetAtt": [Match.string_like_regexp("StreamConsumerflink"), "ConsumerARN"]},
+                }),
+            })])},
+        }),
+    })
+    template.has_resource_properties("AWS::IAM::Policy", {
+        "PolicyDocument": {"Statement": Match.array_with([Match.object_like({
+            "Action": ["kinesis:SubscribeToShard", "kinesis:DescribeStreamConsumer"],
+        })])},
+    })
@@ -0,0 +1,59 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import json
+
+from aws_cdk.assertions import Match
+
+
+def alarms(template, prefix):
+    return {name: resource["Properties"] for name, resource in template.find_resources("AWS::CloudWatch::Alarm").items()
+            if name.startswith(prefix)}
+
+
+def dashboard_body(template):
+    (dashboard,) = template.find_resources("AWS::CloudWatch::Dashboard").values()
+    return json.dumps(dashboard["Properties"]["DashboardBody"])
+
+
+def test_dashboards_and_alarms_of_both_stacks(synth_templates):
+    server_side_tagger, aws_analytics = synth_templates(data_capture_api_method="kinesis_producer")
+
+    server_side_tagger.has_resource_properties("AWS::CloudWatch::Dashboard", {"DashboardName": "GTMServerSideTagger"})
+    assert len(alarms(server_side_tagger, "GTMMonitoring")) == 8
+    for metric in ("TargetResponseTime", "RequestCountPerTarget", "CPUUtilization", "MemoryUtilization"):
+        assert metric in dashboard_body(server_side_tagger)
+
+    analytics_alarms = alarms(aws_analytics, "GTMAnalyticsMonitoring")
+    assert len(analytics_alarms) == 7
+    body = dashboard_body(aws_analytics)
+    for metric in ("IncomingRecords", "WriteProvisionedThroughputExceeded", "GetRecords.IteratorAgeMilliseconds",
+                   "DeliveryToS3.DataFreshness", "TargetResponseTime"):
+        assert metric in body
+    aws_analytics.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "MetricName": "GetRecords.IteratorAgeMilliseconds",
+        "Threshold": 60000,
+        "EvaluationPeriods": 3,
+        "TreatMissingData": "notBreaching",
+    })
+
+
+def test_alarm_thresholds_from_context(synth_templates):
+    _, template = synth_templates(data_capture_api_method="api_gateway", monitoring={
+        "api_latency_p99_ms": 250,
+        "iterator_age_seconds": False,
+        "evaluation_periods": 5,
+        "alarm_topic_arn": "arn:aws:sns:us-west-2:111111111111:gtm-alarms",
+    })
+
+    api_alarms = [alarm for alarm in alarms(template, "GTMAnalyticsMonitoring").values() if alarm["Threshold"] == 250]
+    assert len(api_alarms) == 1
+    assert api_alarms[0]["EvaluationPeriods"] == 5
+    assert api_alarms[0]["AlarmActions"] == ["arn:aws:sns:us-west-2:111111111111:gtm-alarms"]
+    assert "Latency" in dashboard_body(template)
+    # no iterator age alarm of the dashboard, only the one of the solutions construct
+    template.resource_properties_count_is("AWS::CloudWatch::Alarm", {
+        "MetricName": "GetRecords.IteratorAgeMilliseconds", "Threshold": Match.any_value()}, 1)
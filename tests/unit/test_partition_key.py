@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import pytest
+
+from deployment.partition_key import partition_key
+from deployment.shard_simulator import HASH_KEY_SPACE, shard_for_key, simulate
+
+EVENT = {"client_id": "123.456", "ga_session_id": "1701931976"}
+
+
+def test_partition_key_strategies():
+    assert partition_key(EVENT, "session_id") == "1701931976"
+    assert partition_key(EVENT, "client_id") == "123.456"
+    assert partition_key(EVENT, "composite", salt="s1") == "s1|123.456|1701931976"
+    assert partition_key(EVENT, "random", random_key=lambda: "r") == "r"
+
+
+def test_missing_fields_fall_back_to_random_key():
+    assert partition_key({"client_id": "123.456"}, "session_id", random_key=lambda: "r") == "r"
+    assert partition_key({}, "composite", random_key=lambda: "r") == "r"
+    assert partition_key({"ga_session_id": "", "client_id": None}, "composite", random_key=lambda: "r") == "r"
+
+
+def test_falsy_values_are_keys_like_in_the_producer():
+    assert partition_key({"ga_session_id": 0}, "session_id", random_key=lambda: "r") == "0"
+    assert partition_key({"client_id": "0"}, "client_id", random_key=lambda: "r") == "0"
+    assert partition_key({"client_id": False, "ga_session_id": 0}, "composite", salt="s") == "s|false|0"
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        partition_key(EVENT, "timestamp")
+
+
+def test_shard_ranges_split_hash_space_evenly(monkeypatch):
+    monkeypatch.setattr("deployment.shard_simulator.hash_key", lambda key: int(key))
+
+    assert shard_for_key("0", 4) == 0
+    assert shard_for_key(str(HASH_KEY_SPACE // 4 - 1), 4) == 0
+    assert shard_for_key(str(HASH_KEY_SPACE // 4), 4) == 1
+    assert shard_for_key(str(HASH_KEY_SPACE - 1), 4) == 3
+
+
+def test_single_session_lands_on_one_shard():
+    events = [dict(EVENT) for _ in range(100)]
+
+    by_session = simulate(events, 4, "session_id")
+    by_random = simulate(events, 4, "random")
+
+    assert by_session["skew"] == 4.0
+    assert by_session["hot_keys"] == [("1701931976", 100)]
+    assert by_random["skew"] < 2.0
@@ -0,0 +1,165 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+#
+# Settings that decide the throughput and latency of the deployment, checked on the example context in both
+# data_capture_api_method modes. The resources behind them are also compared with the snapshots in
+# tests/unit/snapshots, run UPDATE_SNAPSHOTS=1 python -m pytest tests/unit/test_performance_settings.py after an
+# intended change and review the snapshot diff with the change.
+import json
+import os
+import re
+
+import pytest
+from aws_cdk.assertions import Match
+
+from tests.unit.helpers import DIRNAME, synth_stacks
+
+MODES = ("kinesis_producer", "api_gateway")
+SNAPSHOT_DIR = os.path.join(DIRNAME, "snapshots")
+# resources whose properties size, scale or route the event path
+SNAPSHOT_TYPES = (
+    "AWS::ApiGateway::Method",
+    "AWS::ApiGateway::Stage",
+    "AWS::ApiGateway::UsagePlan",
+    "AWS::ApplicationAutoScaling::ScalableTarget",
+    "AWS::ApplicationAutoScaling::ScalingPolicy",
+    "AWS::EC2::VPCEndpoint",
+    "AWS::ECS::Service",
+    "AWS::ECS::TaskDefinition",
+    "AWS::ElasticLoadBalancingV2::Listener",
+    "AWS::ElasticLoadBalancingV2::ListenerRule",
+    "AWS::ElasticLoadBalancingV2::TargetGroup",
+    "AWS::Kinesis::Stream",
+    "AWS::Kinesis::StreamConsumer",
+    "AWS::KinesisAnalyticsV2::Application",
+    "AWS::KinesisFirehose::DeliveryStream",
+)
+# asset hashes and api deployment ids change with the source code, not with the settings
+HASH = re.compile(r"[0-9a-f]{32,64}")
+
+
+@pytest.fixture(scope="module", params=MODES)
+def templates(request):
+    tagger, analytics = synth_stacks(data_capture_api_method=request.param)
+    return request.param, {"ServerSideTaggerStack": tagger, "AWSAnalyticsStack": analytics}
+
+
+def performance_resources(template):
+    """
+    Resources of the SNAPSHOT_TYPES by logical id with the hashes masked
+    """
+    resources = {
+        logical_id: {"Type": resource["Type"], "Properties": resource.get("Properties", {})}
+        for logical_id, resource in template.to_json()["Resources"].items()
+        if resource["Type"] in SNAPSHOT_TYPES
+    }
+    return json.loads(HASH.sub("<hash>", json.dumps(resources, sort_keys=True)))
+
+
+def test_gtm_services_task_size_and_scaling(templates):
+    _, stacks = templates
+    tagger = stacks["ServerSideTaggerStack"]
+
+    for family in ["GTMPrimaryTaskDefinition", "GTMServiceTaskDef"]:
+        tagger.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "Family": Match.string_like_regexp(family),
+            "Cpu": "512",
+            "Memory": "1024",
+        })
+    tagger.has_resource_properties("AWS::ECS::Service", {"ServiceName": "GTMServerSidePrimaryService", "DesiredCount": 3})
+    tagger.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {"MinCapacity": 2, "MaxCapacity": 10})
+    policies = [policy["Properties"] for policy in tagger.find_resources("AWS::ApplicationAutoScaling::ScalingPolicy").values()]
+    assert sorted(policy["TargetTrackingScalingPolicyConfiguration"]["PredefinedMetricSpecification"]["PredefinedMetricType"]
+                  for policy in policies if policy["PolicyType"] == "TargetTrackingScaling") == [
+        "ALBRequestCountPerTarget", "ECSServiceAverageCPUUtilization", "ECSServiceAverageMemoryUtilization"]
+    assert [policy["PolicyType"] for policy in policies].count("StepScaling") == 1
+
+
+def test_producer_task_size_heap_and_scaling(templates):
+    mode, stacks = templates
+    analytics = stacks["AWSAnalyticsStack"]
+
+    if mode == "api_gateway":
+        analytics.resource_count_is("AWS::ECS::TaskDefinition", 0)
+        analytics.resource_count_is("AWS::ApplicationAutoScaling::ScalingPolicy", 0)
+        return
+    analytics.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "Cpu": "1024",
+        "Memory": "2048",
+        "ContainerDefinitions": [Match.object_like({
+            # the heap stays inside the task memory, the rest is for the KPL native process
+            "Environment": Match.array_with([{"Name": "JAVA_TOOL_OPTIONS", "Value": "-XX:InitialHeapSize=1g -XX:MaxHeapSize=2g"}]),
+        })],
+    })
+    analytics.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {"MinCapacity": 1, "MaxCapacity": 10})
+    analytics.resource_count_is("AWS::ApplicationAutoScaling::ScalingPolicy", 4)
+
+
+def test_stream_mode_and_shards(templates):
+    _, stacks = templates
+
+    stacks["AWSAnalyticsStack"].has_resource_properties("AWS::Kinesis::Stream", {
+        "ShardCount": 1,
+        "RetentionPeriodHours": 24,
+        "StreamModeDetails": {"StreamMode": "PROVISIONED"},
+    })
+
+
+def test_ingestion_vpc_endpoint(templates):
+    mode, stacks = templates
+
+    # the gtm tasks reach api gateway, the producer tasks reach kinesis without the nat gateways
+    service = "execute-api" if mode == "api_gateway" else "kinesis-streams"
+    stacks["ServerSideTaggerStack"].has_resource_properties("AWS::EC2::VPCEndpoint", {
+        "ServiceName": f"com.amazonaws.us-west-2.{service}",
+        "VpcEndpointType": "Interface",
+        "PrivateDnsEnabled": True,
+    })
+
+
+def test_firehose_buffering_without_format_conversion(templates):
+    _, stacks = templates
+
+    stacks["AWSAnalyticsStack"].has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "ExtendedS3DestinationConfiguration": Match.object_like({
+            "BufferingHints": {"IntervalInSeconds": 300, "SizeInMBs": 64},
+            "CompressionFormat": "GZIP",
+            "DataFormatConversionConfiguration": Match.absent(),
+        }),
+    })
+
+
+def test_listener_rule_priorities(templates):
+    mode, stacks = templates
+
+    rules = stacks["ServerSideTaggerStack"].find_resources("AWS::ElasticLoadBalancingV2::ListenerRule")
+    priorities = {rule["Properties"]["Conditions"][0]["HostHeaderConfig"]["Values"][0]: rule["Properties"]["Priority"]
+                  for rule in rules.values()}
+    # priority 2 is kept for the cloudfront origin verify rule of the primary host
+    expected = {"analytics.root.domain": 1}
+    if mode == "kinesis_producer":
+        expected["producer.root.domain"] = 3
+    assert priorities == expected
+
+
+def test_templates_match_snapshots(templates):
+    mode, stacks = templates
+    resources = {name: performance_resources(template) for name, template in stacks.items()}
+    path = os.path.join(SNAPSHOT_DIR, f"{mode}.json")
+
+    if os.environ.get("UPDATE_SNAPSHOTS"):
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        with open(path, "w") as snapshot:
+            json.dump(resources, snapshot, indent=2, sort_keys=True)
+            snapshot.write("\n")
+    with open(path) as snapshot:
+        expected = json.load(snapshot)
+
+    for name in resources:
+        changed = sorted(logical_id for logical_id in expected[name].keys() | resources[name].keys()
+                         if expected[name].get(logical_id) != resources[name].get(logical_id))
+        assert resources[name] == expected[name], f"{name} differs from {path} in {', '.join(changed)}, run with UPDATE_SNAPSHOTS=1 if intended"
@@ -0,0 +1,27 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import pytest
+
+from deployment.producer_settings import kpl_environment, logging_environment
+
+
+def test_kpl_environment():
+    assert kpl_environment(None) == {"KPL_METRICS_LEVEL": "summary"}
+    assert kpl_environment({"record_max_buffered_time": 500, "aggregation_enabled": False, "metrics_level": None}) == {
+        "KPL_RECORD_MAX_BUFFERED_TIME": "500",
+        "KPL_AGGREGATION_ENABLED": "false",
+    }
+
+
+def test_unknown_kpl_setting():
+    with pytest.raises(ValueError):
+        kpl_environment({"record_max_buffer_time": 500})
+
+
+def test_logging_environment():
+    assert logging_environment(None) == {"LOG_SAMPLE_RATE": "0.001", "LOG_DEBUG": "false"}
+    assert logging_environment({"debug": True}) == {"LOG_SAMPLE_RATE": "0.001", "LOG_DEBUG": "true"}
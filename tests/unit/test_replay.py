@@ -0,0 +1,163 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import gzip
+import json
+import os
+import random
+
+import pytest
+
+from analytics.compaction import LocalStorage
+from analytics.replay import (
+    ReplayError,
+    Replayer,
+    ShardRateLimiter,
+    batches,
+    load_checkpoint,
+    read_events,
+    to_records,
+)
+from benchmarks.events import generate_events
+from benchmarks.kinesis_stub import InMemoryKinesis
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def write_archive(root, objects=4, events_per_object=250):
+    events = list(generate_events(objects * events_per_object, sessions=50))
+    for part in range(objects):
+        path = os.path.join(root, "raw", "dt=2023-12-07", "hr=07", f"stream-{part}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, "wt") as object_file:
+            for event in events[part * events_per_object:(part + 1) * events_per_object]:
+                object_file.write(json.dumps(event) + "\n")
+    return events
+
+
+def records_of(root, checkpoint=None, strategy="session_id"):
+    return to_records(read_events(LocalStorage(root), "raw/", checkpoint), strategy)
+
+
+def delivered(kinesis):
+    return [json.loads(data) for shard in kinesis.shards for _, data in shard.data]
+
+
+def test_batches_respect_put_records_limits():
+    records = ((index, {"PartitionKey": "k", "Data": b"x" * 20000}) for index in range(1000))
+    sizes = [len(batch) for batch in batches(records)]
+    # 262 records of 20001 bytes fit in 5 MiB
+    assert sizes == [262, 262, 262, 214]
+    assert [len(batch) for batch in batches(((index, {"PartitionKey": "k", "Data": b"x"}) for index in range(1200)))] == [500, 500, 200]
+
+
+def test_replay_stays_under_the_shard_limits(tmp_path):
+    events = write_archive(str(tmp_path))
+    clock = FakeClock()
+    kinesis = InMemoryKinesis(2, keep_records=True, clock=clock)
+    limiter = ShardRateLimiter(2, fraction=0.5, clock=clock, sleep=clock.sleep)
+
+    stats = Replayer(kinesis, sleep=clock.sleep).replay(batches(records_of(str(tmp_path)), limiter=limiter))
+
+    assert stats["records"] == len(events)
+    assert all(shard["throttled"] == 0 for shard in kinesis.stats())
+    # half of 1000 records/s and 1 MiB/s per shard, the first second comes from the full buckets
+    busiest = max(max(shard["records"] / 500, shard["bytes"] / (512 * 1024)) for shard in kinesis.stats())
+    assert clock.now == pytest.approx(busiest - 1, abs=0.01)
+    # the session order is kept on its shard
+    replayed = delivered(kinesis)
+    for session in {event["ga_session_id"] for event in events}:
+        assert [e for e in replayed if e["ga_session_id"] == session] == [e for e in events if e["ga_session_id"] == session]
+
+
+def test_only_failed_records_are_retried(tmp_path):
+    events = write_archive(str(tmp_path), objects=6, events_per_object=200)
+    clock = FakeClock()
+    kinesis = InMemoryKinesis(1, keep_records=True, clock=clock)
+    replayer = Replayer(kinesis, sleep=clock.sleep, rng=random.Random(0))
+
+    stats = replayer.replay(batches(records_of(str(tmp_path))))
+
+    assert stats["records"] == len(events)
+    assert stats["retried_records"] > 0 and kinesis.stats()[0]["throttled"] == stats["retried_records"]
+    # every record once
+    assert sorted(e["x-sst-system_properties"]["request_start_time_ms"] for e in delivered(kinesis)) == \
+        sorted(e["x-sst-system_properties"]["request_start_time_ms"] for e in events)
+
+    with pytest.raises(ReplayError, match="ProvisionedThroughputExceededException"):
+        Replayer(InMemoryKinesis(1, records_per_second=10, clock=FakeClock()), max_retries=2, sleep=lambda _: None) \
+            .put_batch(list(records_of(str(tmp_path)))[:20])
+
+
+class RejectingKinesis:
+
+    def __init__(self, kinesis, reject_requests):
+        self.kinesis = kinesis
+        self.reject_requests = reject_requests
+
+    def put_records(self, records):
+        if self.reject_requests:
+            self.reject_requests -= 1
+            error = {"ErrorCode": "ProvisionedThroughputExceededException", "ErrorMessage": "Rate exceeded for shard"}
+            return {"FailedRecordCount": len(records), "Records": [error] * len(records)}
+        return self.kinesis.put_records(records)
+
+
+def test_retried_records_wait_for_the_shard_limits(tmp_path):
+    write_archive(str(tmp_path), objects=2)
+    clock = FakeClock()
+    kinesis = InMemoryKinesis(1, keep_records=True, clock=clock)
+    limiter = ShardRateLimiter(1, fraction=0.5, clock=clock, sleep=clock.sleep)
+    replayer = Replayer(RejectingKinesis(kinesis, reject_requests=1), sleep=clock.sleep, rng=random.Random(0), limiter=limiter)
+
+    stats = replayer.replay(batches(records_of(str(tmp_path)), limiter=limiter))
+
+    assert stats["records"] == 500 and stats["retried_records"] == 500
+    # the records pass the buckets twice, the first second comes from the full buckets
+    assert clock.now == pytest.approx(max(2 * 500 / 500, 2 * stats["bytes"] / (512 * 1024)) - 1, abs=0.01)
+    assert kinesis.stats()[0]["throttled"] == 0
+
+
+class FailingKinesis:
+
+    def __init__(self, kinesis, fail_on_request):
+        self.kinesis = kinesis
+        self.requests = 0
+        self.fail_on_request = fail_on_request
+
+    def put_records(self, records):
+        self.requests += 1
+        if self.requests == self.fail_on_request:
+            raise ConnectionError("connection reset")
+        return self.kinesis.put_records(records)
+
+
+def test_replay_resumes_from_the_checkpoint(tmp_path):
+    events = write_archive(str(tmp_path / "bucket"))
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    kinesis = InMemoryKinesis(4, keep_records=True, clock=FakeClock())
+
+    with pytest.raises(ConnectionError):
+        Replayer(FailingKinesis(kinesis, fail_on_request=4)).replay(
+            batches(records_of(str(tmp_path / "bucket")), max_records=300), checkpoint_path)
+    checkpoint = load_checkpoint(checkpoint_path)
+    assert checkpoint == {"key": "raw/dt=2023-12-07/hr=07/stream-3", "index": 149, "records": 900}
+
+    stats = Replayer(kinesis).replay(
+        batches(records_of(str(tmp_path / "bucket"), checkpoint), max_records=300), checkpoint_path, checkpoint)
+    assert stats["records"] == 100
+    assert load_checkpoint(checkpoint_path)["records"] == len(events)
+    assert len(delivered(kinesis)) == len(events)
@@ -6,16 +6,146 @@
 # specific language governing permissions and limitations under the License.
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
+from aws_cdk.assertions import Match
 
 from deployment.server_side_tagger_stack import ServerSideTaggerStack
+from tests.unit.helpers import CONTEXT, ENV
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in server_side_tagger/server_side_tagger_stack.py
-def test_sqs_queue_created():
-    app = core.App()
-    stack = ServerSideTaggerStack(app, "server-side-tagger")
+def test_tagger_stack_synthesizes_alone():
+    # cdk synth -c stacks=ServerSideTaggerStack builds it without the analytics stack
+    app = core.App(context={**CONTEXT, "aws:cdk:bundling-stacks": []})
+    stack = ServerSideTaggerStack(app, "server-side-tagger", env=ENV)
     template = assertions.Template.from_stack(stack)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+    template.resource_count_is("AWS::ECS::Service", 2)
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::ListenerRule", {
+        "Priority": 1,
+        "Conditions": [{"Field": "host-header", "HostHeaderConfig": {"Values": ["analytics.root.domain"]}}],
+    })
+
+
+def test_primary_service_scales_on_requests_and_response_time(synth_templates):
+    template, _ = synth_templates()
+
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingScalingPolicyConfiguration": {
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ALBRequestCountPerTarget"},
+            # 200 events per vCPU and minute for a 0.5 vCPU task
+            "TargetValue": 6000,
+            "ScaleInCooldown": 300,
+            "ScaleOutCooldown": 60,
+        },
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingScalingPolicyConfiguration": {
+            "PredefinedMetricSpecification": {"PredefinedMetricType": "ECSServiceAverageCPUUtilization"},
+            "TargetValue": 50,
+            "ScaleInCooldown": 300,
+            "ScaleOutCooldown": 60,
+        },
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "StepScaling",
+        "StepScalingPolicyConfiguration": {
+            "AdjustmentType": "ChangeInCapacity",
+            "StepAdjustments": [
+                {"MetricIntervalLowerBound": 0, "MetricIntervalUpperBound": 0.5, "ScalingAdjustment": 1},
+                {"MetricIntervalLowerBound": 0.5, "ScalingAdjustment": 3},
+            ],
+        },
+    })
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "MetricName": "TargetResponseTime",
+        "ExtendedStatistic": "p95",
+        "Threshold": 0.5,
+    })
+
+
+def test_primary_service_scheduled_scaling(synth_templates):
+    template, _ = synth_templates(primary_autoscaling={
+        "scale_in_cooldown_seconds": 600,
+        "schedules": [{"name": "CampaignLaunch", "schedule": "cron(0 8 * * ? *)", "min_capacity": 6, "max_capacity": 20}],
+    })
+
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "MinCapacity": 2,
+        "MaxCapacity": 10,
+        "ScheduledActions": [{
+            "ScheduledActionName": "CampaignLaunch",
+            "Schedule": "cron(0 8 * * ? *)",
+            "ScalableTargetAction": {"MinCapacity": 6, "MaxCapacity": 20},
+        }],
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": {"ScaleInCooldown": 600, "ScaleOutCooldown": 60},
+    })
+
+
+def test_ecr_image_mirror_adds_vpc_endpoints(synth_templates):
+    template, _ = synth_templates(ecr_image_mirror=True)
+
+    for service in ["ecr.api", "ecr.dkr", "logs"]:
+        template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+            "ServiceName": f"com.amazonaws.us-west-2.{service}",
+            "VpcEndpointType": "Interface",
+        })
+    template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+        "ServiceName": {"Fn::Join": ["", ["com.amazonaws.", {"Ref": "AWS::Region"}, ".s3"]]},
+        "VpcEndpointType": "Gateway",
+    })
+    # both gtm task definitions run the ECR copy
+    for container_definitions in template.find_resources("AWS::ECS::TaskDefinition").values():
+        image = container_definitions["Properties"]["ContainerDefinitions"][0]["Image"]
+        assert "gcr.io" not in str(image)
+
+
+EDGE = {"origin_domain_name": "origin-analytics.root.domain",
+        "certificate_arn": "arn:aws:acm:us-east-1:111111111111:certificate/edge"}
+
+
+def test_cloudfront_caches_scripts_and_forwards_collection(synth_templates):
+    template, _ = synth_templates(cloudfront=EDGE)
+
+    distribution = template.find_resources("AWS::CloudFront::Distribution")
+    (config,) = [resource["Properties"]["DistributionConfig"] for resource in distribution.values()]
+    assert config["Aliases"] == ["analytics.root.domain"]
+    assert config["ViewerCertificate"]["AcmCertificateArn"] == EDGE["certificate_arn"]
+    assert config["Origins"][0]["OriginCustomHeaders"][0]["HeaderName"] == "X-Origin-Verify"
+    # collection hits are not cached
+    assert config["DefaultCacheBehavior"]["CachePolicyId"] == "4135ea2d-6df8-44a3-9df3-4b5a84be39ad"
+    assert "POST" in config["DefaultCacheBehavior"]["AllowedMethods"]
+    assert [behavior["PathPattern"] for behavior in config["CacheBehaviors"]] == ["/gtag/js*", "/gtm.js*"]
+    template.has_resource_properties("AWS::CloudFront::CachePolicy", {
+        "CachePolicyConfig": Match.object_like({
+            "DefaultTTL": 900,
+            "ParametersInCacheKeyAndForwardedToOrigin": Match.object_like({
+                "QueryStringsConfig": {"QueryStringBehavior": "all"},
+                "HeadersConfig": {"HeaderBehavior": "whitelist", "Headers": ["X-Gtm-Server-Preview"]},
+                "CookiesConfig": {"CookieBehavior": "none"},
+            }),
+        }),
+    })
+
+    # the primary host only reaches the primary service with the origin verify header
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::ListenerRule", {
+        "Priority": 1,
+        "Conditions": Match.array_with([Match.object_like({
+            "Field": "http-header",
+            "HttpHeaderConfig": Match.object_like({"HttpHeaderName": "X-Origin-Verify"}),
+        })]),
+    })
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::ListenerRule", {
+        "Priority": 2,
+        "Actions": [Match.object_like({"Type": "fixed-response", "FixedResponseConfig": Match.object_like({"StatusCode": "403"})})],
+    })
+
+
+def test_cloudfront_is_optional_and_needs_a_us_east_1_certificate(synth_templates):
+    template, _ = synth_templates()
+    template.resource_count_is("AWS::CloudFront::Distribution", 0)
+
+    with pytest.raises(ValueError, match="us-east-1"):
+        synth_templates(cloudfront={"origin_domain_name": "origin-analytics.root.domain"})
@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+import json
+from collections import Counter
+
+from analytics.streaming_aggregator import OVERFLOW_KEY, StreamingAggregator, aggregate, read_events, read_stream
+from benchmarks.events import generate_events
+from benchmarks.kinesis_stub import InMemoryKinesis
+
+
+def event(time_ms, page="/a", session="1", name="page_view"):
+    return {"page_location": page, "ga_session_id": session, "event_name": name, "time": time_ms}
+
+
+def counts(rows, row_type="final"):
+    return {(row["window_start"], row["page_location"], row["event_name"]): row["event_count"]
+            for row in rows if row["type"] == row_type}
+
+
+def test_tumbling_windows_close_on_watermark():
+    aggregator = StreamingAggregator(1000, time_field="time")
+
+    assert aggregator.process(event(100)) == []
+    assert aggregator.process(event(900, name="scroll")) == []
+    closed = aggregator.process(event(1500))
+
+    assert counts(closed) == {(0, "/a", "page_view"): 1, (0, "/a", "scroll"): 1}
+    # only the open window is kept
+    assert list(aggregator.windows) == [1000]
+    assert counts(aggregator.flush()) == {(1000, "/a", "page_view"): 1}
+
+
+def test_sliding_windows_and_late_events():
+    aggregator = StreamingAggregator(1000, slide_ms=500, allowed_lateness_ms=200, time_field="time")
+    events = [event(600), event(1100), event(400), event(2000), event(1000), event(100)]
+
+    rows = list(aggregate(events, aggregator))
+
+    # [-500, 500) was closed when 400 arrived, the watermark reached 1800 before 1000 and 100 arrived
+    # so only the window [1000, 2000) still took 1000
+    assert counts(rows) == {
+        (0, "/a", "page_view"): 2, (500, "/a", "page_view"): 2, (1000, "/a", "page_view"): 2,
+        (1500, "/a", "page_view"): 1, (2000, "/a", "page_view"): 1,
+    }
+    assert aggregator.stats == {"events": 6, "late": 1, "invalid": 0, "overflow": 0}
+
+
+def test_incremental_updates_and_bounded_keys():
+    aggregator = StreamingAggregator(1000, time_field="time", max_keys_per_window=2)
+    events = [event(1, page="/a"), event(2, page="/b"), event(3, page="/c"), event(4, page="/a"), {"no": "time"}]
+
+    rows = list(aggregate(events, aggregator, update_every=2))
+
+    updates = [counts([row], "update") for row in rows if row["type"] == "update"]
+    assert updates == [{(0, "/a", "page_view"): 1}, {(0, "/b", "page_view"): 1},
+                       {(0, "/a", "page_view"): 2}, {(0, OVERFLOW_KEY, OVERFLOW_KEY): 1}]
+    assert counts(rows) == {(0, "/a", "page_view"): 2, (0, "/b", "page_view"): 1, (0, OVERFLOW_KEY, OVERFLOW_KEY): 1}
+    assert aggregator.stats["invalid"] == 1
+
+
+def test_matches_unwindowed_counts_from_stream_stand_in():
+    kinesis = InMemoryKinesis(4, keep_records=True)
+    events = list(generate_events(300, sessions=10, events_per_second=50))
+    for generated in events:
+        kinesis.put_record(generated["ga_session_id"], json.dumps(generated).encode("utf-8"))
+
+    # a window holding all events gives the counts of the notebook query
+    aggregator = StreamingAggregator(3600 * 1000, allowed_lateness_ms=60 * 1000)
+    rows = list(aggregate(read_stream(kinesis), aggregator))
+
+    expected = Counter((e["page_location"], e["ga_session_id"], e["event_name"]) for e in events)
+    assert {(r["page_location"], r["ga_session_id"], r["event_name"]): r["event_count"] for r in rows} == expected
+    assert list(read_events(["", "[1]", "{bad"])) == [None, None]
@@ -0,0 +1,37 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# Licensed under the Apache License Version 2.0 (the "License"). You may not use this file except
+# in compliance with the License. A copy of the License is located at http://www.apache.org/licenses/
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, express or implied. See the License for the
+# specific language governing permissions and limitations under the License.
+from benchmarks.synth_benchmark import check_thresholds, run_benchmark, synth_context
+
+
+def test_synth_context_selects_stacks_and_nag():
+    context = synth_context(["ServerSideTaggerStack"], nag=False, context={"data_capture_api_method": "api_gateway"})
+
+    assert context["stacks"] == "ServerSideTaggerStack"
+    assert context["nag"] is False
+    assert context["aws:cdk:bundling-stacks"] == []
+    assert context["data_capture_api_method"] == "api_gateway"
+    assert "@aws-cdk/core:target-partitions" in context
+
+
+def test_selective_synth_without_nag(record_property):
+    report = run_benchmark(stacks=["ServerSideTaggerStack"], nag=False)
+    record_property("synth_seconds", report["seconds"])
+    record_property("synth_peak_rss_mb", report["peak_rss_mb"])
+
+    assert report["stacks"] == ["ServerSideTaggerStack"]
+    # generous bounds, they catch a synth that regresses by multiples, not by noise
+    assert check_thresholds(report, max_seconds=120, max_rss_mb=2048) == []
+
+
+def test_check_thresholds():
+    report = {"seconds": 12.5, "peak_rss_mb": 300.0}
+
+    assert check_thresholds(report, max_seconds=20, max_rss_mb=512) == []
+    assert check_thresholds(report, max_seconds=10, max_rss_mb=256) == [
+        "synth time 12.5 s is above 10 s",
+        "peak rss 300.0 MB is above 256 MB",
+    ]